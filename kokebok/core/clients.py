@@ -0,0 +1,149 @@
+"""
+Shared clients for external services.
+
+Constructing a client per call pays for new connections (TLS handshakes, auth,
+...) every time. Instead, define a getter decorated with `shared_client`:
+
+    @shared_client
+    def cohere_client() -> cohere.Client:
+        return cohere.Client()
+
+The client is created on first use and then shared by every thread in the
+process, so it must be thread-safe (HTTP and gRPC clients generally are).
+Connections can't be shared between processes, so clients are recreated in
+forked children, e.g. gunicorn workers forked after preloading the app.
+
+Async clients hold connections bound to the event loop they were created in, so
+getters decorated with `shared_async_client` create one client per event loop.
+Clients that must be closed are given a coroutine function to close them with:
+
+    @shared_async_client(close=aiohttp.ClientSession.close)
+    def session() -> aiohttp.ClientSession:
+        return aiohttp.ClientSession()
+
+They are closed when their event loop shuts down. Under ASGI, the loop lives as
+long as the worker, but under WSGI, async views get a new loop for every request
+(see asgiref's async_to_sync), so their clients are closed after every request.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from typing import Awaitable, Callable, Generic, TypeVar, overload
+from weakref import WeakKeyDictionary, WeakSet
+
+T = TypeVar("T")
+
+_getters: WeakSet["_SharedClient | _SharedAsyncClient"] = WeakSet()
+
+
+class _SharedClient(Generic[T]):
+    def __init__(self, factory: Callable[[], T]) -> None:
+        functools.update_wrapper(self, factory)
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._client: T | None = None
+        _getters.add(self)
+
+    def __call__(self) -> T:
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def reset(self) -> None:
+        """Drops the client, so the next call creates a new one"""
+        self._lock = threading.Lock()
+        self._client = None
+
+
+class _SharedAsyncClient(Generic[T]):
+    def __init__(
+        self,
+        factory: Callable[[], T],
+        close: Callable[[T], Awaitable[object]] | None = None,
+    ) -> None:
+        functools.update_wrapper(self, factory)
+        self._factory = factory
+        self._close = close
+        self._lock = threading.Lock()
+        # Clients are dropped along with their event loop
+        self._clients: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[T, asyncio.Task | None]
+        ] = WeakKeyDictionary()
+        _getters.add(self)
+
+    def __call__(self) -> T:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                client = self._factory()
+                closer = None
+                if self._close is not None:
+                    # Kept with the client, as the loop only holds weak references
+                    # to its tasks
+                    closer = loop.create_task(self._close_at_shutdown(loop, client))
+                entry = self._clients[loop] = (client, closer)
+        return entry[0]
+
+    async def _close_at_shutdown(
+        self, loop: asyncio.AbstractEventLoop, client: T
+    ) -> None:
+        assert self._close is not None
+        try:
+            # Waits until cancelled, which asyncio.run does to the tasks still
+            # pending when its coroutine returns, before closing the loop
+            await loop.create_future()
+        finally:
+            with self._lock:
+                # The task refers to the loop, so the entry wouldn't be dropped
+                self._clients.pop(loop, None)
+            await self._close(client)
+
+    def reset(self) -> None:
+        """Drops all clients, so the next call creates a new one"""
+        self._lock = threading.Lock()
+        self._clients = WeakKeyDictionary()
+
+
+def shared_client(factory: Callable[[], T]) -> _SharedClient[T]:
+    """Makes the factory return a single client, shared by the process"""
+    return _SharedClient(factory)
+
+
+@overload
+def shared_async_client(factory: Callable[[], T]) -> _SharedAsyncClient[T]:
+    ...
+
+
+@overload
+def shared_async_client(
+    *, close: Callable[[T], Awaitable[object]]
+) -> Callable[[Callable[[], T]], _SharedAsyncClient[T]]:
+    ...
+
+
+def shared_async_client(factory=None, *, close=None):
+    """
+    Makes the factory return a single client per event loop. The getter must be
+    called from a coroutine. If given, `close` is awaited with the client when
+    the event loop shuts down.
+    """
+    if factory is None:
+        return functools.partial(_SharedAsyncClient, close=close)
+    return _SharedAsyncClient(factory, close)
+
+
+def _reset_clients() -> None:
+    # Also replaces the locks, which may have been held by another thread when
+    # the process forked
+    for getter in list(_getters):
+        getter.reset()
+
+
+os.register_at_fork(after_in_child=_reset_clients)
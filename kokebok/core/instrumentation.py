@@ -0,0 +1,194 @@
+"""
+Lightweight per-request instrumentation.
+
+Counts and times the ORM queries made while handling a request, along with the
+time spent waiting on external services (embedding providers, OCR, scraping, ...).
+The results are emitted as a log line per request, and as a Server-Timing header
+when SERVER_TIMING_ENABLED is set.
+
+External calls are timed by wrapping them in `timed`:
+
+    @timed("cohere")
+    def embed(...): ...
+
+    with timed("http"):
+        requests.get(...)
+
+Service call latencies are also recorded as metrics (see metrics.py), whether or
+not the call is made as part of an instrumented request.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse
+
+from core.metrics import SERVICE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    __slots__ = ("db_queries", "db_time", "service_calls", "service_times")
+
+    def __init__(self) -> None:
+        self.db_queries = 0
+        self.db_time = 0.0  # seconds
+        self.service_calls: dict[str, int] = defaultdict(int)
+        self.service_times: dict[str, float] = defaultdict(float)  # seconds
+
+
+_current_timings: ContextVar[RequestTimings | None] = ContextVar(
+    "current_timings", default=None
+)
+
+
+@contextmanager
+def timed(service: str):
+    """Records the time spent in the block as time spent waiting on the service"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        SERVICE_LATENCY.labels(service).observe(elapsed)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.service_calls[service] += 1
+            timings.service_times[service] += elapsed
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_time += time.perf_counter() - start
+
+
+def _install_query_recorder(connection):
+    # The wrapper list lives on the connection wrapper object, which is reused
+    # when reconnecting, so make sure we only install the recorder once
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def query_recorder_installer(sender, connection, **kwargs):
+    if settings.INSTRUMENTATION_ENABLED:
+        _install_query_recorder(connection)
+
+
+def _server_timing(timings: RequestTimings, total: float) -> str:
+    metrics = [
+        f'db;dur={timings.db_time * 1000:.1f};desc="{timings.db_queries} queries"'
+    ]
+    metrics += [
+        f"{service};dur={seconds * 1000:.1f}"
+        for service, seconds in timings.service_times.items()
+    ]
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+class InstrumentationMiddleware:
+    """
+    Logs a line per request with the number of queries made and time spent on
+    the database and on external services. When SERVER_TIMING_ENABLED is set,
+    the timings are also sent in a Server-Timing header. They reveal details of
+    the server to any client, so the header is only sent in debug by default.
+
+    Enabled through the INSTRUMENTATION_ENABLED setting. Should be placed first
+    in the middleware list, so that the timings cover all other middleware.
+    Supports both sync and async requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+
+        self._finish(request, response, timings, start)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        timings, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+
+        self._finish(request, response, timings, start)
+        return response
+
+    def _start(self) -> tuple[RequestTimings, Token, float]:
+        # Connections opened before instrumentation was set up miss the signal
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection)
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        return timings, token, time.perf_counter()
+
+    def _finish(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        timings: RequestTimings,
+        start: float,
+    ) -> None:
+        total = time.perf_counter() - start
+        if settings.SERVER_TIMING_ENABLED:
+            response["Server-Timing"] = _server_timing(timings, total)
+        logger.info(
+            "%s %s %s %.1fms (%d queries)",
+            request.method,
+            request.path,
+            response.status_code,
+            total * 1000,
+            timings.db_queries,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(total * 1000, 1),
+                "db_queries": timings.db_queries,
+                "db_ms": round(timings.db_time * 1000, 1),
+                "services": {
+                    service: {
+                        "calls": timings.service_calls[service],
+                        "ms": round(seconds * 1000, 1),
+                    }
+                    for service, seconds in timings.service_times.items()
+                },
+            },
+        )
@@ -0,0 +1,57 @@
+"""
+Logging helpers, used by the LOGGING setting.
+
+Modules log through their own logger (logging.getLogger(__name__)) and pass any
+structured data through `extra`, e.g.:
+
+    logger.info("Parsed image", extra={"model": model, "total_cost": cost})
+
+The JSON formatter turns those extras into fields of the emitted JSON object.
+"""
+
+import json
+import logging
+import random
+from datetime import datetime, timezone
+
+# Attributes set on every LogRecord. Anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__.keys()
+) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects, including any extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data |= {
+            key: value
+            for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only the given fraction of records below the WARNING level.
+    Useful for keeping high-volume loggers (e.g., per-request logging) cheap.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
@@ -0,0 +1,144 @@
+"""
+Prometheus metrics.
+
+Metrics are defined here and recorded throughout the code base, then exposed in
+Prometheus' text format by the metrics endpoint (see metrics_api.py).
+
+When running multiple worker processes (gunicorn), set the
+PROMETHEUS_MULTIPROC_DIR environment variable to a directory shared by the
+workers. Each process then writes its metrics to files in that directory, which
+are aggregated when the metrics are exposed. See gunicorn.conf.py for the hooks
+that keep the directory tidy.
+"""
+
+import os
+import time
+from typing import Iterator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+
+REQUEST_LATENCY = Histogram(
+    "kokebok_request_duration_seconds",
+    "Time spent handling requests, by API route",
+    ["route", "method", "status"],
+)
+SERVICE_LATENCY = Histogram(
+    "kokebok_service_call_duration_seconds",
+    "Time spent waiting on external services (embedding, OCR, scraping, ...)",
+    ["service"],
+)
+CACHE_REQUESTS = Counter(
+    "kokebok_cache_requests_total",
+    "Cache lookups, by cache and whether they were hits or misses",
+    ["cache", "result"],
+)
+SCRAPES = Counter(
+    "kokebok_scrapes_total",
+    "Recipe scrapes by host and scraper source, and whether they succeeded",
+    ["host", "source", "result"],
+)
+OCR_COST = Counter(
+    "kokebok_ocr_cost_dollars_total",
+    "Estimated cost of image parsing (OCR/GPT) requests in dollars",
+    ["model"],
+)
+
+
+class DatabaseConnectionsCollector(Collector):
+    """
+    Reports the database's connections by state. Collected when the metrics are
+    exposed, so the numbers are always current.
+    """
+
+    def _gauge(self) -> GaugeMetricFamily:
+        return GaugeMetricFamily(
+            "kokebok_db_connections",
+            "Connections to the database, by state",
+            labels=["state"],
+        )
+
+    def describe(self) -> Iterator[GaugeMetricFamily]:
+        # Lets the collector be registered without querying the database
+        yield self._gauge()
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        gauge = self._gauge()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() GROUP BY 1"
+            )
+            for state, count in cursor.fetchall():
+                gauge.add_metric([state], count)
+        yield gauge
+
+
+_db_collector = DatabaseConnectionsCollector()
+REGISTRY.register(_db_collector)
+
+
+def generate_metrics() -> bytes:
+    """Returns all metrics in Prometheus' text exposition format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregate the metrics written by every process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_db_collector)
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of each request, labelled by the name of the API route
+    that handled it. Enabled through the METRICS_ENABLED setting.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    def _observe(
+        self, request: HttpRequest, response: HttpResponse, duration: float
+    ) -> None:
+        # Use route names rather than paths to keep the number of labels bounded
+        match = getattr(request, "resolver_match", None)
+        route = (match and match.url_name) or "unmatched"
+        REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(
+            duration
+        )
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+from ninja import Router
+from ninja.security import HttpBearer, django_auth
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core.metrics import generate_metrics
+
+
+class MetricsTokenAuth(HttpBearer):
+    """Lets Prometheus authenticate using the token in the METRICS_TOKEN setting"""
+
+    def authenticate(self, request: HttpRequest, token: str) -> str | None:
+        if settings.METRICS_TOKEN and constant_time_compare(
+            token, settings.METRICS_TOKEN
+        ):
+            return token
+        return None
+
+
+router = Router(auth=[MetricsTokenAuth(), django_auth], tags=["metrics"])
+
+
+@router.get("", include_in_schema=False)
+def metrics(request: HttpRequest):
+    if not settings.METRICS_ENABLED:
+        raise Http404("Metrics are not enabled")
+    return HttpResponse(generate_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,27 @@
+from typing import Any, Optional
+
+from django.http import HttpRequest
+from ninja.security import SessionAuth
+
+
+class AsyncSessionAuth(SessionAuth):
+    """
+    Django session authentication for async operations.
+
+    Ninja's django_auth reads request.user, which loads the user from the database
+    and so can't be done from async code. Only use this for async operations, as
+    sync operations don't await the result.
+    """
+
+    is_async = True
+
+    async def __call__(self, request: HttpRequest) -> Optional[Any]:  # type: ignore[override]
+        self._get_key(request)  # Checks the CSRF token
+        user = await request.auser()
+        if user.is_authenticated:
+            return user
+
+        return None
+
+
+async_django_auth = AsyncSessionAuth()
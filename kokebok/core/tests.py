@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+from unittest.mock import Mock, patch
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from core.clients import _reset_clients, shared_async_client, shared_client
+from core.instrumentation import timed
+from core.log import JsonFormatter, SamplingFilter
+from core.models import User
+from core.security import async_django_auth
+from core.transactions import OnCommitBatch
+from recipes.models import Recipe
+from recipes.scraping import scrape
+
+
+async def mock_aembed_query(query: str, **kwargs):
+    with timed("cohere"):
+        return np.random.rand(1024)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, SERVER_TIMING_ENABLED=True)
+class InstrumentationTests(TestCase):
+    def test_server_timing_header(self):
+        Recipe.objects.create(title="r", id=123)
+
+        url = reverse("api-1.0.0:recipe_detail", args=[123])
+        with self.assertLogs("core.instrumentation", level="INFO") as logs:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+        self.assertIn("total;dur=", response["Server-Timing"])
+        self.assertEqual(logs.records[0].db_queries, 3)
+        self.assertEqual(logs.records[0].status, 200)
+
+    def test_service_timing(self):
+        with patch("recipes.api.aembed_query", mock_aembed_query):
+            url = reverse("api-1.0.0:search")
+            with self.assertLogs("core.instrumentation", level="INFO") as logs:
+                response = self.client.get(url, {"query": "q"})
+
+        self.assertIn("cohere;dur=", response["Server-Timing"])
+        self.assertEqual(logs.records[0].services["cohere"]["calls"], 1)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_server_timing_disabled(self):
+        # Requests are still logged, but the timings aren't sent to the client
+        with self.assertLogs("core.instrumentation", level="INFO") as logs:
+            response = self.client.get(reverse("api-1.0.0:ingredient_list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(logs.records[0].status, 200)
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse("api-1.0.0:ingredient_list"))
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN="secret")
+class MetricsTests(TestCase):
+    def test_metrics(self):
+        self.client.get(reverse("api-1.0.0:ingredient_list"))
+
+        response = self.client.get(
+            reverse("api-1.0.0:metrics"), headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn(
+            'kokebok_request_duration_seconds_count{method="GET",'
+            'route="ingredient_list",status="200"}',
+            content,
+        )
+        self.assertIn("kokebok_db_connections{", content)
+
+    def test_scrape_metrics(self):
+        labels = {"host": "other", "source": "wild", "result": "failure"}
+        before = REGISTRY.get_sample_value("kokebok_scrapes_total", labels) or 0
+        with patch("recipes.scraping.main._scrape", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                scrape("https://example.com/recipe")
+        after = REGISTRY.get_sample_value("kokebok_scrapes_total", labels)
+        self.assertEqual(after, before + 1)
+
+    def test_requires_auth(self):
+        url = reverse("api-1.0.0:metrics")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(url, headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(
+            reverse("api-1.0.0:metrics"), headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class LoggingTests(TestCase):
+    def _record(self, level=logging.INFO, **extra):
+        record = logging.LogRecord("recipes.api", level, "", 0, "%s!", ("hi",), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        record = self._record(model="gpt-4-turbo", total_cost=0.05)
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "hi!")
+        self.assertEqual(data["level"], "INFO")
+        self.assertEqual(data["logger"], "recipes.api")
+        self.assertEqual(data["model"], "gpt-4-turbo")
+        self.assertEqual(data["total_cost"], 0.05)
+        self.assertNotIn("args", data)
+
+    def test_sampling_filter(self):
+        sampler = SamplingFilter(rate=0)
+        self.assertFalse(sampler.filter(self._record()))
+        self.assertTrue(sampler.filter(self._record(level=logging.WARNING)))
+        self.assertTrue(SamplingFilter(rate=1).filter(self._record()))
+
+
+class AsyncSessionAuthTests(TestCase):
+    def test_authenticate(self):
+        user = User.objects.create_user(username="user", password="password")
+        request = RequestFactory().get("/")
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        self.assertEqual(async_to_sync(async_django_auth)(request), user)
+
+        async def anonymous_user():
+            return AnonymousUser()
+
+        request.auser = anonymous_user
+        self.assertIsNone(async_to_sync(async_django_auth)(request))
+
+
+class SharedClientTests(TestCase):
+    def test_shared_client(self):
+        factory = Mock(side_effect=lambda: object())
+        get_client = shared_client(factory)
+
+        client = get_client()
+        self.assertIs(get_client(), client)
+        self.assertEqual(factory.call_count, 1)
+
+        # Forked processes get their own clients
+        _reset_clients()
+        self.assertIsNot(get_client(), client)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_shared_async_client(self):
+        get_client = shared_async_client(lambda: object())
+
+        async def get_twice():
+            return get_client(), get_client()
+
+        first, second = asyncio.run(get_twice())
+        self.assertIs(first, second)
+        # New event loop, new client
+        self.assertIsNot(asyncio.run(get_twice())[0], first)
+
+    def test_shared_async_client_closed_with_loop(self):
+        closed = []
+
+        async def close(client):
+            closed.append(client)
+
+        @shared_async_client(close=close)
+        def get_client():
+            return object()
+
+        async def get_client_open():
+            client = get_client()
+            await asyncio.sleep(0)
+            self.assertNotIn(client, closed)
+            return client
+
+        # As under WSGI, where every async view runs in a new event loop
+        first = async_to_sync(get_client_open)()
+        self.assertEqual(closed, [first])
+        second = async_to_sync(get_client_open)()
+        self.assertIsNot(second, first)
+        self.assertEqual(closed, [first, second])
+
+
+class OnCommitBatchTests(TestCase):
+    def test_flushed_once_on_commit(self):
+        callback = Mock()
+        batch = OnCommitBatch(callback)
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.add({1: "a", 2: "b"})
+            batch.add({1: "c"})
+            callback.assert_not_called()
+        callback.assert_called_once_with({1: "c", 2: "b"})
+
+    def test_rollback_drops_items(self):
+        callback = Mock()
+        batch = OnCommitBatch(callback)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    batch.add({1: None})
+                    raise ValueError
+            except ValueError:
+                pass
+            batch.add({2: None})
+        callback.assert_called_once_with({2: None})
@@ -0,0 +1,71 @@
+"""
+Batching of work to be done once the current transaction commits.
+
+Signal handlers often report the same objects many times in one transaction,
+e.g. once per recipe ingredient saved for a recipe. An OnCommitBatch collects
+the reports, and hands them to its callback in one call once the transaction
+commits:
+
+    def refresh(recipe_ids: dict[int, None]): ...
+
+    _recipes = OnCommitBatch(refresh)
+    _recipes.add(dict.fromkeys([recipe.pk]))
+"""
+
+import threading
+from functools import partial
+from typing import Any, Callable, Hashable
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+class _Pending:
+    __slots__ = ("callbacks", "items")
+
+    def __init__(self, callbacks: list) -> None:
+        # The connection's list of commit callbacks when the batch was started
+        self.callbacks = callbacks
+        self.items: dict[Hashable, Any] = {}
+
+
+class OnCommitBatch:
+    """
+    Collects the items added during a transaction, and calls the callback with
+    all of them once it commits. Items are kept in a dict, so adding an item
+    again replaces its value. Outside transactions, the callback is called
+    right away.
+
+    Items added in a transaction that is rolled back are dropped with it. Items
+    added in a savepoint that is rolled back may still be handed over, so the
+    callback must tolerate objects that didn't change, or don't exist.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[dict[Any, Any]], None],
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> None:
+        self.callback = callback
+        self.using = using
+        # Connections are per thread, and so are their transactions
+        self._local = threading.local()
+
+    def add(self, items: dict[Any, Any]) -> None:
+        connection = connections[self.using]
+        pending: _Pending | None = getattr(self._local, "pending", None)
+        # Django replaces its list of commit callbacks when a transaction ends,
+        # or a savepoint is rolled back. A batch started with another list
+        # belongs to a transaction that is over, and is either flushed already
+        # or was rolled back
+        if pending is None or pending.callbacks is not connection.run_on_commit:
+            pending = self._local.pending = _Pending(connection.run_on_commit)
+        pending.items.update(items)
+        # Every addition registers a callback, so that the batch is flushed even
+        # when only some callbacks are run (e.g. captured by a test). Only the
+        # first to run finds anything to flush
+        transaction.on_commit(partial(self._flush, pending), using=self.using)
+
+    def _flush(self, pending: _Pending) -> None:
+        items, pending.items = pending.items, {}
+        if items:
+            self.callback(items)
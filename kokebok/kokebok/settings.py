@@ -14,6 +14,17 @@ env = environ.Env(
     ALLOWED_HOSTS=(list, []),
     TRUSTED_ORIGINS=(list, []),
     OCR_ENABLED=(bool, True),
+    INSTRUMENTATION_ENABLED=(bool, False),
+    METRICS_ENABLED=(bool, False),
+    METRICS_TOKEN=(str, ""),
+    LOG_LEVEL=(str, "INFO"),
+    REQUEST_LOG_SAMPLE_RATE=(float, 1.0),
+    EMBEDDING_BACKEND=(str, "cohere"),
+    EMBEDDING_MODEL=(str, ""),
+    EMBEDDING_DIMENSIONS=(int, None),
+    EMBEDDING_PRECISION=(str, "full"),
+    SEARCH_CANDIDATES=(int, 100),
+    INGREDIENT_MATCHER_MAX_AGE=(int, 60 * 10),
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -75,6 +86,52 @@ if STRICT_SSL:
 X_FRAME_OPTIONS = "DENY"  # Disallow iframes of the site
 
 
+# Instrumentation
+# Adds per-request log lines with query counts and time spent on the database
+# and external services. Cheap enough for production.
+INSTRUMENTATION_ENABLED = env("INSTRUMENTATION_ENABLED")
+# Also sends the timings to the client as a Server-Timing header. This exposes
+# query counts and timings to anyone, so it's only on in debug by default
+SERVER_TIMING_ENABLED = env.bool("SERVER_TIMING_ENABLED", default=DEBUG)
+# Prometheus metrics, exposed at /api/metrics/. Prometheus can authenticate by
+# sending METRICS_TOKEN as a bearer token. See core/metrics.py for multi-process setup
+METRICS_ENABLED = env("METRICS_ENABLED")
+METRICS_TOKEN = env("METRICS_TOKEN")
+
+
+# Logging
+# Modules log through their own loggers (logging.getLogger(__name__)). Logs are
+# written to stdout as JSON in production, with any `extra` data as fields.
+# Per-request log lines can be sampled (0-1) to cut down on volume; warnings and
+# errors are always kept.
+LOG_FORMAT: Literal["json", "plain"] = env.str(
+    "LOG_FORMAT", default="plain" if DEBUG else "json"
+)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "core.log.JsonFormatter"},
+        "plain": {"format": "{asctime} {levelname} {name}: {message}", "style": "{"},
+    },
+    "filters": {
+        "request_sampling": {
+            "()": "core.log.SamplingFilter",
+            "rate": env("REQUEST_LOG_SAMPLE_RATE"),
+        },
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": LOG_FORMAT},
+    },
+    "root": {"handlers": ["console"], "level": env("LOG_LEVEL")},
+    "loggers": {
+        # Replace Django's own console handler, which would duplicate messages
+        "django": {"handlers": [], "level": "INFO"},
+        "core.instrumentation": {"filters": ["request_sampling"]},
+    },
+}
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -85,6 +142,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "whitenoise.runserver_nostatic",  # Whitenoise
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "ninja",  # needed to self-host staticfiles for API docs
     "corsheaders",
     "storages",
@@ -94,6 +152,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.instrumentation.InstrumentationMiddleware",  # Keep first to time the rest
+    "core.metrics.MetricsMiddleware",
     "csp.middleware.CSPMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -154,6 +214,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# Each gunicorn worker has its own local memory cache, so use a shared cache in
+# production to make sure invalidations reach every worker.
+CACHES = {
+    "default": env.cache(
+        "CACHE_URL",
+        default="locmemcache://" if DEBUG else "dbcache://kokebok_cache",
+    ),
+}
+RECIPE_CACHE_TIMEOUT = env.int("RECIPE_CACHE_TIMEOUT", default=60 * 60 * 24)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -220,6 +292,30 @@ CSP_REPORT_ONLY = False
 CSP_REPORT_URI = False
 
 
+# Embeddings (for semantic search)
+# Backends: "cohere" (requires CO_API_KEY), "local" (requires sentence-transformers)
+# or "hashing" (for tests/offline use). Model and dimensions default to the
+# backend's own. These only apply to new embedding versions, see EmbeddingVersion
+EMBEDDING_BACKEND: Literal["cohere", "local", "hashing"] = env("EMBEDDING_BACKEND")
+EMBEDDING_MODEL = env("EMBEDDING_MODEL")
+EMBEDDING_DIMENSIONS: int | None = env("EMBEDDING_DIMENSIONS")
+# Precision the vectors of new versions are indexed at: "full", "half" or "binary".
+# Lower precisions give smaller indexes, and searches re-rank their candidates
+EMBEDDING_PRECISION: Literal["full", "half", "binary"] = env("EMBEDDING_PRECISION")
+# Number of nearest recipes fetched from the vector index per search, before being
+# re-ranked by their chunks. HNSW index scans return at most hnsw.ef_search rows,
+# so it is raised to match. Iterative scans let filtered searches scan further,
+# until enough rows match the filters, instead of returning fewer results
+SEARCH_CANDIDATES: int = env("SEARCH_CANDIDATES")
+DATABASES["default"].setdefault("OPTIONS", {})[
+    "options"
+] = f"-c hnsw.ef_search={SEARCH_CANDIDATES} -c hnsw.iterative_scan=strict_order"
+
+# Seconds before the in-memory ingredient matcher is rebuilt, picking up the
+# ingredient changes made by other processes (see recipes.ingredient_matching)
+INGREDIENT_MATCHER_MAX_AGE: int = env("INGREDIENT_MATCHER_MAX_AGE")
+
+
 USE_OLD_IMG_PARSING = False  # Enable pre-"gpt-4-vision" image parsing pipeline
 # OCR (likely Google Cloud) provider
 OCR_ENABLED = env("OCR_ENABLED")
@@ -8,6 +8,7 @@ from django.urls import path
 from ninja import NinjaAPI
 
 from core.auth_api import router as auth_router
+from core.metrics_api import router as metrics_router
 from recipes.api import router as recipes_router
 
 
@@ -30,6 +31,7 @@ api = NinjaAPI(
 )
 api.add_router("recipes/", recipes_router)
 api.add_router("auth/", auth_router)
+api.add_router("metrics/", metrics_router)
 
 
 urlpatterns = [
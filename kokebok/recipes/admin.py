@@ -1,15 +1,42 @@
 from django.contrib import admin
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.models import (
+    Ingredient,
+    IngredientNutrition,
+    MealPlan,
+    MealPlanEntry,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    Tag,
+)
+
+
+class RecipeTagInline(admin.TabularInline):
+    model = RecipeTag
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ["title", "created_at"]
+    list_filter = ["tags"]
+    inlines = [RecipeTagInline]
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ["name", "slug", "kind"]
+    list_filter = ["kind"]
+    prepopulated_fields = {"slug": ["name"]}
+
+
+class IngredientNutritionInline(admin.StackedInline):
+    model = IngredientNutrition
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
+    inlines = [IngredientNutritionInline]
     list_display = [
         "name_no",
         "name_en",
@@ -38,3 +65,14 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     @admin.display(ordering="base_ingredient__name_no")
     def ingredient_names(self, obj):
         return repr(obj.base_ingredient)
+
+
+class MealPlanEntryInline(admin.TabularInline):
+    model = MealPlanEntry
+    raw_id_fields = ["recipe"]
+
+
+@admin.register(MealPlan)
+class MealPlanAdmin(admin.ModelAdmin):
+    list_display = ["name", "created_at"]
+    inlines = [MealPlanEntryInline]
@@ -1,38 +1,82 @@
 import io
+import json
 from itertools import chain, groupby
 
 import ninja
-import requests
+from asgiref.sync import sync_to_async
 from django.core.files.images import ImageFile
 from django.db import transaction
 from django.forms import ValidationError
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from ninja import File, Router
+from ninja import File, Query, Router
 from ninja.files import UploadedFile
+from ninja.responses import NinjaJSONEncoder
 from ninja.security import django_auth
-from pgvector.django import CosineDistance
 from PIL import Image, UnidentifiedImageError
 
+from core.instrumentation import timed
+from core.security import async_django_auth
 from kokebok import settings
+from recipes import caching, meal_plans, units
 from recipes.api_schemas import (
+    ChangesSchema,
     FullRecipeCreationSchema,
     FullRecipeDetailSchema,
     FullRecipeListSchema,
     FullRecipeUpdateSchema,
     IngredientCreationSchema,
     IngredientDetailSchema,
+    IngredientMatchSchema,
     IngredientUpdateSchema,
+    MealPlanCreationSchema,
+    MealPlanDetailSchema,
+    MealPlanEntryCreationSchema,
+    RecipeFilterSchema,
+    RecipeNutritionSchema,
+    SearchFilterSchema,
+    SearchResultSchema,
+    ShoppingListRequestSchema,
+    ShoppingListSchema,
+    SimilarRecipeSchema,
+    TagFacetSchema,
 )
-from recipes.embedding import embed_query
-from recipes.image_parsing import parse_img
-from recipes.models import Ingredient, Recipe, RecipeEmbedding, RecipeIngredient
-from recipes.scraping import scrape
+from recipes.embedding import aembed_query
+from recipes.image_parsing import aparse_img
+from recipes.ingredient_matching import get_matcher
+from recipes.models import (
+    EmbeddingVersion,
+    Ingredient,
+    MealPlan,
+    MealPlanEntry,
+    Recipe,
+    RecipeIngredient,
+    RecipeNutrition,
+    SimilarRecipe,
+)
+from recipes.scraping import ascrape, scrape
 from recipes.scraping.base import IngredientGroupDict, ScrapedRecipe
-from recipes.services import create_recipe, get_recipe_embeddings, update_recipe
+from recipes.scraping.utils import http_session
+from recipes.services import (
+    aggregate_shopping_list,
+    create_recipe,
+    get_changes_since,
+    get_recipe_embeddings,
+    localised_name,
+    refresh_similar_recipes,
+    resolve_ingredients,
+    scale_recipe_detail,
+    search_ingredients,
+    search_recipes,
+    tag_facets,
+    update_recipe,
+)
 
 router = Router(
     auth=ninja.constants.NOT_SET if settings.DEBUG else django_auth, tags=["recipes"]
 )
+# django_auth can't be used by async operations
+async_auth = ninja.constants.NOT_SET if settings.DEBUG else async_django_auth
 
 
 @router.post("recipes")
@@ -47,15 +91,18 @@ def recipe_add(
 
 
 @router.get("recipes", response=list[FullRecipeListSchema])
-def recipe_list(request):
+def recipe_list(request, filters: RecipeFilterSchema = Query(...)):
     """
-    Returns all recipes along with all the recipe ingredients that each contains.
+    Returns the recipes matching the filters along with all the recipe
+    ingredients that each contains.
 
     Because we join from RecipeIngredient, recipes without any recipe ingredients
     defined will not be returned. (Bug or feature? You decide!)
     """
     # Iterate over data manually to prevent django from executing tons of subqueries
     rec_ingrs = RecipeIngredient.objects.select_related("recipe").order_by("recipe")
+    if filters.max_time is not None or filters.tag:
+        rec_ingrs = rec_ingrs.filter(recipe__in=filters.filter(Recipe.objects.all()))
     recipes = []
     for _, group in groupby(rec_ingrs, key=lambda ri: ri.recipe.pk):
         recipe_ingredients = list(group)
@@ -71,11 +118,46 @@ def recipe_list(request):
     return recipes
 
 
-@router.get("recipe/{recipe_id}", response=FullRecipeDetailSchema)
-def recipe_detail(request, recipe_id: int):
-    qset = Recipe.objects.prefetch_related("recipe_ingredients")
-    recipe = get_object_or_404(qset, id=recipe_id)
-    return recipe
+@router.get("recipes/facets", response=list[TagFacetSchema])
+def recipe_facets(request, filters: RecipeFilterSchema = Query(...)):
+    """
+    Returns every tag with the number of recipes matching the filters that have
+    it, i.e. the number of recipes left if the tag was filtered by as well
+    """
+    if filters.max_time is None and not filters.tag:
+        return tag_facets()
+    return tag_facets(filters.filter(Recipe.objects.all()))
+
+
+@router.get("recipe/{recipe_id}", response={200: FullRecipeDetailSchema, 400: str})
+def recipe_detail(
+    request,
+    recipe_id: int,
+    servings: int | None = Query(None, gt=0),
+    system: units.System | None = None,
+):
+    """
+    Scales the ingredients to the number of servings, and converts them to the
+    system's units, if given
+    """
+    # Serve the response straight from the cache if possible,
+    # skipping both the database queries and schema validation
+    data = caching.get_recipe_detail(recipe_id)
+    if data is None:
+        qset = Recipe.objects.prefetch_related("recipe_ingredients", "tags")
+        recipe = get_object_or_404(qset, id=recipe_id)
+        schema = FullRecipeDetailSchema.from_orm(recipe)
+        data = json.dumps(schema.dict(), cls=NinjaJSONEncoder).encode()
+        caching.set_recipe_detail(recipe_id, data)
+
+    if servings is not None or system is not None:
+        try:
+            scaled = scale_recipe_detail(json.loads(data), servings, system)
+        except ValueError as e:
+            return 400, str(e)
+        data = json.dumps(scaled, cls=NinjaJSONEncoder).encode()
+
+    return HttpResponse(data, content_type="application/json; charset=utf-8")
 
 
 # POST because Django does not allow files in PUT requests (nor PATCH requests)
@@ -105,11 +187,161 @@ def recipe_delete(request, recipe_id: int):
     return recipe
 
 
+@router.get("recipe/{recipe_id}/similar", response=list[SimilarRecipeSchema])
+def recipe_similar(request, recipe_id: int):
+    """The recipes most similar to the recipe, most similar first"""
+    return (
+        SimilarRecipe.objects.filter(recipe_id=recipe_id)
+        .select_related("similar")
+        .order_by("-similarity")
+    )
+
+
+@router.get("recipe/{recipe_id}/nutrition", response=RecipeNutritionSchema)
+def recipe_nutrition(request, recipe_id: int):
+    """The recipe's nutrition, computed when it or its ingredients last changed"""
+    return get_object_or_404(RecipeNutrition, recipe_id=recipe_id)
+
+
+@router.post("shopping-list", response={200: ShoppingListSchema, 400: str})
+def shopping_list(request, data: ShoppingListRequestSchema):
+    """
+    The ingredients of the recipes, scaled to the servings and summed per
+    ingredient and unit. Ubiquitous ingredients (salt, water, ...) are left out,
+    and optional ones listed separately. Amounts are in g, ml, etc. unless a
+    system is given.
+    """
+    if data.language not in Recipe.Languages.codes():
+        return 400, f"Unknown language: {data.language}"
+
+    rows = aggregate_shopping_list(
+        ((recipe.id, recipe.servings) for recipe in data.recipes), data.language
+    )
+    if data.system is not None:
+        amounts, new_units = units.scale(
+            [row["amount"] for row in rows],
+            [row["unit"] for row in rows],
+            1,
+            data.system,
+        )
+        for row, amount, unit in zip(rows, amounts, new_units):
+            row["amount"], row["unit"] = amount, unit
+
+    return 200, {
+        "items": [row for row in rows if not row["is_optional"]],
+        "optional": [row for row in rows if row["is_optional"]],
+    }
+
+
+def _meal_plan_detail(plan: MealPlan, lang: str) -> dict:
+    ingredients = plan.ingredients.annotate(
+        name=localised_name(lang, "ingredient__")
+    ).order_by("name", "unit")
+    return {
+        "id": plan.id,
+        "name": plan.name,
+        "entries": plan.entries.select_related("recipe").order_by("date", "id"),
+        "items": [row for row in ingredients if not row.is_optional],
+        "optional": [row for row in ingredients if row.is_optional],
+    }
+
+
+@router.post("meal-plans", response={200: MealPlanDetailSchema, 400: str})
+def meal_plan_add(request, data: MealPlanCreationSchema, lang: str = "en"):
+    recipe_ids = {entry.recipe_id for entry in data.entries}
+    if Recipe.objects.filter(id__in=recipe_ids).count() != len(recipe_ids):
+        return 400, "Unknown recipe"
+
+    with transaction.atomic():
+        plan = MealPlan.objects.create(name=data.name)
+        MealPlanEntry.objects.bulk_create(
+            MealPlanEntry(plan=plan, **entry.dict()) for entry in data.entries
+        )
+        # bulk_create doesn't send the signals that would
+        meal_plans.plans_changed([plan.id])
+    return 200, _meal_plan_detail(plan, lang)
+
+
+@router.get("meal-plans/{plan_id}", response=MealPlanDetailSchema)
+def meal_plan_detail(request, plan_id: int, lang: str = "en"):
+    """
+    The plan's entries, and the summed ingredients of their recipes, as from
+    shopping-list. The sums are kept up to date as the plan and its recipes
+    change, so they're read rather than summed here
+    """
+    return _meal_plan_detail(get_object_or_404(MealPlan, id=plan_id), lang)
+
+
+@router.delete("meal-plans/{plan_id}", response={204: None})
+def meal_plan_delete(request, plan_id: int):
+    get_object_or_404(MealPlan, id=plan_id).delete()
+    return 204, None
+
+
+@router.post(
+    "meal-plans/{plan_id}/entries", response={200: MealPlanDetailSchema, 400: str}
+)
+def meal_plan_entry_add(
+    request, plan_id: int, entry: MealPlanEntryCreationSchema, lang: str = "en"
+):
+    plan = get_object_or_404(MealPlan, id=plan_id)
+    if not Recipe.objects.filter(id=entry.recipe_id).exists():
+        return 400, "Unknown recipe"
+    with transaction.atomic():
+        MealPlanEntry.objects.create(plan=plan, **entry.dict())
+    return 200, _meal_plan_detail(plan, lang)
+
+
+@router.delete("meal-plans/{plan_id}/entries/{entry_id}", response=MealPlanDetailSchema)
+def meal_plan_entry_delete(request, plan_id: int, entry_id: int, lang: str = "en"):
+    entry = get_object_or_404(MealPlanEntry, id=entry_id, plan_id=plan_id)
+    with transaction.atomic():
+        entry.delete()
+    return _meal_plan_detail(entry.plan, lang)
+
+
 @router.get("ingredients", response=list[IngredientDetailSchema])
 def ingredient_list(request):
     return Ingredient.objects.all()
 
 
+@router.get(
+    "ingredients/search", response={200: list[IngredientDetailSchema], 400: str}
+)
+def ingredient_search(
+    request, q: str, lang: str | None = None, limit: int = Query(10, gt=0, le=50)
+):
+    """
+    Ingredients with a name starting with, or containing a word similar to, the
+    query, for autocompletion. Searches the names in all languages unless lang
+    is given.
+    """
+    if lang and lang not in Recipe.Languages.codes():
+        return 400, f"Unknown language: {lang}"
+    return 200, search_ingredients(q, lang, limit)
+
+
+@router.get("ingredients/match", response=list[IngredientMatchSchema])
+def ingredient_match(request, q: str, limit: int = Query(5, gt=0, le=50)):
+    """
+    The ingredients best matching an ingredient name, e.g. from a recipe, in any
+    language, with their scores between 0 and 1. Unlike ingredients/search,
+    plurals and extra words are tolerated, so it suits matching whole names.
+    """
+    matches = get_matcher().match(q, limit)
+    ingredients = Ingredient.objects.in_bulk([match.ingredient_id for match in matches])
+    return [
+        {
+            "ingredient": ingredients[match.ingredient_id],
+            "matched_name": match.name,
+            "score": match.score,
+        }
+        for match in matches
+        # The matcher may not know about deletions by other processes yet
+        if match.ingredient_id in ingredients
+    ]
+
+
 @router.post("ingredients", response=IngredientDetailSchema)
 def ingredient_add(request, ingredient: IngredientCreationSchema):
     ingredient = Ingredient.objects.create(**ingredient.dict())
@@ -120,10 +352,11 @@ def ingredient_add(request, ingredient: IngredientCreationSchema):
 def ingredient_update(
     request, ingredient_id: int, ingredient_data: IngredientUpdateSchema
 ):
-    ingredient_qs = Ingredient.objects.filter(id=ingredient_id)
-    ingredient = get_object_or_404(ingredient_qs, id=ingredient_id)
-    ingredient_qs.update(**ingredient_data.dict())
-    ingredient.refresh_from_db()
+    ingredient = get_object_or_404(Ingredient, id=ingredient_id)
+    # Update through save() rather than queryset.update() so that signals are sent
+    for k, v in ingredient_data.dict().items():
+        setattr(ingredient, k, v)
+    ingredient.save()
     return ingredient
 
 
@@ -140,44 +373,50 @@ def ingredient_delete(request, ingredient_id: int):
 #
 
 
-@router.get("search", tags=["search"])
-def search(request, query: str):
-    query_embedding = embed_query(query)
+@router.get("changes", response=ChangesSchema, tags=["sync"])
+def recipe_changes(request, since: int = 0):
+    """
+    Returns everything that has changed since the token returned by the previous
+    call. Pass since=0 (or omit it) to get the entire catalogue.
+    """
+    return get_changes_since(since)
 
-    # Sanity checking
-    simlarities = (
-        RecipeEmbedding.objects.annotate(
-            distance=CosineDistance("embedding", query_embedding)
-        )
-        .prefetch_related("recipe")
-        .order_by("distance")
-        .values_list("recipe__title", "distance")
-        .all()
-    )
-    print(*[tuple(s) for s in simlarities], sep="\n")
-
-    # TODO: Get distinct recipe_id working with distance ordering
-    embeds = (
-        RecipeEmbedding.objects.order_by(CosineDistance("embedding", query_embedding))
-        .prefetch_related("recipe")
-        .values_list("recipe__title", flat=True)
-        .all()
-    )
 
-    recipe_ids = list({rid: 0 for rid in embeds}.keys())[:10]
+# The endpoints below mostly wait on external services, and are async so that
+# waiting doesn't tie up a worker thread when running under ASGI
+
 
-    return recipe_ids
+@router.get(
+    "search",
+    response={200: list[SearchResultSchema], 503: str},
+    tags=["search"],
+    auth=async_auth,
+)
+async def search(request, query: str, filters: SearchFilterSchema = Query(...)):
+    try:
+        version = await EmbeddingVersion.objects.aget(
+            state=EmbeddingVersion.States.ACTIVE
+        )
+    except EmbeddingVersion.DoesNotExist:
+        return 503, "No embedding version is active"
+    query_embedding = await aembed_query(query, backend=version.get_backend())
+    return await sync_to_async(search_recipes)(
+        query, query_embedding, version, filters.get_filter_expression()
+    )
 
 
 @router.get(
-    "scrape", response={200: ScrapedRecipe, 400: str, 403: str}, tags=["scrape"]
+    "scrape",
+    response={200: ScrapedRecipe, 400: str, 403: str},
+    tags=["scrape"],
+    auth=async_auth,
 )
-def scrape_recipe(request, url: str):
-    existing = Recipe.objects.filter(origin_url=url).exists()
+async def scrape_recipe(request, url: str):
+    existing = await Recipe.objects.filter(origin_url=url).aexists()
     if existing:
         return 403, "Recipe with given url already exists."
 
-    scraped_data: ScrapedRecipe = scrape(url)
+    scraped_data: ScrapedRecipe = await ascrape(url)
     try:
         scraped_data.clean()
     except ValidationError as e:
@@ -210,7 +449,8 @@ def scrape_recipe_bad(request, url: str):
     hero_image_link = scraped_dict.pop("hero_image_link")
     if hero_image_link:
         # TODO: try bypassing cloudflare by impersonating the user who made this request
-        image_data = requests.get(hero_image_link).content
+        with timed("http"):
+            image_data = http_session().get(hero_image_link).content
         try:
             Image.open(io.BytesIO(image_data))
             image_name = hero_image_link.split("/")[-1]  # hacky but it works for now
@@ -225,23 +465,26 @@ def scrape_recipe_bad(request, url: str):
         recipe.full_clean()
         recipe.save()
 
-        recipe_lang = scraped_dict.get("language", "en")
+        recipe_lang = scraped_dict.get("language") or "en"
 
-        ingredients_list = chain(*ingredients.values())
-        recipe_ingredients: list[RecipeIngredient] = []
+        ingredients_list = list(chain(*ingredients.values()))
+        # Fall back on the ingredient's name in the recipe if it has no base name
         for ingredient in ingredients_list:
-            # find or create base ingredient
-            ingredient_dict = ingredient
+            ingredient["base_ingredient_str"] = (
+                ingredient["base_ingredient_str"] or ingredient["name_in_recipe"]
+            )
+        base_ingredients = resolve_ingredients(
+            (ingredient["base_ingredient_str"] for ingredient in ingredients_list),
+            recipe_lang,
+        )
+        recipe_ingredients: list[RecipeIngredient] = []
+        for ingredient_dict in ingredients_list:
             ingredient_name = ingredient_dict.pop("base_ingredient_str")
-            name_arg_dict = {f"name_{recipe_lang}": ingredient_name}
-            try:
-                base_ingredient = Ingredient.objects.get(**name_arg_dict)
-            except Ingredient.DoesNotExist:
-                base_ingredient = Ingredient.objects.create(**name_arg_dict)
-
-            # Create recipe ingredient
+            del ingredient_dict["base_ingredient_id"]
             ri = RecipeIngredient(
-                recipe=recipe, **ingredient_dict, base_ingredient=base_ingredient
+                recipe=recipe,
+                **ingredient_dict,
+                base_ingredient=base_ingredients[ingredient_name],
             )
             ri.full_clean()
             recipe_ingredients.append(ri)
@@ -251,21 +494,25 @@ def scrape_recipe_bad(request, url: str):
             ri.save()
         for emb in embeddings:
             emb.save()
+    refresh_similar_recipes(recipe)
 
     return "ok"
 
 
 @router.post(
-    "from_image", response={200: ScrapedRecipe, 400: str, 404: str}, tags=["scrape"]
+    "from_image",
+    response={200: ScrapedRecipe, 400: str, 404: str},
+    tags=["scrape"],
+    auth=async_auth,
 )
-def recipe_from_image(request, img: UploadedFile):
+async def recipe_from_image(request, img: UploadedFile):
     if not settings.OCR_ENABLED:
         return 404, "OCR/Text-recognition service not enabled for this system"
 
     img_data = img.read()
 
     try:
-        recipe_data = parse_img(img_data)
+        recipe_data = await aparse_img(img_data)
         recipe_data.clean()
     except ValueError as e:
         return 400, str(e)
@@ -273,7 +520,18 @@ def recipe_from_image(request, img: UploadedFile):
         return 400, str(e)
     except Exception as e:
         raise e
-        print(e)
-        return 400, "An error occured."
+
+    # Link the ingredients to existing base ingredients, so the client can save
+    # them as is. Nothing is saved until the client saves the recipe, so the
+    # ingredients that don't exist yet are left for it to create
+    ingredients = list(chain(*recipe_data.ingredients.values()))
+    base_ingredients = await sync_to_async(resolve_ingredients)(
+        (ingredient.base_ingredient_str for ingredient in ingredients),
+        recipe_data.language or "en",
+        create=False,
+    )
+    for ingredient in ingredients:
+        if base_ingredient := base_ingredients.get(ingredient.base_ingredient_str):
+            ingredient.base_ingredient_id = base_ingredient.id
 
     return recipe_data
@@ -1,6 +1,20 @@
-from ninja import Field, ModelSchema, Schema
-
-from recipes.models import Ingredient, Recipe, RecipeIngredient
+import datetime
+
+from django.db.models import Q
+from ninja import Field, FilterSchema, ModelSchema, Schema
+
+from recipes.models import (
+    Ingredient,
+    MealPlanEntry,
+    Recipe,
+    RecipeEmbedding,
+    RecipeIngredient,
+    RecipeNutrition,
+    RecipeTag,
+    SimilarRecipe,
+    Tag,
+)
+from recipes.units import System
 
 # Terminology:
 # "Full recipe": Recipe + associated recipe ingredients
@@ -25,6 +39,15 @@ class IngredientDetailSchema(ModelSchema):
         return obj.get_names()
 
 
+class IngredientMatchSchema(Schema):
+    """An ingredient matching a name, see ingredient_matching"""
+
+    ingredient: IngredientDetailSchema
+    # The ingredient's name that matched, normalised
+    matched_name: str
+    score: float
+
+
 class IngredientCreationSchema(ModelSchema):
     class Meta:
         model = Ingredient
@@ -42,8 +65,13 @@ class IngredientUpdateSchema(ModelSchema):
 ##########################
 
 
+# Note: base_ingredient_id is read from the raw foreign key column.
+# Going through base_ingredient (e.g., "base_ingredient.id") would load
+# the related ingredient, costing a query per recipe ingredient.
+
+
 class RecipeIngredientListSchema(ModelSchema):
-    base_ingredient_id: int = Field(alias="base_ingredient.id")
+    base_ingredient_id: int
 
     class Meta:
         model = RecipeIngredient
@@ -51,7 +79,9 @@ class RecipeIngredientListSchema(ModelSchema):
 
 
 class RecipeIngredientDetailSchema(ModelSchema):
-    base_ingredient_id: int = Field(alias="base_ingredient.id")
+    base_ingredient_id: int
+    # Generated by the database, so ninja can't tell they're nullable
+    canonical_amount: float | None
 
     class Meta:
         model = RecipeIngredient
@@ -62,7 +92,7 @@ class RecipeIngredientCreationSchema(Schema):
     base_ingredient_id: int
     name_in_recipe: str
     is_optional: bool = False
-    group_name: str | None = None
+    group_name: str = ""
 
     base_amount: float | None = None
     unit: str = ""
@@ -104,6 +134,87 @@ class FullRecipeDetailSchema(ModelSchema):
         fields = "__all__"
 
 
+class SimilarRecipeSchema(Schema):
+    """A recipe similar to another, and how similar it is (cosine similarity)"""
+
+    id: int = Field(alias="similar_id")
+    title: str = Field(alias="similar.title")
+    thumbnail: str | None
+    similarity: float
+
+    @staticmethod
+    def resolve_thumbnail(obj: SimilarRecipe) -> str | None:
+        return obj.similar.thumbnail and obj.similar.thumbnail.url
+
+
+class SearchResultSchema(Schema):
+    """
+    A recipe matching a search, with the chunk of its text that matches best as
+    a snippet. Highlights are the (start, end) spans of the snippet matching the
+    query's words, and the score is the cosine similarity of the snippet.
+    """
+
+    id: int = Field(alias="recipe_id")
+    title: str = Field(alias="recipe.title")
+    thumbnail: str | None
+    score: float
+    field: str
+    snippet: str = Field(alias="text")
+    highlights: list[tuple[int, int]]
+
+    @staticmethod
+    def resolve_thumbnail(obj: RecipeEmbedding) -> str | None:
+        return obj.recipe.thumbnail and obj.recipe.thumbnail.url
+
+    @staticmethod
+    def resolve_score(obj: RecipeEmbedding) -> float:
+        return 1 - obj.distance
+
+
+class SearchFilterSchema(FilterSchema):
+    """
+    Filters for searches. The recipe fields are filtered using their copies on
+    the pooled embeddings searched (see RecipeEmbedding).
+    """
+
+    language: str | None = Field(None, q="language")
+    max_total_time: int | None = Field(None, q="total_time__lte")
+    # Recipes must contain all of the ingredients
+    ingredients: list[int] | None = None
+
+    def filter_ingredients(self, ingredient_ids: list[int] | None) -> Q:
+        q = Q()
+        for ingredient_id in ingredient_ids or []:
+            q &= Q(
+                recipe_id__in=RecipeIngredient.objects.filter(
+                    base_ingredient_id=ingredient_id
+                ).values("recipe_id")
+            )
+        return q
+
+
+class RecipeFilterSchema(FilterSchema):
+    max_time: int | None = Field(None, q="total_time__lte")
+    # Tag slugs. Recipes must have all of them
+    tag: list[str] | None = None
+
+    def filter_tag(self, slugs: list[str] | None) -> Q:
+        q = Q()
+        for slug in slugs or []:
+            q &= Q(id__in=RecipeTag.objects.filter(tag__slug=slug).values("recipe_id"))
+        return q
+
+
+class TagFacetSchema(ModelSchema):
+    """A tag, and the number of recipes matching the filters that have it"""
+
+    count: int
+
+    class Meta:
+        model = Tag
+        fields = "__all__"
+
+
 class FullRecipeCreationSchema(Schema):
     """Creation schema for recipe with its recipe ingredients"""
 
@@ -124,6 +235,7 @@ class FullRecipeCreationSchema(Schema):
     other_source: str | None = None
 
     ingredients: list[RecipeIngredientCreationSchema]
+    tags: list[int] = []
 
 
 class FullRecipeUpdateSchema(Schema):
@@ -146,3 +258,119 @@ class FullRecipeUpdateSchema(Schema):
     other_source: str | None = None
 
     ingredients: list[RecipeIngredientCreationSchema]
+    # None leaves the recipe's tags as they are
+    tags: list[int] | None = None
+
+
+##############
+# Sync schemas
+##############
+
+
+class ChangesSchema(Schema):
+    """
+    Recipes and ingredients changed since the given token, along with the ids of
+    those deleted. Clients pass the returned token back on their next sync.
+    """
+
+    token: int
+    recipes: list[FullRecipeDetailSchema]
+    ingredients: list[IngredientDetailSchema]
+    deleted_recipes: list[int]
+    deleted_ingredients: list[int]
+
+
+#######################
+# Shopping list schemas
+#######################
+
+
+class ShoppingListRecipeSchema(Schema):
+    id: int
+    # Defaults to the recipe's own number of servings
+    servings: int | None = Field(None, gt=0)
+
+
+class ShoppingListRequestSchema(Schema):
+    # A recipe may be listed more than once, e.g. when planned for several days
+    recipes: list[ShoppingListRecipeSchema]
+    # Language of the ingredient names, falling back on any other name
+    language: str = "en"
+    system: System | None = None
+
+
+class ShoppingListItemSchema(Schema):
+    ingredient_id: int
+    name: str | None
+    # None when no recipe gives an amount, e.g. "salt to taste"
+    amount: float | None
+    unit: str
+    recipe_ids: list[int]
+
+
+class ShoppingListSchema(Schema):
+    """The ingredients of several recipes, summed per ingredient and unit"""
+
+    items: list[ShoppingListItemSchema]
+    # Ingredients that are optional in the recipes they're from
+    optional: list[ShoppingListItemSchema]
+
+
+###################
+# Meal plan schemas
+###################
+
+
+class MealPlanEntrySchema(ModelSchema):
+    recipe_id: int
+    recipe_title: str = Field(alias="recipe.title")
+
+    class Meta:
+        model = MealPlanEntry
+        fields = ["id", "date", "servings"]
+
+
+class MealPlanEntryCreationSchema(Schema):
+    date: datetime.date
+    recipe_id: int
+    servings: int | None = Field(None, gt=0)
+
+
+class MealPlanCreationSchema(Schema):
+    name: str = ""
+    entries: list[MealPlanEntryCreationSchema] = []
+
+
+class MealPlanDetailSchema(ShoppingListSchema):
+    """A meal plan's entries by date, and their summed ingredients"""
+
+    id: int
+    name: str
+    entries: list[MealPlanEntrySchema]
+
+
+###################
+# Nutrition schemas
+###################
+
+
+class RecipeNutritionSchema(ModelSchema):
+    """
+    The nutrients of a recipe in total and per serving, in kcal and g. Only
+    the share (coverage) of the ingredients with a known mass and nutrition
+    are included
+    """
+
+    # Generated by the database, so ninja can't tell they're nullable
+    energy_kcal_per_serving: float | None
+    fat_per_serving: float | None
+    saturated_fat_per_serving: float | None
+    carbohydrate_per_serving: float | None
+    sugar_per_serving: float | None
+    fiber_per_serving: float | None
+    protein_per_serving: float | None
+    salt_per_serving: float | None
+
+    class Meta:
+        model = RecipeNutrition
+        exclude = ["recipe"]
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class RecipesConfig(AppConfig):
+    name = "recipes"
+
+    def ready(self):
+        from recipes import checks  # noqa: F401 (registers the checks)
@@ -0,0 +1,37 @@
+"""
+Caching of serialized API responses.
+
+Entries are invalidated by signal handlers in models.py whenever the data they
+were built from changes, so every write path (services, admin, shell) is covered.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.metrics import CACHE_REQUESTS
+from kokebok import settings
+
+
+def _recipe_detail_key(recipe_id: int) -> str:
+    return f"recipe_detail:{recipe_id}"
+
+
+def get_recipe_detail(recipe_id: int) -> bytes | None:
+    """Returns the cached recipe detail JSON, if any"""
+    data = cache.get(_recipe_detail_key(recipe_id))
+    CACHE_REQUESTS.labels("recipe_detail", "miss" if data is None else "hit").inc()
+    return data
+
+
+def set_recipe_detail(recipe_id: int, data: bytes):
+    cache.set(
+        _recipe_detail_key(recipe_id), data, timeout=settings.RECIPE_CACHE_TIMEOUT
+    )
+
+
+def invalidate_recipe_detail(recipe_id: int):
+    key = _recipe_detail_key(recipe_id)
+    cache.delete(key)
+    # A concurrent request may re-cache the old data before the current transaction
+    # commits, so delete again once it has.
+    transaction.on_commit(lambda: cache.delete(key))
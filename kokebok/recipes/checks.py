@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.db import connections
+
+from recipes.embedding import BACKENDS
+
+# Half precision and binary vectors need pgvector 0.7, iterative index scans 0.8
+MIN_PGVECTOR_VERSION = (0, 8, 0)
+
+
+@register()
+def embedding_backend_check(app_configs, **kwargs):
+    if settings.EMBEDDING_BACKEND not in BACKENDS:
+        return [
+            Error(
+                f"Unknown embedding backend: {settings.EMBEDDING_BACKEND}",
+                hint=f"Use one of: {', '.join(BACKENDS)}",
+                id="recipes.E001",
+            )
+        ]
+
+    return []
+
+
+@register(Tags.database)
+def pgvector_version_check(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or []:
+        with connections[alias].cursor() as cursor:
+            # The installed version, or else the one migrating would install
+            cursor.execute(
+                "SELECT coalesce(installed_version, default_version)"
+                " FROM pg_available_extensions WHERE name = 'vector'"
+            )
+            row = cursor.fetchone()
+        minimum = ".".join(map(str, MIN_PGVECTOR_VERSION))
+        if row is None:
+            errors.append(
+                Error(
+                    f"The pgvector extension is not available in database {alias}",
+                    hint=f"Install pgvector {minimum} or later",
+                    id="recipes.E002",
+                )
+            )
+        elif tuple(map(int, row[0].split("."))) < MIN_PGVECTOR_VERSION:
+            errors.append(
+                Error(
+                    f"pgvector {row[0]} in database {alias} is too old",
+                    hint=f"Upgrade to pgvector {minimum} or later, and run"
+                    " ALTER EXTENSION vector UPDATE",
+                    id="recipes.E003",
+                )
+            )
+
+    return errors
@@ -0,0 +1,63 @@
+"""
+Text embeddings, used for semantic search.
+
+The embedding backend is selected through the EMBEDDING_BACKEND setting:
+* "cohere": Cohere's embedding API (the default)
+* "local": a sentence-transformers model, run on the CPU
+* "hashing": deterministic feature hashing, for tests and offline development
+
+The backend's model and number of dimensions can be changed through the
+EMBEDDING_MODEL and EMBEDDING_DIMENSIONS settings.
+
+Stored embeddings are tied to the embedding version (see models.EmbeddingVersion)
+that produced them, and must be compared against queries embedded by the same
+version's backend. The settings only decide the backend of new versions.
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from recipes.embedding.base import EmbeddingBackend, chunk_texts
+
+BACKENDS = {
+    "cohere": "recipes.embedding.cohere_api.CohereBackend",
+    "local": "recipes.embedding.local.LocalBackend",
+    "hashing": "recipes.embedding.hashing.HashingBackend",
+}
+
+
+@lru_cache
+def load_backend(name: str, model: str, dimensions: int | None) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f"Unknown embedding backend: {name}")
+    backend_class = import_string(BACKENDS[name])
+    return backend_class(model, dimensions)
+
+
+def get_backend() -> EmbeddingBackend:
+    """Returns the configured backend, used when creating new embedding versions"""
+    return load_backend(
+        settings.EMBEDDING_BACKEND,
+        settings.EMBEDDING_MODEL,
+        settings.EMBEDDING_DIMENSIONS,
+    )
+
+
+def embed_docs(
+    *opt_docs: str | None, backend: EmbeddingBackend | None = None
+) -> list[list[float]]:
+    docs = [t for t in opt_docs if t]
+    return (backend or get_backend()).embed_documents(chunk_texts(docs))
+
+
+def embed_query(text: str, backend: EmbeddingBackend | None = None) -> list[float]:
+    return (backend or get_backend()).embed_query(text)
+
+
+async def aembed_query(
+    text: str, backend: EmbeddingBackend | None = None
+) -> list[float]:
+    return await (backend or get_backend()).aembed_query(text)
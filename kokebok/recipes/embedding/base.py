@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+
+
+def chunk_texts(texts: Iterable[str]) -> list[str]:
+    """Splits long texts into chunks small enough to embed"""
+    chunks: list[str] = []
+    for text in texts:
+        if (
+            len(text) > 1024
+        ):  # conservatively estimate 2 chars per token, keeping within 512 tokens per chunk
+            chunks += [
+                s.strip()
+                for s in text.strip().split("\n")
+                if s.strip() and len(s) > 12  # arbitrary number
+            ]
+        else:
+            chunks.append(text)
+
+    return chunks
+
+
+class EmbeddingBackend(ABC):
+    """
+    Turns texts into embedding vectors. Documents (recipe texts) and queries are
+    embedded separately, as some models embed them differently.
+    """
+
+    default_model: str
+    default_dimensions: int
+    # Maximum number of texts embedded at once
+    batch_size: int = 96
+    # In dollars, used for estimating costs
+    price_per_million_tokens: float = 0
+
+    def __init__(self, model: str = "", dimensions: int | None = None) -> None:
+        self.model = model or self.default_model
+        self.dimensions = dimensions or self.default_dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        embeddings: list[list[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            embeddings += self._embed_documents(texts[i : i + self.batch_size])
+        return embeddings
+
+    @abstractmethod
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds a single batch of texts"""
+
+    @abstractmethod
+    def embed_query(self, text: str) -> list[float]:
+        ...
+
+    async def aembed_query(self, text: str) -> list[float]:
+        # Backends with async clients should override this
+        return await sync_to_async(self.embed_query, thread_sensitive=False)(text)
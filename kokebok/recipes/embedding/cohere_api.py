@@ -0,0 +1,63 @@
+import cohere
+import httpx
+
+from core.clients import shared_async_client, shared_client
+from core.instrumentation import timed
+from recipes.embedding.base import EmbeddingBackend
+
+
+# Requires CO_API_KEY environment variable to be set
+@shared_client
+def _cohere_client() -> cohere.Client:
+    return cohere.Client()
+
+
+@shared_async_client(close=httpx.AsyncClient.aclose)
+def _async_cohere_http_client() -> httpx.AsyncClient:
+    # The timeout cohere gives the client it otherwise creates itself
+    return httpx.AsyncClient(timeout=300)
+
+
+@shared_async_client
+def _async_cohere_client() -> cohere.AsyncClient:
+    return cohere.AsyncClient(httpx_client=_async_cohere_http_client())
+
+
+class CohereBackend(EmbeddingBackend):
+    default_model = "embed-multilingual-v3.0"
+    default_dimensions = 1024
+    batch_size = 96  # Maximum number of texts per request
+    price_per_million_tokens = 0.1
+
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with timed("cohere"):
+            response = _cohere_client().embed(
+                model=self.model,
+                texts=texts,
+                input_type="search_document",
+                truncate="END",
+                batching=False,
+            )
+        return response.embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        with timed("cohere"):
+            response = _cohere_client().embed(
+                model=self.model,
+                texts=[text],
+                input_type="search_query",
+                truncate="END",
+                batching=False,
+            )
+        return response.embeddings[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with timed("cohere"):
+            response = await _async_cohere_client().embed(
+                model=self.model,
+                texts=[text],
+                input_type="search_query",
+                truncate="END",
+                batching=False,
+            )
+        return response.embeddings[0]
@@ -0,0 +1,51 @@
+import re
+import zlib
+
+import numpy as np
+
+from recipes.embedding.base import EmbeddingBackend
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Embeds texts by hashing their words and character trigrams into a fixed
+    number of dimensions (the "hashing trick"). Deterministic and instant, but
+    only matches texts sharing (parts of) words, not meaning. Meant for tests and
+    offline development.
+    """
+
+    default_model = "hashing"
+    default_dimensions = 1024
+    batch_size = 1024
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD_RE.findall(text.lower())
+        trigrams = [
+            padded[i : i + 3]
+            for padded in (f" {word} " for word in words)
+            for i in range(len(padded) - 2)
+        ]
+        return words + trigrams
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array(
+                [zlib.crc32(feature.encode()) for feature in self._features(text)],
+                dtype=np.uint32,
+            )
+            # One bit of the hash picks the sign, so that collisions cancel out on
+            # average rather than inflating the similarity
+            signs = np.where(hashes & 1, 1.0, -1.0)
+            np.add.at(vectors[row], (hashes >> 1) % self.dimensions, signs)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text])[0].tolist()
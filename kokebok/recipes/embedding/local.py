@@ -0,0 +1,54 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from core.instrumentation import timed
+from recipes.embedding.base import EmbeddingBackend
+
+
+class LocalBackend(EmbeddingBackend):
+    """
+    Runs a sentence-transformers model on the CPU, so embedding requires no
+    network access. Requires the sentence-transformers package, which is not
+    installed by default. The model is downloaded on first use.
+    """
+
+    default_model = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    default_dimensions = 384
+    batch_size = 64
+
+    def __init__(self, model: str = "", dimensions: int | None = None) -> None:
+        super().__init__(model, dimensions)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        # Loading the model is slow, so it's done once per process and on first use
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImproperlyConfigured(
+                        "The local embedding backend requires sentence-transformers"
+                    ) from e
+                self._model = SentenceTransformer(
+                    self.model, device="cpu", truncate_dim=self.dimensions
+                )
+        return self._model
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        with timed("local_embedding"):
+            embeddings = self._get_model().encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+        return embeddings.tolist()
+
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._encode([text])[0]
@@ -1,7 +1,7 @@
 import json
 from collections import defaultdict
 
-from recipes.image_parsing.openai_with_vision import image_to_json
+from recipes.image_parsing.openai_with_vision import aimage_to_json, image_to_json
 from recipes.scraping.base import ScrapedRecipe, ScrapedRecipeIngredient
 
 MOCK_OCR = False
@@ -19,10 +19,25 @@ def parse_img(img: bytes, gpt_hint: str = "", language: str = "") -> ScrapedReci
     """
 
     recipe_json = image_to_json(img, gpt_hint)
+    return _to_scraped_recipe(recipe_json)
+
+
+async def aparse_img(
+    img: bytes, gpt_hint: str = "", language: str = ""
+) -> ScrapedRecipe:
+    """Async version of parse_img, for use in async views"""
+    recipe_json = await aimage_to_json(img, gpt_hint)
+    return _to_scraped_recipe(recipe_json)
+
+
+def _to_scraped_recipe(recipe_json: str) -> ScrapedRecipe:
     parsed_json = json.loads(recipe_json)
 
     # To make the parsed recipe into a ScrapedRecipe, the following steps are required:
-    # 1. Group ingredients by the their group name
+    # 1. Rename the base ingredient names to match ScrapedRecipeIngredient
+    for ingredient in parsed_json["ingredients"]:
+        ingredient["base_ingredient_str"] = ingredient.pop("base_ingredient_name", "")
+    # 2. Group ingredients by the their group name
     parsed_json["ingredients"] = group_ingredients(parsed_json["ingredients"])
 
     recipe = ScrapedRecipe(**parsed_json)
@@ -1,11 +1,16 @@
+import logging
+
 import google.auth
 from google.api_core.client_options import ClientOptions
-from google.auth.transport import requests
 from google.cloud import vision
 from google.cloud.vision_v1.types import ImageContext, TextAnnotation
 
+from core.clients import shared_client
+from core.instrumentation import timed
 from kokebok import settings
 
+logger = logging.getLogger(__name__)
+
 
 def _text_to_dict(t):
     # Use if we ever want to return text bounds with text content
@@ -19,16 +24,19 @@ def _get_credentials():
     credentials, _project_id = google.auth.load_credentials_from_dict(
         settings.GOOGLE_CLOUD_CREDENTIALS
     )
-    credentials = credentials.with_scopes(
+    # No need to refresh the credentials up front. The client refreshes them
+    # before a request whenever they are missing or expired
+    return credentials.with_scopes(
         scopes=["https://www.googleapis.com/auth/cloud-platform"]
     )
-    credentials.refresh(requests.Request())
-    return credentials
 
 
-def _get_vision_client(credentials) -> vision.ImageAnnotatorClient:
+@shared_client
+def _get_vision_client() -> vision.ImageAnnotatorClient:
     opts = ClientOptions(api_endpoint="vision.googleapis.com")
-    return vision.ImageAnnotatorClient(credentials=credentials, client_options=opts)
+    return vision.ImageAnnotatorClient(
+        credentials=_get_credentials(), client_options=opts
+    )
 
 
 def alternate_google_cloud_ocr(raw_img: bytes, hints: dict[str, str]) -> str:
@@ -53,7 +61,7 @@ def alternate_google_cloud_ocr(raw_img: bytes, hints: dict[str, str]) -> str:
         BreakType.LINE_BREAK: "\n",
     }
 
-    client = _get_vision_client(_get_credentials())
+    client = _get_vision_client()
 
     image_context = ImageContext(**hints)
 
@@ -61,38 +69,40 @@ def alternate_google_cloud_ocr(raw_img: bytes, hints: dict[str, str]) -> str:
     # Note: uses document_text_detection instead of text_detection
     # This gives access to more info about text groupings,
     # and possibly gives better OCR results in general?
-    response = client.document_text_detection(image=image, image_context=image_context)
+    with timed("google_vision"):
+        response = client.document_text_detection(
+            image=image, image_context=image_context
+        )
     texts = response.text_annotations
 
-    full_text = response.full_text_annotation
-    print("PAGES:")
-    for page in full_text.pages:
-        # print(page.__dict__)
-        print(page.property)
-        print("BLOCKS:")
-        for block in page.blocks:
-            text = ""
-            for paragraph in block.paragraphs:
-                for word in paragraph.words:
-                    for symbol in word.symbols:
-                        text += symbol.text
-                        if hasattr(symbol, "property"):
-                            break_type = symbol.property.detected_break.type
-                            text += break_to_symbol[break_type]
-
-            print(text)
-            print("---------")
+    # The block grouping is not used yet, so it is only computed when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        full_text = response.full_text_annotation
+        for page in full_text.pages:
+            logger.debug("Page: %s", page.property)
+            for block in page.blocks:
+                text = ""
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        for symbol in word.symbols:
+                            text += symbol.text
+                            if hasattr(symbol, "property"):
+                                break_type = symbol.property.detected_break.type
+                                text += break_to_symbol[break_type]
+
+                logger.debug("Block: %s", text)
     full_text = texts[0]
     return full_text.description
 
 
 def google_cloud_ocr(raw_img: bytes, hints: dict[str, str]) -> str:
-    client = _get_vision_client(_get_credentials())
+    client = _get_vision_client()
 
     image_context = ImageContext(**hints)
 
     image = vision.Image(content=raw_img)
-    response = client.text_detection(image=image, image_context=image_context)
+    with timed("google_vision"):
+        response = client.text_detection(image=image, image_context=image_context)
     texts = response.text_annotations
     # Text annotations is a list where the first item seems to be
     # the complete recognized text as a single string
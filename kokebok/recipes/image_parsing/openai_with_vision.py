@@ -1,9 +1,17 @@
 import base64
+import logging
 import math
 from typing import Any
 
+import aiohttp
 import openai
 
+from core.clients import shared_async_client
+from core.instrumentation import timed
+from core.metrics import OCR_COST
+
+logger = logging.getLogger(__name__)
+
 SYSTEM_PROMPT = """
 Your task is to extract text from an image and turn it into structured data.
 Specifically, you will receive an image of a cooking recipe whose text content
@@ -116,7 +124,11 @@ model = "gpt-4-turbo"
 price_1k_tokens = 0.01  # in dollars
 
 
-def image_to_json(img_data: bytes, user_hint: str = "") -> str:
+def _chat_request(img_data: bytes, user_hint: str) -> tuple[dict[str, Any], int]:
+    """
+    Returns the chat completion arguments for parsing the image, along with an
+    estimate of the number of input tokens.
+    """
     full_user_text = USER_HINT_PREAMBLE.format(HINT=user_hint) if user_hint else ""
 
     # Pricing calculations
@@ -129,9 +141,6 @@ def image_to_json(img_data: bytes, user_hint: str = "") -> str:
         + estimate_user_text_tokens
         + estimate_user_image_tokens
     )
-    print(f"{estimate_total_input_tokens=}")
-    estimate_input_cost = (estimate_total_input_tokens / 1000) * price_1k_tokens
-    print(f"{estimate_input_cost=}")
 
     # Construct the chat messages
     chat_messages: list[dict[str, Any]] = [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -150,7 +159,7 @@ def image_to_json(img_data: bytes, user_hint: str = "") -> str:
     )
 
     # chat API docs: https://platform.openai.com/docs/api-reference/chat/create
-    response = openai.ChatCompletion.create(
+    request = dict(
         presence_penalty=-1,  # Discourage new topics
         temperature=0.2,  # Make model more predictable
         model=model,
@@ -159,24 +168,62 @@ def image_to_json(img_data: bytes, user_hint: str = "") -> str:
         stream=False,
         max_tokens=4096,
     )
-    print(response)
+    return request, estimate_total_input_tokens
+
+
+def _read_response(response, estimate_total_input_tokens: int) -> str:
+    logger.debug("OpenAI response: %s", response)
 
     if response["choices"][0]["finish_reason"] == "content_filter":
         raise ValueError("ChatGPT stopped due to content filter.")
 
-    # More costs reporting
+    # Costs reporting
+    estimate_input_cost = (estimate_total_input_tokens / 1000) * price_1k_tokens
     input_cost = response["usage"]["prompt_tokens"] * price_1k_tokens / 1000
     output_cost = response["usage"]["completion_tokens"] * price_1k_tokens / 1000
     total_cost = input_cost + output_cost
-    print("COSTS:")
-    print(f"{input_cost=} ({estimate_input_cost=})")
-    print(f"{output_cost=}")
-    print(f"Total cost: ${total_cost} (~ equal to NOK {10*total_cost})")
+    OCR_COST.labels(model).inc(total_cost)
+    logger.info(
+        "Parsed recipe image with %s for $%.4f",
+        model,
+        total_cost,
+        extra={
+            "model": model,
+            "prompt_tokens": response["usage"]["prompt_tokens"],
+            "completion_tokens": response["usage"]["completion_tokens"],
+            "estimated_input_tokens": estimate_total_input_tokens,
+            "estimated_input_cost": estimate_input_cost,
+            "input_cost": input_cost,
+            "output_cost": output_cost,
+            "total_cost": total_cost,
+        },
+    )
 
     response_text: str = response["choices"][0]["message"]["content"]
 
     response_text = response_text.lstrip("```json")
     response_text = response_text.rstrip("```")
 
-    print(response_text)
+    logger.debug("Parsed recipe JSON: %s", response_text)
     return response_text
+
+
+def image_to_json(img_data: bytes, user_hint: str = "") -> str:
+    request, estimate_input_tokens = _chat_request(img_data, user_hint)
+    with timed("openai"):
+        response = openai.ChatCompletion.create(**request)
+    return _read_response(response, estimate_input_tokens)
+
+
+@shared_async_client(close=aiohttp.ClientSession.close)
+def _openai_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession()
+
+
+async def aimage_to_json(img_data: bytes, user_hint: str = "") -> str:
+    request, estimate_input_tokens = _chat_request(img_data, user_hint)
+    # Otherwise, openai creates (and closes) a new session for every request
+    openai.aiosession.set(_openai_session())
+    with timed("openai"):
+        response = await openai.ChatCompletion.acreate(**request)
+    return _read_response(response, estimate_input_tokens)
@@ -1,8 +1,14 @@
+import logging
 import math
 from typing import Literal
 
 import openai
 
+from core.instrumentation import timed
+from core.metrics import OCR_COST
+
+logger = logging.getLogger(__name__)
+
 ALLOWED_MODELS = Literal["gpt-3.5-turbo", "gpt-3.5-turbo-16k", "gpt-4"]
 DEFAULT_GPT_MODEL: ALLOWED_MODELS = "gpt-3.5-turbo"
 
@@ -110,7 +116,6 @@ def text_to_recipe(text: str, user_hint: str = "") -> str:
     estimate_total_input_tokens = math.ceil(
         estimate_system_prompt_tokens + estimate_user_input_tokens
     )
-    print(f"{estimate_total_input_tokens=}")
 
     # Set GPT model to use
     gpt_model: ALLOWED_MODELS = DEFAULT_GPT_MODEL
@@ -128,18 +133,19 @@ def text_to_recipe(text: str, user_hint: str = "") -> str:
     chat_messages.append({"role": "user", "content": text})
 
     # create API docs: https://platform.openai.com/docs/api-reference/chat/create
-    response = openai.ChatCompletion.create(
-        presence_penalty=-1,  # Discourage new topics
-        temperature=0.2,  # Make model more predictable
-        model=gpt_model,
-        messages=chat_messages,
-    )
+    with timed("openai"):
+        response = openai.ChatCompletion.create(
+            presence_penalty=-1,  # Discourage new topics
+            temperature=0.2,  # Make model more predictable
+            model=gpt_model,
+            messages=chat_messages,
+        )
 
     if response["choices"][0]["finish_reason"] == "content_filter":
-        print(response)
+        logger.warning("ChatGPT stopped due to content filter: %s", response)
         raise ValueError("ChatGPT stopped due to content filter.")
 
-    print(response)
+    logger.debug("OpenAI response: %s", response)
     estimate_input_cost = (
         estimate_total_input_tokens * GPT_PRICING[gpt_model]["input"] / 1000
     )
@@ -150,10 +156,22 @@ def text_to_recipe(text: str, user_hint: str = "") -> str:
         response["usage"]["completion_tokens"] * GPT_PRICING[gpt_model]["output"] / 1000
     )
     total_cost = input_cost + output_cost
-    print("COSTS:")
-    print(f"{input_cost=} ({estimate_input_cost=})")
-    print(f"{output_cost=}")
-    print(f"Total cost: ${total_cost} (~ equal to NOK {10*total_cost})")
+    OCR_COST.labels(gpt_model).inc(total_cost)
+    logger.info(
+        "Structured recipe text with %s for $%.4f",
+        gpt_model,
+        total_cost,
+        extra={
+            "model": gpt_model,
+            "prompt_tokens": response["usage"]["prompt_tokens"],
+            "completion_tokens": response["usage"]["completion_tokens"],
+            "estimated_input_tokens": estimate_total_input_tokens,
+            "estimated_input_cost": estimate_input_cost,
+            "input_cost": input_cost,
+            "output_cost": output_cost,
+            "total_cost": total_cost,
+        },
+    )
 
     response_text = response["choices"][0]["message"]["content"]
 
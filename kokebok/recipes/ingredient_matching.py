@@ -0,0 +1,236 @@
+"""
+Fuzzy matching of ingredient names, e.g. scraped ones like "fresh blueberries",
+to ingredients.
+
+Matching uses an in-memory index of the names of all ingredients, in all
+languages, built on first use. Names are normalised (lowercased, without accents
+and the plural endings of their language) and split into trigrams, like pg_trgm
+does. The index is kept up
+to date by signal handlers in models.py, but only for writes made by the same
+process. Other processes' writes are picked up when the index is rebuilt, once
+it is older than INGREDIENT_MATCHER_MAX_AGE seconds.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Iterable, Mapping, NamedTuple, cast
+
+from django.conf import settings
+from django.db import transaction
+
+# Letters that don't decompose into a base letter and an accent
+_LETTERS = str.maketrans({"ø": "o", "æ": "ae", "ß": "ss", "œ": "oe", "ł": "l"})
+
+
+class Match(NamedTuple):
+    ingredient_id: int
+    # The ingredient's name that matched best, normalised
+    name: str
+    # Between 0 and 1, where 1 is an exact match of the normalised names
+    score: float
+
+
+# Languages whose plural endings are stripped by _singular, besides English's
+_PLURAL_LANGUAGES = ("no",)
+
+
+def _singular(token: str, language: str | None) -> str:
+    """
+    Strips common English plural endings, crudely, and Norwegian ones from
+    Norwegian words. Many English words end like Norwegian plurals ("butter").
+    """
+    if len(token) <= 3:
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("ches", "shes", "sses", "xes", "oes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    if language == "no":
+        # Plurals (tomater) and definite plurals (tomatene)
+        if token.endswith("ene") and len(token) > 5:
+            return token[:-3]
+        if token.endswith("er") and len(token) > 5:
+            return token[:-2]
+    return token
+
+
+def normalise(name: str, language: str | None = None) -> str:
+    """
+    Lowercases the name, removes accents and punctuation, and singularises it
+    according to its language
+    """
+    name = unicodedata.normalize("NFKD", name.lower().translate(_LETTERS))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(_singular(token, language) for token in re.findall(r"[a-z]+", name))
+
+
+def trigrams(normalised_name: str) -> frozenset[str]:
+    """The trigrams of each word, padded like pg_trgm's"""
+    return frozenset(
+        padded[i : i + 3]
+        for word in normalised_name.split()
+        for padded in [f"  {word} "]
+        for i in range(len(padded) - 2)
+    )
+
+
+class IngredientMatcher:
+    """
+    An inverted index from trigrams to ingredient names. Safe to use from
+    several threads.
+    """
+
+    def __init__(
+        self, ingredients: Iterable[tuple[int, Mapping[str, str | None]]] = ()
+    ):
+        self._lock = threading.Lock()
+        # The normalised names of each ingredient, and the ingredients of each name
+        self._names: dict[int, set[str]] = {}
+        self._ingredients: dict[str, set[int]] = defaultdict(set)
+        self._trigrams: dict[str, frozenset[str]] = {}
+        self._postings: dict[str, set[str]] = defaultdict(set)
+        for ingredient_id, names in ingredients:
+            self.add(ingredient_id, names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, ingredient_id: int, names: Mapping[str, str | None]):
+        """Adds the ingredient, or replaces its names, keyed by their language"""
+        normalised = {
+            normalise(name, language) for language, name in names.items() if name
+        } - {""}
+        with self._lock:
+            self._remove(ingredient_id)
+            self._names[ingredient_id] = normalised
+            for name in normalised:
+                self._ingredients[name].add(ingredient_id)
+                if name not in self._trigrams:
+                    self._trigrams[name] = trigrams(name)
+                    for trigram in self._trigrams[name]:
+                        self._postings[trigram].add(name)
+
+    def remove(self, ingredient_id: int):
+        with self._lock:
+            self._remove(ingredient_id)
+
+    def _remove(self, ingredient_id: int):
+        for name in self._names.pop(ingredient_id, ()):
+            self._ingredients[name].discard(ingredient_id)
+            if self._ingredients[name]:
+                continue
+            # No other ingredient has the name
+            del self._ingredients[name]
+            for trigram in self._trigrams.pop(name):
+                self._postings[trigram].discard(name)
+                if not self._postings[trigram]:
+                    del self._postings[trigram]
+
+    def match(
+        self,
+        text: str,
+        limit: int = 5,
+        threshold: float = 0.3,
+        language: str | None = None,
+    ) -> list[Match]:
+        """
+        Returns the (up to limit) ingredients best matching the text, best first,
+        with a score of at least the threshold. The text is singularised by the
+        rules of its language, or if it isn't given, by those of each language,
+        keeping the best score.
+
+        The score is the mean of how much of a name's trigrams the text contains,
+        and the trigram similarity (Jaccard index) of the two. So "fresh
+        blueberries" matches "blueberry" better than "berry", and "chicken stock"
+        matches "chicken stock" better than "chicken".
+        """
+        languages = [language] if language else [None, *_PLURAL_LANGUAGES]
+        queries = {normalise(text, lang) for lang in languages} - {""}
+        if not queries:
+            return []
+
+        with self._lock:
+            exact = {
+                id: query
+                for query in queries
+                for id in self._ingredients.get(query, ())
+            }
+            if exact:
+                return [Match(id, exact[id], 1.0) for id in sorted(exact)][:limit]
+
+            scores: dict[int, tuple[float, str]] = {}
+            for query in queries:
+                self._score(query, threshold, scores)
+
+        matches = [Match(id, name, score) for id, (score, name) in scores.items()]
+        matches.sort(key=lambda match: (-match.score, match.ingredient_id))
+        return matches[:limit]
+
+    def _score(
+        self, query: str, threshold: float, scores: dict[int, tuple[float, str]]
+    ):
+        """Keeps the best scoring name of each ingredient the query matches"""
+        query_trigrams = trigrams(query)
+        shared = Counter(
+            name
+            for trigram in query_trigrams
+            for name in self._postings.get(trigram, ())
+        )
+        for name, n_shared in shared.items():
+            n_name = len(self._trigrams[name])
+            contained = n_shared / n_name
+            similarity = n_shared / (n_name + len(query_trigrams) - n_shared)
+            score = (contained + similarity) / 2
+            if score < threshold:
+                continue
+            for ingredient_id in self._ingredients[name]:
+                if score > scores.get(ingredient_id, (0.0, ""))[0]:
+                    scores[ingredient_id] = (score, name)
+
+
+_matcher: IngredientMatcher | None = None
+_matcher_built_at = 0.0
+_matcher_lock = threading.Lock()
+
+
+def get_matcher() -> IngredientMatcher:
+    """Returns the matcher of all ingredients, building it on first use"""
+    with _matcher_lock:
+        expired = (
+            time.monotonic() - _matcher_built_at > settings.INGREDIENT_MATCHER_MAX_AGE
+        )
+        if _matcher is None or expired:
+            refresh_matcher()
+        return cast(IngredientMatcher, _matcher)
+
+
+def refresh_matcher():
+    """Rebuilds the matcher from the database, e.g. after bulk changes"""
+    global _matcher, _matcher_built_at
+    _matcher = _build_matcher()
+    _matcher_built_at = time.monotonic()
+
+
+def _build_matcher() -> IngredientMatcher:
+    from recipes.models import Ingredient
+
+    return IngredientMatcher(
+        (ingredient.id, ingredient.get_names_by_language())
+        for ingredient in Ingredient.objects.all()
+    )
+
+
+def ingredient_saved(ingredient_id: int, names: dict[str, str | None]):
+    # Only once committed, so rolled back writes aren't matched
+    if _matcher is not None:
+        transaction.on_commit(lambda: _matcher and _matcher.add(ingredient_id, names))
+
+
+def ingredient_deleted(ingredient_id: int):
+    if _matcher is not None:
+        transaction.on_commit(lambda: _matcher and _matcher.remove(ingredient_id))
@@ -0,0 +1,93 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.scraping.base import UNIT_STRINGS
+from recipes.scraping.parsing import VULGAR_FRACTIONS, parse_ingredient_line
+
+NAMES = [
+    "salt",
+    "all-purpose flour",
+    "Grated parmesan (optional)",
+    "hvetemel",
+    "smør, romtemperert",
+    "Zucker",
+    "huile d'olive",
+    "cloves garlic, minced",
+]
+
+
+def _sample_line(rng: random.Random) -> tuple[str, float | None, str, str]:
+    """A random ingredient line, with its amount, unit and name"""
+    name = rng.choice(NAMES)
+    whole = rng.randint(1, 20)
+    numerator, denominator = rng.choice([(1, 2), (1, 3), (3, 4), (1, 8)])
+    fraction, value = rng.choice(list(VULGAR_FRACTIONS.items()))
+    amount_str, amount = rng.choice(
+        [
+            (str(whole), whole),
+            (f"{whole},5", whole + 0.5),
+            (f"{whole}.25", whole + 0.25),
+            (f"{numerator}/{denominator}", numerator / denominator),
+            (f"{whole} {numerator}/{denominator}", whole + numerator / denominator),
+            (fraction, value),
+            (f"{whole}{fraction}", whole + value),
+            (f"{whole}-{whole + 2}", whole),
+            ("", None),
+        ]
+    )
+    if amount is None:
+        return name, None, "", name
+    unit_str, unit = rng.choice(list(UNIT_STRINGS.items()))
+    line = " ".join(part for part in [amount_str, unit_str, name] if part)
+    return line, amount, unit if unit_str else "", name
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput and accuracy of the ingredient line parser, on "
+        "a corpus of random lines mixing every amount format and unit spelling, "
+        "or on the lines of a file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines", type=int, default=100_000, help="Size of the random corpus"
+        )
+        parser.add_argument(
+            "--file",
+            help="Parse the lines of this file instead. Accuracy isn't measured",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            with open(options["file"], encoding="utf-8") as f:
+                lines = [line.strip() for line in f if line.strip()]
+            expected = None
+        else:
+            rng = random.Random(options["seed"])
+            samples = [_sample_line(rng) for _ in range(options["lines"])]
+            lines = [sample[0] for sample in samples]
+            expected = [sample[1:] for sample in samples]
+
+        start = time.perf_counter()
+        parsed = [parse_ingredient_line(line) for line in lines]
+        elapsed = time.perf_counter() - start
+
+        with_amount = sum(line.amount is not None for line in parsed)
+        self.stdout.write(
+            f"{len(lines)} lines in {elapsed * 1000:.0f} ms "
+            f"({len(lines) / elapsed:,.0f} lines/s, "
+            f"{elapsed / len(lines) * 1e6:.1f} µs/line)\n"
+            f"{with_amount / len(lines):.1%} had an amount"
+        )
+        if expected is not None:
+            correct = sum(
+                (line.unit, line.name) == (unit, name)
+                and (line.amount is None) == (amount is None)
+                and (amount is None or abs(line.amount - amount) < 1e-9)
+                for line, (amount, unit, name) in zip(parsed, expected)
+            )
+            self.stdout.write(f"{correct / len(lines):.2%} parsed correctly")
@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.models import EmbeddingVersion, RecipeEmbedding
+from recipes.services import nearest_recipe_embeddings
+
+K = 10
+
+
+def _index_size(name: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_relation_size(%s::regclass)", [name])
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the recall@10 and latency of searching an embedding version with "
+        "its vectors indexed at each precision. Queries are sampled from the "
+        "version's own pooled recipe embeddings, and compared with an exact search. Indexes "
+        "missing for a precision are built for the benchmark, then dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--version-id",
+            type=int,
+            help="Id of the embedding version to benchmark. Defaults to the active",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=100, help="Number of queries to run"
+        )
+        parser.add_argument(
+            "--precision",
+            action="append",
+            choices=EmbeddingVersion.Precisions.values,
+            help="Precision to benchmark. Can be repeated, defaults to all",
+        )
+        parser.add_argument(
+            "--keep-indexes",
+            action="store_true",
+            help="Keep the indexes built for the benchmark",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            if options["version_id"]:
+                version = EmbeddingVersion.objects.get(id=options["version_id"])
+            else:
+                version = EmbeddingVersion.get_active()
+        except EmbeddingVersion.DoesNotExist:
+            raise CommandError("No such embedding version")
+
+        ids, vectors = self._load(version)
+        if len(ids) < K:
+            raise CommandError(f"{version!r} has fewer than {K} recipes")
+
+        rng = np.random.default_rng(options["seed"])
+        queries = vectors[rng.choice(len(ids), options["queries"])]
+        # Exact nearest neighbours, by cosine similarity of normalised vectors
+        normalised = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarities = queries @ normalised.T
+        exact = ids[np.argsort(-similarities, axis=1)[:, :K]]
+
+        self.stdout.write(
+            f"{version!r}: {len(ids)} recipes, {len(queries)} queries\n"
+            f"{'precision':<10}{'index size':>12}{f'recall@{K}':>12}"
+            f"{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        for precision in options["precision"] or EmbeddingVersion.Precisions.values:
+            index_name = version.vector_index(precision).name
+            built = not self._has_index(index_name)
+            if built:
+                version.create_index(precision)
+            try:
+                recalls, latencies = self._run(version, precision, queries, exact)
+                size = _index_size(index_name)
+            finally:
+                if built and not options["keep_indexes"]:
+                    version.drop_index(precision)
+
+            self.stdout.write(
+                f"{precision:<10}{size / 1024**2:>10.1f}MB{np.mean(recalls):>12.3f}"
+                f"{np.percentile(latencies, 50):>10.2f}"
+                f"{np.percentile(latencies, 95):>10.2f}"
+            )
+
+    def _load(self, version: EmbeddingVersion) -> tuple[np.ndarray, np.ndarray]:
+        rows = version.embeddings.filter(kind=RecipeEmbedding.Kinds.RECIPE).values_list(
+            "id", "embedding"
+        )
+        ids = np.array([row[0] for row in rows])
+        vectors = np.array([row[1] for row in rows], dtype=np.float32)
+        return ids, vectors
+
+    def _has_index(self, name: str) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+            return cursor.fetchone()[0]
+
+    def _run(
+        self,
+        version: EmbeddingVersion,
+        precision: str,
+        queries: np.ndarray,
+        exact: np.ndarray,
+    ) -> tuple[list[float], list[float]]:
+        recalls, latencies = [], []
+        for query, expected in zip(queries, exact):
+            start = time.perf_counter()
+            found = list(
+                nearest_recipe_embeddings(version, query, precision).values_list(
+                    "id", flat=True
+                )[:K]
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(set(found) & set(expected)) / K)
+        return recalls, latencies
@@ -0,0 +1,152 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from recipes.models import EmbeddingVersion, Recipe, RecipeEmbedding
+from recipes.services import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Lists the embedding versions, or activates, reindexes, retires or prunes "
+        "them. "
+        "New versions are created and filled by the reembed_recipes command."
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_mutually_exclusive_group()
+        actions.add_argument(
+            "--activate",
+            type=int,
+            metavar="ID",
+            help="Switch search over to the version, retiring the active one",
+        )
+        actions.add_argument(
+            "--reindex",
+            type=int,
+            metavar="ID",
+            help="Index the version's vectors at the precision given by --precision",
+        )
+        actions.add_argument(
+            "--retire",
+            type=int,
+            metavar="ID",
+            help="Stop keeping a filling version up to date",
+        )
+        actions.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete the retired versions and their embeddings",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Activate the version even if some recipes aren't embedded by it",
+        )
+        parser.add_argument(
+            "--precision",
+            choices=EmbeddingVersion.Precisions.values,
+            help="Precision to index at when reindexing",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Number of embeddings deleted per transaction when pruning",
+        )
+
+    def handle(self, *args, **options):
+        if options["activate"]:
+            self._activate(self._get_version(options["activate"]), options["force"])
+        elif options["reindex"]:
+            self._reindex(self._get_version(options["reindex"]), options["precision"])
+        elif options["retire"]:
+            self._retire(self._get_version(options["retire"]))
+        elif options["prune"]:
+            self._prune(options["batch_size"])
+        else:
+            self._list()
+
+    def _get_version(self, version_id: int) -> EmbeddingVersion:
+        try:
+            return EmbeddingVersion.objects.get(id=version_id)
+        except EmbeddingVersion.DoesNotExist:
+            raise CommandError(f"No embedding version with id {version_id}")
+
+    def _list(self):
+        n_recipes = Recipe.objects.count()
+        versions = EmbeddingVersion.objects.annotate(
+            n_recipes=Count("embeddings__recipe", distinct=True)
+        ).order_by("id")
+        for version in versions:
+            self.stdout.write(
+                f"{version.id}\t{version.state}\t{version.backend}/{version.model} "
+                f"({version.dimensions} dimensions, {version.precision} precision)\t"
+                f"{version.n_recipes}/{n_recipes} recipes"
+            )
+
+    def _activate(self, version: EmbeddingVersion, force: bool):
+        if version.state == EmbeddingVersion.States.ACTIVE:
+            raise CommandError(f"{version!r} is already active")
+
+        missing = Recipe.objects.exclude(embeddings__version=version).count()
+        if missing and not force:
+            raise CommandError(
+                f"{missing} recipes aren't embedded by {version!r}. Fill it using "
+                "the reembed_recipes command, or use --force"
+            )
+
+        version.create_index()
+        version.activate()
+        self.stdout.write(self.style.SUCCESS(f"Activated {version!r}"))
+        # Similar recipes are found using the active version
+        rebuild_similar_recipes(version)
+
+    def _reindex(self, version: EmbeddingVersion, precision: str | None):
+        if not precision:
+            raise CommandError("--reindex requires --precision")
+        if precision == version.precision:
+            raise CommandError(f"{version!r} is already indexed at {precision}")
+
+        # Build the new index before switching, so searches always have an index
+        old_precision = version.precision
+        version.create_index(precision)
+        version.precision = precision
+        version.save(update_fields=["precision"])
+        version.drop_index(old_precision)
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {version!r} at {precision} precision")
+        )
+
+    def _retire(self, version: EmbeddingVersion):
+        if version.state != EmbeddingVersion.States.FILLING:
+            raise CommandError(
+                f"{version!r} is not being filled. Active versions are retired by "
+                "activating another"
+            )
+
+        version.state = EmbeddingVersion.States.RETIRED
+        version.save(update_fields=["state"])
+        self.stdout.write(self.style.SUCCESS(f"Retired {version!r}"))
+
+    def _prune(self, batch_size: int):
+        retired = EmbeddingVersion.objects.filter(state=EmbeddingVersion.States.RETIRED)
+        for version in retired:
+            # Dropping the indexes first saves updating them for every deleted row
+            for precision in EmbeddingVersion.Precisions.values:
+                version.drop_index(precision)
+
+            # Delete in batches to keep transactions and locks short
+            embeddings = RecipeEmbedding.objects.filter(version=version)
+            while ids := list(embeddings.values_list("id", flat=True)[:batch_size]):
+                RecipeEmbedding.objects.filter(id__in=ids).delete()
+
+            self.stdout.write(f"Pruned {version!r}")
+            version.delete()
+
+        # Deleted rows only free their space for reuse once vacuumed. VACUUM
+        # can't run in a transaction
+        if not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                cursor.execute(f"VACUUM ANALYZE {RecipeEmbedding._meta.db_table}")
+        self.stdout.write(self.style.SUCCESS("Pruned the retired versions"))
@@ -0,0 +1,113 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.ingredient_matching import get_matcher, normalise
+from recipes.models import Ingredient, IngredientNutrition, Recipe, RecipeIngredient
+from recipes.nutrition import NUTRIENTS, refresh_recipe_nutrition
+from recipes.services import MATCH_THRESHOLD
+
+
+def _number(value: str | None) -> float | None:
+    value = (value or "").strip()
+    # Some datasets use decimal commas
+    return float(value.replace(",", ".")) if value else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports the nutrition of ingredients, per 100 g, from a CSV file, then "
+        "computes the nutrition of the recipes using them again. The file needs "
+        "an ingredient_id or a name column, and any of the columns "
+        f"{', '.join(NUTRIENTS)}. Names are matched to ingredients' names in the "
+        "given language, or fuzzily to any of their names. Existing nutrition "
+        "is replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--language",
+            default="en",
+            choices=Recipe.Languages.codes(),
+            help="Language of the names in the file",
+        )
+        parser.add_argument("--delimiter", default=",")
+
+    def handle(self, *args, **options):
+        with open(options["path"], encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f, delimiter=options["delimiter"]))
+        if rows and not {"ingredient_id", "name"} & rows[0].keys():
+            raise CommandError("The file needs an ingredient_id or a name column")
+
+        ingredient_ids = self._ingredient_ids(rows, options["language"])
+        nutrition: dict[int, IngredientNutrition] = {}
+        unmatched = []
+        # Line 1 is the header
+        for line, (row, ingredient_id) in enumerate(zip(rows, ingredient_ids), 2):
+            if ingredient_id is None:
+                unmatched.append(row.get("name") or row.get("ingredient_id"))
+                continue
+            try:
+                values = {
+                    nutrient: _number(row.get(nutrient)) for nutrient in NUTRIENTS
+                }
+            except ValueError as e:
+                raise CommandError(f"Line {line}: {e}")
+            # Later rows for the same ingredient win
+            nutrition[ingredient_id] = IngredientNutrition(
+                ingredient_id=ingredient_id, **values
+            )
+
+        with transaction.atomic():
+            IngredientNutrition.objects.bulk_create(
+                nutrition.values(),
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["ingredient"],
+                update_fields=NUTRIENTS,
+            )
+            # Signals aren't sent for bulk writes
+            recipe_ids = set(
+                RecipeIngredient.objects.filter(
+                    base_ingredient_id__in=nutrition
+                ).values_list("recipe_id", flat=True)
+            )
+            n_recipes = refresh_recipe_nutrition(recipe_ids) if recipe_ids else 0
+
+        for name in unmatched:
+            self.stderr.write(f"No ingredient matches {name!r}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported the nutrition of {len(nutrition)} ingredients, and "
+                f"updated {n_recipes} recipes"
+            )
+        )
+
+    def _ingredient_ids(self, rows: list[dict], language: str) -> list[int | None]:
+        existing = set(Ingredient.objects.values_list("id", flat=True))
+        by_name: dict[str, int] = {
+            normalise(name, language): id
+            for id, name in Ingredient.objects.filter(
+                **{f"name_{language}__isnull": False}
+            ).values_list("id", f"name_{language}")
+        }
+        ids: list[int | None] = []
+        for row in rows:
+            if row.get("ingredient_id"):
+                ingredient_id = int(row["ingredient_id"])
+                ids.append(ingredient_id if ingredient_id in existing else None)
+            elif name := (row.get("name") or "").strip():
+                normalised = normalise(name, language)
+                if normalised in by_name:
+                    ids.append(by_name[normalised])
+                elif matches := get_matcher().match(
+                    name, limit=1, threshold=MATCH_THRESHOLD, language=language
+                ):
+                    ids.append(matches[0].ingredient_id)
+                else:
+                    ids.append(None)
+            else:
+                ids.append(None)
+        return ids
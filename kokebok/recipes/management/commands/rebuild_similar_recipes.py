@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import EmbeddingVersion
+from recipes.services import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the similar recipes of all recipes from the active embedding "
+        "version. Recipes are otherwise updated one at a time as they change, "
+        "which leaves some recipes with fewer similar recipes than they could have."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=512,
+            help="Number of recipes compared with all others at once. Memory use "
+            "grows with the block size times the number of recipes",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            version = EmbeddingVersion.get_active()
+        except EmbeddingVersion.DoesNotExist:
+            raise CommandError("No embedding version is active")
+        n_recipes = rebuild_similar_recipes(version, options["block_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Found similar recipes for {n_recipes} recipes")
+        )
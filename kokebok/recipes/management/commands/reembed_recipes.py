@@ -0,0 +1,249 @@
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.embedding import EmbeddingBackend, get_backend
+from recipes.models import EmbeddingVersion, Recipe, RecipeEmbedding
+from recipes.services import (
+    EMBEDDED_FIELDS,
+    build_recipe_embeddings,
+    rebuild_similar_recipes,
+    recipe_chunks,
+)
+
+# Pessimistic, as recipes are often non-English and contain numbers
+CHARS_PER_TOKEN = 2.5
+
+
+def _recipe_batches(after_id: int, batch_size: int) -> Iterator[list[Recipe]]:
+    """Yields all recipes with an id above after_id in id order, in batches"""
+    while True:
+        batch = list(
+            Recipe.objects.filter(id__gt=after_id)
+            .order_by("id")
+            .only("id", "language", "total_time", *EMBEDDED_FIELDS)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1].id
+
+
+def _recipe_chunks(recipe: Recipe) -> list[tuple[str, str]]:
+    return recipe_chunks({field: getattr(recipe, field) for field in EMBEDDED_FIELDS})
+
+
+class Command(BaseCommand):
+    help = (
+        "Embeds all recipes into a new embedding version using the configured "
+        "embedding backend, e.g. after changing model. Search keeps using the "
+        "active version until the new one is activated. Progress is checkpointed, "
+        "so an interrupted run continues where it left off when run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of recipes embedded and written per transaction",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Number of parallel requests to the embedding provider",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default="reembed_checkpoint.json",
+            help="File recording progress. Removed after a completed run",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Discard the checkpointed version and start over with a new one",
+        )
+        parser.add_argument(
+            "--activate",
+            action="store_true",
+            help="Switch search over to the new version once it is filled",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Estimate the number of tokens and the cost without embedding",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options["checkpoint"])
+        if options["dry_run"]:
+            self._estimate(_recipe_batches(0, options["batch_size"]), get_backend())
+            return
+
+        if options["restart"]:
+            self._discard_checkpoint(checkpoint)
+        version, after_id = self._read_checkpoint(checkpoint)
+        if after_id:
+            self.stdout.write(f"Resuming {version!r} after recipe {after_id}")
+        else:
+            self.stdout.write(f"Filling {version!r}")
+
+        backend = version.get_backend()
+        remaining = Recipe.objects.filter(id__gt=after_id).count()
+        done = 0
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            for batch in _recipe_batches(after_id, options["batch_size"]):
+                embeddings = self._embed(batch, version, backend, executor)
+                with transaction.atomic():
+                    self._write_embeddings(batch, version, embeddings)
+                self._write_checkpoint(checkpoint, version, batch[-1].id)
+
+                done += len(batch)
+                self.stdout.write(f"Embedded {done}/{remaining} recipes")
+
+        self.stdout.write("Building the vector index")
+        version.create_index()
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f"Embedded {done} recipes"))
+
+        if options["activate"]:
+            version.activate()
+            self.stdout.write(self.style.SUCCESS(f"Activated {version!r}"))
+            # Similar recipes are found using the active version
+            rebuild_similar_recipes(version)
+
+    def _embed(
+        self,
+        recipes: list[Recipe],
+        version: EmbeddingVersion,
+        backend: EmbeddingBackend,
+        executor: ThreadPoolExecutor,
+    ) -> list[RecipeEmbedding]:
+        chunks = [_recipe_chunks(recipe) for recipe in recipes]
+
+        # Embed the chunks of all the recipes together, in parallel requests
+        texts = [text for _, text in chain(*chunks)]
+        requests = [
+            texts[i : i + backend.batch_size]
+            for i in range(0, len(texts), backend.batch_size)
+        ]
+        vectors = list(chain(*executor.map(backend.embed_documents, requests)))
+
+        embeddings: list[RecipeEmbedding] = []
+        start = 0
+        for recipe, chunks_of_recipe in zip(recipes, chunks):
+            end = start + len(chunks_of_recipe)
+            embeddings += build_recipe_embeddings(
+                recipe, version, chunks_of_recipe, vectors[start:end]
+            )
+            start = end
+        return embeddings
+
+    def _write_embeddings(
+        self,
+        recipes: list[Recipe],
+        version: EmbeddingVersion,
+        embeddings: list[RecipeEmbedding],
+    ) -> None:
+        """
+        Replaces the version's embeddings of the recipes, except those of recipes
+        whose texts changed (or that were deleted) since they were read. Saving
+        the changed texts embedded them with every live version, this one
+        included, and those embeddings are newer than ours.
+        """
+        # Locked, so that the recipes can't change until the embeddings are written
+        current = {
+            recipe["id"]: recipe
+            for recipe in Recipe.objects.select_for_update()
+            .filter(id__in=[recipe.id for recipe in recipes])
+            .values("id", "language", "total_time", *EMBEDDED_FIELDS)
+        }
+        unchanged = {
+            recipe.id
+            for recipe in recipes
+            if recipe.id in current
+            and all(
+                current[recipe.id][field] == getattr(recipe, field)
+                for field in EMBEDDED_FIELDS
+            )
+        }
+        embeddings = [e for e in embeddings if e.recipe_id in unchanged]
+        for embedding in embeddings:
+            # The filters may have changed without the texts
+            if embedding.kind == RecipeEmbedding.Kinds.RECIPE:
+                embedding.language = current[embedding.recipe_id]["language"]
+                embedding.total_time = current[embedding.recipe_id]["total_time"]
+        version.embeddings.filter(recipe__in=unchanged).delete()
+        RecipeEmbedding.objects.bulk_create(embeddings)
+
+    def _estimate(self, batches: Iterator[list[Recipe]], backend: EmbeddingBackend):
+        n_recipes = n_texts = n_chars = 0
+        for batch in batches:
+            for recipe in batch:
+                texts = [text for _, text in _recipe_chunks(recipe)]
+                n_recipes += 1
+                n_texts += len(texts)
+                n_chars += sum(len(text) for text in texts)
+
+        tokens = math.ceil(n_chars / CHARS_PER_TOKEN)
+        cost = tokens / 1_000_000 * backend.price_per_million_tokens
+        self.stdout.write(
+            f"{n_recipes} recipes, {n_texts} texts in "
+            f"{math.ceil(n_texts / backend.batch_size)} requests to {backend.model}\n"
+            f"Estimated tokens: {tokens} (~${cost:.4f})"
+        )
+
+    def _read_checkpoint(self, path: Path) -> tuple[EmbeddingVersion, int]:
+        """
+        Returns the version being filled and the id of the last recipe embedded.
+        Without a checkpoint, a new version is created from the settings.
+        """
+        if not path.exists():
+            backend = get_backend()
+            version = EmbeddingVersion.objects.create(
+                backend=settings.EMBEDDING_BACKEND,
+                model=backend.model,
+                dimensions=backend.dimensions,
+                precision=settings.EMBEDDING_PRECISION,
+            )
+            return version, 0
+
+        data = json.loads(path.read_text())
+        version = EmbeddingVersion.objects.filter(
+            id=data["version_id"], state=EmbeddingVersion.States.FILLING
+        ).first()
+        if version is None:
+            raise CommandError(
+                f"The version in the checkpoint {path} is no longer being filled. "
+                "Use --restart to start over"
+            )
+        return version, data["last_id"]
+
+    def _write_checkpoint(
+        self, path: Path, version: EmbeddingVersion, last_id: int
+    ) -> None:
+        data = {"version_id": version.id, "last_id": last_id}
+        # Write to a temporary file first, so an interruption can't corrupt it
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
+
+    def _discard_checkpoint(self, path: Path) -> None:
+        """Deletes the checkpoint, and the partially filled version it refers to"""
+        if not path.exists():
+            return
+
+        data = json.loads(path.read_text())
+        EmbeddingVersion.objects.filter(
+            id=data["version_id"], state=EmbeddingVersion.States.FILLING
+        ).delete()
+        path.unlink()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.meal_plans import refresh_meal_plans
+from recipes.models import MealPlan, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Sums the ingredients of all meal plans again. They are otherwise kept up "
+        "to date as plans, recipes and ingredients change, except by writes that "
+        "skip signals, like bulk updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--language",
+            default="en",
+            choices=Recipe.Languages.codes(),
+            help="Language the ingredients are named in while summing",
+        )
+
+    def handle(self, *args, **options):
+        plan_ids = list(MealPlan.objects.values_list("id", flat=True))
+        refresh_meal_plans(plan_ids, options["language"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(plan_ids)} meal plans"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.nutrition import refresh_recipe_nutrition
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes the nutrition of all recipes again. It is otherwise kept up to "
+        "date as recipes and ingredients change, except by writes that skip "
+        "signals, like bulk updates."
+    )
+
+    def handle(self, *args, **options):
+        n_recipes = refresh_recipe_nutrition()
+        self.stdout.write(
+            self.style.SUCCESS(f"Computed the nutrition of {n_recipes} recipes")
+        )
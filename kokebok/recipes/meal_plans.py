@@ -0,0 +1,89 @@
+"""
+Upkeep of the summed ingredients of meal plans (MealPlanIngredient).
+
+Signal handlers in models.py report the meal plans, recipes and ingredients
+that change. Once the transaction commits, the ingredients of the meal plans
+affected, and only those, are summed again. Changes made in one transaction,
+like the updates of a recipe's ingredients, are handled together.
+"""
+
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.transactions import OnCommitBatch
+
+
+def _changed(kind: str, ids: Iterable[int | None]):
+    _changes.add({(kind, id): None for id in ids if id is not None})
+
+
+def plans_changed(plan_ids: Iterable[int | None]):
+    _changed("plans", plan_ids)
+
+
+def recipes_changed(recipe_ids: Iterable[int | None]):
+    _changed("recipes", recipe_ids)
+
+
+def ingredients_changed(ingredient_ids: Iterable[int | None]):
+    _changed("ingredients", ingredient_ids)
+
+
+def _refresh_changed(changes: dict[tuple[str, int], None]):
+    from recipes.models import MealPlanEntry
+
+    pending: dict[str, set[int]] = {
+        "plans": set(),
+        "recipes": set(),
+        "ingredients": set(),
+    }
+    for kind, id in changes:
+        pending[kind].add(id)
+
+    plan_ids = pending["plans"]
+    if pending["recipes"] or pending["ingredients"]:
+        ingredient_ids = pending["ingredients"]
+        plan_ids.update(
+            MealPlanEntry.objects.filter(
+                Q(recipe_id__in=pending["recipes"])
+                | Q(recipe__recipe_ingredients__base_ingredient_id__in=ingredient_ids)
+            ).values_list("plan_id", flat=True)
+        )
+    refresh_meal_plans(plan_ids)
+
+
+_changes = OnCommitBatch(_refresh_changed)
+
+
+def refresh_meal_plans(plan_ids: Iterable[int], language: str = "en"):
+    """
+    Sums the ingredients of the meal plans' recipes again. The ingredients are
+    named in the language while summing, which only affects the order of the
+    rows, as the stored sums refer to the ingredients rather than their names
+    """
+    from recipes.models import MealPlan, MealPlanEntry, MealPlanIngredient
+    from recipes.services import aggregate_shopping_list
+
+    for plan_id in sorted(set(plan_ids)):
+        with transaction.atomic():
+            # Lock the plan, so that concurrent refreshes don't interleave
+            if not MealPlan.objects.select_for_update().filter(id=plan_id).exists():
+                continue  # Deleted
+            entries = MealPlanEntry.objects.filter(plan_id=plan_id).values_list(
+                "recipe_id", "servings"
+            )
+            rows = aggregate_shopping_list(entries, language)
+            MealPlanIngredient.objects.filter(plan_id=plan_id).delete()
+            MealPlanIngredient.objects.bulk_create(
+                MealPlanIngredient(
+                    plan_id=plan_id,
+                    ingredient_id=row["ingredient_id"],
+                    unit=row["unit"],
+                    is_optional=row["is_optional"],
+                    amount=row["amount"],
+                    recipe_ids=row["recipe_ids"],
+                )
+                for row in rows
+            )
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-19 16:42
+
+from django.db import migrations, models
+
+
+def record_existing_objects(apps, schema_editor):
+    """Existing recipes and ingredients are given entries so that clients can sync them"""
+    ChangeLogEntry = apps.get_model("recipes", "ChangeLogEntry")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Ingredient = apps.get_model("recipes", "Ingredient")
+
+    ChangeLogEntry.objects.bulk_create(
+        [
+            ChangeLogEntry(kind="ingredient", object_id=pk)
+            for pk in Ingredient.objects.order_by("id").values_list("id", flat=True)
+        ]
+        + [
+            ChangeLogEntry(kind="recipe", object_id=pk)
+            for pk in Recipe.objects.order_by("id").values_list("id", flat=True)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_remove_recipeingredient_group_name_not_empty_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Recipe'), ('ingredient', 'Ingredient')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='changelogentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='one change entry per object'),
+        ),
+        migrations.RunPython(record_existing_objects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:06
+
+import django.db.models.deletion
+import pgvector.django
+from django.contrib.postgres.indexes import OpClass
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def create_active_version(apps, schema_editor):
+    """
+    Existing embeddings were all made with Cohere's multilingual model, so make
+    it the active version. The values are fixed here rather than read from the
+    settings, which may have changed by the time the migration is run.
+    """
+    EmbeddingVersion = apps.get_model("recipes", "EmbeddingVersion")
+    RecipeEmbedding = apps.get_model("recipes", "RecipeEmbedding")
+
+    version = EmbeddingVersion.objects.create(
+        backend="cohere",
+        model="embed-multilingual-v3.0",
+        dimensions=1024,
+        state="active",
+    )
+    RecipeEmbedding.objects.update(version=version)
+    # Check the new foreign keys now, as pending checks block altering the table
+    schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    typed_embedding = Cast(
+        "embedding", pgvector.django.VectorField(dimensions=version.dimensions)
+    )
+    index = pgvector.django.HnswIndex(
+        OpClass(typed_embedding, name="vector_cosine_ops"),
+        name=f"recipe_embeddings_v{version.pk}",
+        condition=models.Q(version_id=version.pk),
+    )
+    schema_editor.add_index(RecipeEmbedding, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=255)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('state', models.CharField(choices=[('filling', 'Filling'), ('active', 'Active'), ('retired', 'Retired')], default='filling', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='recipeembedding',
+            name='recipe_embeddings_ivf',
+        ),
+        migrations.AlterField(
+            model_name='recipeembedding',
+            name='embedding',
+            field=pgvector.django.VectorField(),
+        ),
+        migrations.AddConstraint(
+            model_name='embeddingversion',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'active')), fields=('state',), name='one active embedding version'),
+        ),
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='version',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='recipes.embeddingversion'),
+        ),
+        migrations.RunPython(create_active_version, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipeembedding',
+            name='version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='recipes.embeddingversion'),
+        ),
+    ]
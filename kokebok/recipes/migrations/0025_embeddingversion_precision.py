@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:14
+
+from django.db import migrations, models
+
+
+def rename_indexes(apps, schema_editor, old_suffix="", new_suffix="_full"):
+    """Vector index names now include the precision, all existing ones are full"""
+    EmbeddingVersion = apps.get_model("recipes", "EmbeddingVersion")
+    for version_id in EmbeddingVersion.objects.values_list("id", flat=True):
+        old_name = schema_editor.quote_name(f"recipe_embeddings_v{version_id}{old_suffix}")
+        new_name = schema_editor.quote_name(f"recipe_embeddings_v{version_id}{new_suffix}")
+        schema_editor.execute(f"ALTER INDEX IF EXISTS {old_name} RENAME TO {new_name}")
+
+
+def unrename_indexes(apps, schema_editor):
+    rename_indexes(apps, schema_editor, old_suffix="_full", new_suffix="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_embeddingversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embeddingversion',
+            name='precision',
+            field=models.CharField(choices=[('full', 'Full'), ('half', 'Half'), ('binary', 'Binary')], default='full', max_length=16),
+        ),
+        migrations.RunPython(rename_indexes, unrename_indexes),
+    ]
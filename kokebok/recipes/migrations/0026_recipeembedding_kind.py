@@ -0,0 +1,66 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:19
+
+import re
+
+from django.db import migrations, models
+
+
+def pool_embeddings(apps, schema_editor):
+    """
+    Adds the pooled embedding of every recipe. The fields chunks came from
+    weren't recorded, so they are weighted equally here. Re-embed the recipes
+    (see the reembed_recipes command) for the field weights to apply.
+    """
+    table = schema_editor.quote_name("recipes_recipeembedding")
+    schema_editor.execute(
+        f"INSERT INTO {table} (recipe_id, version_id, kind, embedding) "
+        f"SELECT recipe_id, version_id, 'recipe', l2_normalize(avg(embedding)) "
+        f"FROM {table} GROUP BY recipe_id, version_id"
+    )
+
+    # The vector indexes only need to cover the pooled embeddings
+    rebuild_indexes(schema_editor, "version_id = {} AND kind = 'recipe'")
+
+
+def unpool_embeddings(apps, schema_editor):
+    RecipeEmbedding = apps.get_model("recipes", "RecipeEmbedding")
+    RecipeEmbedding.objects.filter(kind="recipe").delete()
+    rebuild_indexes(schema_editor, "version_id = {}")
+
+
+def rebuild_indexes(schema_editor, condition):
+    """
+    Rebuilds the vector indexes with the condition, formatted with their version's
+    id. Their definitions are otherwise reused, as they depend on the version
+    """
+    # Check new foreign keys now, as pending checks block altering the table
+    schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = 'recipes_recipeembedding' AND indexname ~ %s",
+            [r"^recipe_embeddings_v\d+_"],
+        )
+        indexes = cursor.fetchall()
+
+    for name, definition in indexes:
+        version_id = re.match(r"recipe_embeddings_v(\d+)_", name)[1]
+        definition = definition.split(" WHERE ")[0]
+        schema_editor.execute(f"DROP INDEX {schema_editor.quote_name(name)}")
+        schema_editor.execute(f"{definition} WHERE {condition.format(version_id)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0025_embeddingversion_precision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='kind',
+            field=models.CharField(choices=[('chunk', 'Chunk'), ('recipe', 'Recipe')], default='chunk', max_length=16),
+        ),
+        migrations.RunPython(pool_embeddings, unpool_embeddings),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:27
+
+from itertools import groupby
+
+from django.db import migrations, models
+
+EMBEDDED_FIELDS = ("title", "preamble", "instructions", "rest_text")
+
+
+def chunk_texts(texts):
+    """The chunking of recipe texts when this migration was written"""
+    chunks = []
+    for text in texts:
+        if len(text) > 1024:
+            chunks += [
+                s.strip()
+                for s in text.strip().split("\n")
+                if s.strip() and len(s) > 12
+            ]
+        else:
+            chunks.append(text)
+    return chunks
+
+
+def fill_texts(apps, schema_editor):
+    """
+    Recovers the text of existing chunks by chunking their recipe again, as
+    chunks were embedded in field order. Recipes whose number of chunks differs,
+    e.g. as they were embedded with another chunking, are left blank until they
+    are re-embedded.
+    """
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeEmbedding = apps.get_model("recipes", "RecipeEmbedding")
+
+    chunks = RecipeEmbedding.objects.filter(kind="chunk").order_by(
+        "recipe_id", "version_id", "id"
+    )
+    for recipe_id, embeddings_of_recipe in groupby(
+        chunks.only("id", "recipe_id", "version_id").iterator(),
+        key=lambda e: e.recipe_id,
+    ):
+        recipe = Recipe.objects.get(id=recipe_id)
+        texts = [
+            (field, chunk)
+            for field in EMBEDDED_FIELDS
+            if getattr(recipe, field)
+            for chunk in chunk_texts([getattr(recipe, field)])
+        ]
+        updated = []
+        for _, embeddings in groupby(embeddings_of_recipe, key=lambda e: e.version_id):
+            embeddings = list(embeddings)
+            if len(embeddings) != len(texts):
+                continue
+            for embedding, (field, text) in zip(embeddings, texts):
+                embedding.field, embedding.text = field, text
+                updated.append(embedding)
+        RecipeEmbedding.objects.bulk_update(updated, ["field", "text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0027_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='field',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(fill_texts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:31
+
+from django.db import migrations, models
+
+
+def copy_filter_fields(apps, schema_editor):
+    """Copies the filterable fields of recipes onto their pooled embeddings"""
+    schema_editor.execute(
+        "UPDATE recipes_recipeembedding AS embedding "
+        "SET language = recipe.language, total_time = recipe.total_time "
+        "FROM recipes_recipe AS recipe "
+        "WHERE embedding.recipe_id = recipe.id AND embedding.kind = 'recipe'"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0028_recipeembedding_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='language',
+            field=models.CharField(blank=True, default=None, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipeembedding',
+            name='total_time',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(copy_filter_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipeembedding',
+            index=models.Index(condition=models.Q(('kind', 'recipe')), fields=['version', 'language', 'total_time'], name='recipe_embedding_filters'),
+        ),
+    ]
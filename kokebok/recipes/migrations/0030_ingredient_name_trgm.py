@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:35
+
+import django.contrib.postgres.indexes
+import recipes.models
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0029_recipeembedding_filters'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        # unaccent() is only stable, as its dictionary can be changed, so it
+        # can't be used in indexes without an immutable wrapper
+        migrations.RunSQL(
+            "CREATE FUNCTION immutable_unaccent(text) RETURNS text AS "
+            "$$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$ "
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+            "DROP FUNCTION immutable_unaccent(text)",
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(recipes.models.Normalised('name_no'), name='gin_trgm_ops'), name='ingredient_name_no_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(recipes.models.Normalised('name_en'), name='gin_trgm_ops'), name='ingredient_name_en_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(recipes.models.Normalised('name_de'), name='gin_trgm_ops'), name='ingredient_name_de_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(recipes.models.Normalised('name_fr'), name='gin_trgm_ops'), name='ingredient_name_fr_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(recipes.models.Normalised('name_it'), name='gin_trgm_ops'), name='ingredient_name_it_trgm'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:51
+
+import django.core.validators
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0030_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='density',
+            field=models.FloatField(blank=True, default=None, null=True, validators=[django.core.validators.MinValueValidator(0.0)]),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='canonical_amount',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1.0)), unit='g'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1000.0)), unit='kg'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(28.349523125)), unit='oz'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(453.59237)), unit='lb'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1.0)), unit='ml'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(10.0)), unit='cl'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(100.0)), unit='dl'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1000.0)), unit='l'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(4.92892159375)), unit='tsp'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(14.78676478125)), unit='tbsp'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(236.5882365)), unit='cup'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1.0)), unit='count'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1.0)), unit='slice'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(1.0)), unit='cm'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('base_amount'), '*', models.Value(2.54)), unit='inch'), default=None), output_field=models.FloatField(blank=True, null=True)),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='canonical_unit',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=models.Value('g'), unit='g'), models.When(then=models.Value('g'), unit='kg'), models.When(then=models.Value('g'), unit='oz'), models.When(then=models.Value('g'), unit='lb'), models.When(then=models.Value('ml'), unit='ml'), models.When(then=models.Value('ml'), unit='cl'), models.When(then=models.Value('ml'), unit='dl'), models.When(then=models.Value('ml'), unit='l'), models.When(then=models.Value('ml'), unit='tsp'), models.When(then=models.Value('ml'), unit='tbsp'), models.When(then=models.Value('ml'), unit='cup'), models.When(then=models.Value('count'), unit='count'), models.When(then=models.Value('slice'), unit='slice'), models.When(then=models.Value('cm'), unit='cm'), models.When(then=models.Value('cm'), unit='inch'), default=models.Value('')), output_field=models.CharField(blank=True, max_length=16)),
+        ),
+    ]
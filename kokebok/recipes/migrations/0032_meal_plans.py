@@ -0,0 +1,53 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:56
+
+import django.contrib.postgres.fields
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0031_recipe_ingredient_canonical_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MealPlanIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(blank=True, max_length=16)),
+                ('is_optional', models.BooleanField()),
+                ('amount', models.FloatField(null=True)),
+                ('recipe_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='recipes.mealplan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MealPlanEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('servings', models.IntegerField(blank=True, default=None, null=True, validators=[django.core.validators.MinValueValidator(1)])),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='recipes.mealplan')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plan_entries', to='recipes.recipe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['plan', 'date'], name='meal_plan_entry_date')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mealplaningredient',
+            constraint=models.UniqueConstraint(fields=('plan', 'ingredient', 'unit', 'is_optional'), name='unique meal plan ingredient'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:59
+
+import django.db.models.deletion
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0032_meal_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientNutrition',
+            fields=[
+                ('energy_kcal', models.FloatField(blank=True, null=True)),
+                ('fat', models.FloatField(blank=True, null=True)),
+                ('saturated_fat', models.FloatField(blank=True, null=True)),
+                ('carbohydrate', models.FloatField(blank=True, null=True)),
+                ('sugar', models.FloatField(blank=True, null=True)),
+                ('fiber', models.FloatField(blank=True, null=True)),
+                ('protein', models.FloatField(blank=True, null=True)),
+                ('salt', models.FloatField(blank=True, null=True)),
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='nutrition', serialize=False, to='recipes.ingredient')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeNutrition',
+            fields=[
+                ('energy_kcal', models.FloatField(blank=True, null=True)),
+                ('fat', models.FloatField(blank=True, null=True)),
+                ('saturated_fat', models.FloatField(blank=True, null=True)),
+                ('carbohydrate', models.FloatField(blank=True, null=True)),
+                ('sugar', models.FloatField(blank=True, null=True)),
+                ('fiber', models.FloatField(blank=True, null=True)),
+                ('protein', models.FloatField(blank=True, null=True)),
+                ('salt', models.FloatField(blank=True, null=True)),
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='nutrition', serialize=False, to='recipes.recipe')),
+                ('servings', models.IntegerField(null=True)),
+                ('mass', models.FloatField(null=True)),
+                ('coverage', models.FloatField()),
+                ('energy_kcal_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('energy_kcal'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('fat_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('fat'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('saturated_fat_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('saturated_fat'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('carbohydrate_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('carbohydrate'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('sugar_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('sugar'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('fiber_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('fiber'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('protein_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('protein'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+                ('salt_per_serving', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('salt'), '/', django.db.models.functions.comparison.NullIf('servings', models.Value(0))), output_field=models.FloatField(null=True))),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -1,17 +1,35 @@
 import io
+import logging
 import sys
-from typing import cast
+from typing import Iterable, cast
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models import Func, Q
 from django.db.models.fields.files import FileDescriptor, ImageFieldFile
+from django.db.models.functions import Cast, NullIf
 from django.dispatch import receiver
 from django.forms import ValidationError
-from pgvector.django import IvfflatIndex, VectorField
+from pgvector.django import CosineDistance, HnswIndex, VectorField
 from PIL import Image, UnidentifiedImageError
 
+from core.transactions import OnCommitBatch
+from recipes import ingredient_matching, meal_plans, nutrition, units
+from recipes.caching import invalidate_recipe_detail
+from recipes.embedding import EmbeddingBackend, load_backend
+from recipes.vectors import (
+    BinaryQuantize,
+    BitField,
+    HalfVectorField,
+    HammingDistance,
+    quantized_query,
+)
+
+logger = logging.getLogger(__name__)
+
 
 class Recipe(models.Model):
     class Languages(models.Choices):
@@ -67,7 +85,13 @@ class Recipe(models.Model):
     # For specifying any other sources: books, people, ...
     other_source = models.CharField(max_length=256, blank=True, null=True, default=None)
 
+    tags = models.ManyToManyField(
+        to="Tag", through="RecipeTag", related_name="recipes", blank=True
+    )
+
     class Meta:
+        # For filtering by time, see RecipeFilterSchema
+        indexes = [models.Index(fields=["total_time"], name="recipe_total_time")]
         constraints = [
             models.CheckConstraint(check=~Q(title__exact=""), name="title not empty"),
             models.CheckConstraint(
@@ -117,11 +141,8 @@ def recipe_thumbnail_updater(sender: type[Recipe], instance: Recipe, **kwargs):
 
     def make_thumbnail(image: ImageFieldFile):
         # Thanks to https://stackoverflow.com/a/12309950 for implementation
-        print(image.name)
-        print(image.size)
+        logger.debug("Making thumbnail of %s", image.name)
         img = image.open("rb")
-        for line in img:
-            print(line)
 
         thumb_img = Image.open(img)
         thumb_img.thumbnail((512, 512))  # TODO: Figure out good thumbnail size
@@ -158,6 +179,12 @@ def recipe_thumbnail_updater(sender: type[Recipe], instance: Recipe, **kwargs):
     #         instance._replaced_image_fields = [existing.hero_image, existing.thumbnail]
 
 
+@receiver(models.signals.post_save, sender=Recipe)
+@receiver(models.signals.post_delete, sender=Recipe)
+def recipe_cache_invalidator(instance: Recipe, **kwargs):
+    invalidate_recipe_detail(instance.pk)
+
+
 # TODO: see if this can be done in the delete method using transaction.on_commit
 # see: https://forum.djangoproject.com/t/pointers-and-tips-for-testing-imagefield-and-filefield-incl-deletion/11949/4
 @receiver(models.signals.post_save, sender=Recipe)
@@ -173,6 +200,18 @@ def delete_replaced_images(sender: type[Recipe], instance: Recipe, **kwargs):
     transaction.on_commit(do_delete)
 
 
+class Normalised(Func):
+    """
+    Lowercased text without accents, which ingredient names are indexed and
+    searched by. unaccent() isn't immutable, as its dictionary can change, so
+    it is wrapped by an immutable function for use in indexes (see migration
+    0030)
+    """
+
+    template = "lower(immutable_unaccent(%(expressions)s))"
+    output_field = models.TextField()
+
+
 class Ingredient(models.Model):
     # unique=True means that indexes are created automatically for these fields
     name_no = models.CharField(max_length=64, unique=True, null=True, blank=True)
@@ -181,6 +220,21 @@ class Ingredient(models.Model):
     name_fr = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name_it = models.CharField(max_length=64, unique=True, null=True, blank=True)
     is_ubiquitous = models.BooleanField(default=False)
+    # In g/ml, for converting between volumes and masses of the ingredient
+    density = models.FloatField(
+        null=True, blank=True, default=None, validators=[MinValueValidator(0.0)]
+    )
+
+    class Meta:
+        # Trigram indexes of the normalised names, for searching by prefix and
+        # similarity (see services.search_ingredients)
+        indexes = [
+            GinIndex(
+                OpClass(Normalised(f"name_{code}"), name="gin_trgm_ops"),
+                name=f"ingredient_name_{code}_trgm",
+            )
+            for code in Recipe.Languages.codes()
+        ]
 
     def get_names(self) -> list[str | None]:
         """
@@ -192,6 +246,16 @@ class Ingredient(models.Model):
             if field.name.startswith("name_")
         ]
 
+    def get_names_by_language(self) -> dict[str, str | None]:
+        """
+        Returns the names of the ingredient keyed by their language code
+        """
+        return {
+            field.name.removeprefix("name_"): self.__getattribute__(field.name)
+            for field in self._meta.fields
+            if field.name.startswith("name_")
+        }
+
     def clean(self):
         if not any(self.get_names()):
             raise ValidationError("Ingredient must have at least one name!")
@@ -204,6 +268,16 @@ class Ingredient(models.Model):
         return repr(self)
 
 
+@receiver(models.signals.post_save, sender=Ingredient)
+def ingredient_matcher_updater(instance: Ingredient, **kwargs):
+    ingredient_matching.ingredient_saved(instance.pk, instance.get_names_by_language())
+
+
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_matcher_remover(instance: Ingredient, **kwargs):
+    ingredient_matching.ingredient_deleted(instance.pk)
+
+
 class RecipeIngredient(models.Model):
     class Units(models.TextChoices):
         # Weight
@@ -255,6 +329,31 @@ class RecipeIngredient(models.Model):
         default=Units.BLANK,
     )
 
+    # The amount in the canonical unit of the unit's dimension (g, ml, ...), kept
+    # by the database for summing amounts across recipes. See units.py
+    canonical_amount = models.GeneratedField(
+        expression=models.Case(
+            *(
+                models.When(unit=unit, then=models.F("base_amount") * float(factor))
+                for unit, (_, factor) in units.UNITS.items()
+            ),
+            default=None,
+        ),
+        output_field=models.FloatField(null=True, blank=True),
+        db_persist=True,
+    )
+    canonical_unit = models.GeneratedField(
+        expression=models.Case(
+            *(
+                models.When(unit=unit, then=models.Value(units.canonical_unit(unit)))
+                for unit in units.UNITS
+            ),
+            default=models.Value(""),
+        ),
+        output_field=models.CharField(max_length=16, blank=True),
+        db_persist=True,
+    )
+
     def __repr__(self) -> str:
         return f"<{self.recipe.title}: {self.name_in_recipe}>"
 
@@ -262,21 +361,544 @@ class RecipeIngredient(models.Model):
         return f"{self.recipe.title}: {self.name_in_recipe}"
 
 
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+def recipe_ingredient_cache_invalidator(instance: RecipeIngredient, **kwargs):
+    """Recipe ingredients are cached as part of their recipe"""
+    invalidate_recipe_detail(instance.recipe_id)
+
+
+class EmbeddingVersion(models.Model):
+    """
+    An embedding model (backend, model and vector size) recipes are embedded with.
+
+    Search uses the active version. A new version is filled in the background by
+    the reembed_recipes command while search keeps using the active one, then
+    activated, which switches search over in a single transaction. The previously
+    active version is retired, and its embeddings can then be pruned.
+
+    Each version's embeddings get their own partial vector index (see
+    `vector_index`), as vectors of different sizes can't share an index. It is
+    built once the version is filled, as building it is much faster than
+    updating it row by row. Indexing at a lower precision shrinks the index, at
+    the cost of some recall.
+    """
+
+    class States(models.TextChoices):
+        FILLING = "filling"
+        ACTIVE = "active"
+        RETIRED = "retired"
+
+    class Precisions(models.TextChoices):
+        """
+        The precision vectors are indexed at. The embeddings themselves are kept
+        at full precision, so lower precision searches re-rank their candidates.
+        """
+
+        FULL = "full"  # 4 bytes per dimension
+        HALF = "half"  # 2 bytes per dimension
+        BINARY = "binary"  # 1 bit per dimension, compared by Hamming distance
+
+    OPCLASSES = {
+        Precisions.FULL: "vector_cosine_ops",
+        Precisions.HALF: "halfvec_cosine_ops",
+        Precisions.BINARY: "bit_hamming_ops",
+    }
+
+    backend = models.CharField(max_length=32)
+    model = models.CharField(max_length=255)
+    dimensions = models.PositiveIntegerField()
+    state = models.CharField(
+        max_length=16, choices=States.choices, default=States.FILLING
+    )
+    precision = models.CharField(
+        max_length=16, choices=Precisions.choices, default=Precisions.FULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["state"],
+                condition=Q(state="active"),
+                name="one active embedding version",
+            ),
+        ]
+
+    @classmethod
+    def get_active(cls) -> "EmbeddingVersion":
+        return cls.objects.get(state=cls.States.ACTIVE)
+
+    @classmethod
+    def live(cls) -> models.QuerySet["EmbeddingVersion"]:
+        """Versions kept up to date when recipes change: the active and filling ones"""
+        return cls.objects.exclude(state=cls.States.RETIRED)
+
+    def get_backend(self) -> EmbeddingBackend:
+        return load_backend(self.backend, self.model, self.dimensions)
+
+    def vector_index(self, precision: str = "") -> HnswIndex:
+        """
+        The index of the version's recipe (pooled) vectors, used for searching the
+        version. Chunk vectors are only compared with the query when re-ranking
+        the closest recipes, so they aren't indexed.
+        """
+        precision = precision or self.precision
+        return HnswIndex(
+            OpClass(
+                self.indexed_embedding(precision),
+                name=self.OPCLASSES[precision],
+            ),
+            name=f"recipe_embeddings_v{self.pk}_{precision}",
+            condition=Q(version_id=self.pk, kind=RecipeEmbedding.Kinds.RECIPE),
+        )
+
+    def create_index(self, precision: str = "") -> None:
+        """Builds the version's vector index, unless it exists already"""
+        index = self.vector_index(precision)
+        table = RecipeEmbedding._meta.db_table
+        with connection.cursor() as cursor:
+            if index.name in connection.introspection.get_constraints(cursor, table):
+                return
+        # Concurrent builds don't block writes, but can't run in a transaction
+        concurrently = not connection.in_atomic_block
+        with connection.schema_editor(atomic=False) as schema_editor:
+            if not concurrently:
+                # Deferred foreign key checks would otherwise block the build
+                schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            schema_editor.add_index(RecipeEmbedding, index, concurrently=concurrently)
+
+    def drop_index(self, precision: str = "") -> None:
+        with connection.schema_editor(atomic=False) as schema_editor:
+            schema_editor.remove_index(
+                RecipeEmbedding,
+                self.vector_index(precision),
+                concurrently=not connection.in_atomic_block,
+            )
+
+    def typed_embedding(self, field: str = "embedding") -> Cast:
+        """The embedding column (or a related one) cast to the version's vector size"""
+        return Cast(field, VectorField(dimensions=self.dimensions))
+
+    def indexed_embedding(self, precision: str = "") -> Cast:
+        """The embedding column at the given (or the version's) index precision"""
+        precision = precision or self.precision
+        if precision == self.Precisions.HALF:
+            return Cast("embedding", HalfVectorField(dimensions=self.dimensions))
+        if precision == self.Precisions.BINARY:
+            return Cast(
+                BinaryQuantize(self.typed_embedding()),
+                BitField(length=self.dimensions),
+            )
+        return self.typed_embedding()
+
+    def index_distance(self, query: list[float], precision: str = "") -> Func:
+        """
+        The distance between the embeddings and the query, as approximated by the
+        vector index. Searches must order by it for the index to be used.
+        """
+        precision = precision or self.precision
+        embedding = self.indexed_embedding(precision)
+        if precision == self.Precisions.BINARY:
+            return HammingDistance(embedding, quantized_query(query, self.dimensions))
+        return CosineDistance(embedding, query)
+
+    @transaction.atomic
+    def activate(self):
+        """
+        Switches search over to this version, retiring the active one. Build the
+        version's index first, or searches will scan every embedding.
+        """
+        EmbeddingVersion.objects.filter(state=self.States.ACTIVE).update(
+            state=self.States.RETIRED
+        )
+        self.state = self.States.ACTIVE
+        self.save(update_fields=["state"])
+
+    def __repr__(self) -> str:
+        return (
+            f"<EmbeddingVersion {self.pk}: {self.backend}/{self.model} ({self.state})>"
+        )
+
+
 class RecipeEmbedding(models.Model):
+    """
+    An embedded chunk of a recipe's text, or the recipe's pooled embedding: the
+    weighted mean of its chunks', used for finding recipes with one row each.
+    """
+
+    class Kinds(models.TextChoices):
+        CHUNK = "chunk"
+        RECIPE = "recipe"
+
     recipe = models.ForeignKey(
         to=Recipe, on_delete=models.CASCADE, related_name="embeddings"
     )
+    version = models.ForeignKey(
+        to=EmbeddingVersion, on_delete=models.CASCADE, related_name="embeddings"
+    )
+    kind = models.CharField(max_length=16, choices=Kinds.choices, default=Kinds.CHUNK)
     origin_field = "rest_text"
-    # Embeddings are generated using Cohere's 'embed-multilingual-v3.0' model
-    embedding = VectorField(dimensions=1024)
+    # The recipe field a chunk is from, and its text, shown as search result
+    # snippets. Blank for pooled embeddings
+    field = models.CharField(max_length=32, blank=True)
+    text = models.TextField(blank=True)
+    # Copies of the recipe's filterable fields on pooled embeddings, so that
+    # filtered searches filter the rows while scanning the vector index
+    language = models.CharField(max_length=8, blank=True, null=True, default=None)
+    total_time = models.IntegerField(null=True, blank=True, default=None)
+    # The vector size depends on the version, so the column is untyped. Each
+    # version has its own index (see EmbeddingVersion.vector_index)
+    embedding = VectorField()
 
     class Meta:
         indexes = [
-            IvfflatIndex(
-                name="recipe_embeddings_ivf",
-                fields=["embedding"],
-                # TODO: Consider using just a single list
-                lists=10,  # pgvector readme suggests nrows/1000 as a baseline
-                opclasses=["vector_cosine_ops"],
+            # For selective filters, where scanning the matching rows beats
+            # scanning the vector index
+            models.Index(
+                fields=["version", "language", "total_time"],
+                condition=Q(kind="recipe"),
+                name="recipe_embedding_filters",
             )
         ]
+
+
+class SimilarRecipe(models.Model):
+    """
+    One of a recipe's most similar recipes, by their pooled embeddings in the
+    active embedding version. Precomputed, so they can be read in one lookup.
+    """
+
+    recipe = models.ForeignKey(
+        to=Recipe, on_delete=models.CASCADE, related_name="similar_recipes"
+    )
+    similar = models.ForeignKey(to=Recipe, on_delete=models.CASCADE, related_name="+")
+    # Cosine similarity, between -1 and 1
+    similarity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "similar"], name="unique similar recipe"
+            )
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Records the latest change to a recipe or ingredient, for use by syncing clients.
+
+    The auto-incrementing id doubles as the change token handed out to clients.
+    Each object has at most one entry: recording a new change replaces the old
+    entry, so the table stays the size of the catalogue (plus tombstones).
+
+    Changes are written once their transaction commits, see _write_changes.
+    """
+
+    class Kinds(models.TextChoices):
+        RECIPE = "recipe"
+        INGREDIENT = "ingredient"
+
+    kind = models.CharField(max_length=16, choices=Kinds.choices)
+    object_id = models.BigIntegerField()
+    # Deleted objects are kept around as tombstones so clients learn of deletions
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="one change entry per object"
+            ),
+        ]
+
+    @classmethod
+    def record(cls, kind: str, object_id: int, deleted: bool = False):
+        """Records the change once the transaction commits. The latest one wins"""
+        _changes.add({(kind, object_id): deleted})
+
+    def __repr__(self) -> str:
+        return f"<ChangeLogEntry {self.id}: {self.kind} {self.object_id}>"
+
+
+# Key of the advisory lock held while writing changes
+_CHANGE_LOG_LOCK = 5_263_817
+
+
+def _write_changes(changes: dict[tuple[str, int], bool]):
+    """
+    Upserts the entries of the changes, giving each a new (larger) id, in one
+    statement. Writers hold a lock from drawing their ids until they commit, so
+    entries become visible in the order of their ids. A client that has seen an
+    id can therefore never miss an entry with a smaller one.
+    """
+    kinds = [kind for kind, _ in changes]
+    object_ids = [object_id for _, object_id in changes]
+    table = ChangeLogEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_CHANGE_LOG_LOCK])
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (kind, object_id, deleted)
+            SELECT * FROM unnest(%s::varchar[], %s::bigint[], %s::boolean[])
+            ON CONFLICT (kind, object_id)
+            DO UPDATE SET id = EXCLUDED.id, deleted = EXCLUDED.deleted
+            """,
+            [kinds, object_ids, list(changes.values())],
+        )
+
+
+_changes = OnCommitBatch(_write_changes)
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+@receiver(models.signals.post_delete, sender=Recipe)
+def recipe_change_recorder(instance: Recipe, signal, **kwargs):
+    deleted = signal is models.signals.post_delete
+    ChangeLogEntry.record(ChangeLogEntry.Kinds.RECIPE, instance.pk, deleted)
+
+
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+def recipe_ingredient_change_recorder(instance: RecipeIngredient, **kwargs):
+    """Recipe ingredients are synced as part of their recipe"""
+    ChangeLogEntry.record(ChangeLogEntry.Kinds.RECIPE, instance.recipe_id)
+
+
+@receiver(models.signals.post_save, sender=Ingredient)
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_change_recorder(instance: Ingredient, signal, **kwargs):
+    deleted = signal is models.signals.post_delete
+    ChangeLogEntry.record(ChangeLogEntry.Kinds.INGREDIENT, instance.pk, deleted)
+
+
+class MealPlan(models.Model):
+    """
+    Recipes planned for days, e.g. a week of dinners. The summed ingredients of
+    its recipes are kept in MealPlanIngredient, so they're ready to serve.
+    """
+
+    name = models.CharField(max_length=128, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.name or f"Meal plan {self.pk}"
+
+
+class MealPlanEntry(models.Model):
+    plan = models.ForeignKey(
+        to=MealPlan, on_delete=models.CASCADE, related_name="entries"
+    )
+    date = models.DateField()
+    recipe = models.ForeignKey(
+        to=Recipe, on_delete=models.CASCADE, related_name="meal_plan_entries"
+    )
+    # Defaults to the recipe's own number of servings
+    servings = models.IntegerField(
+        null=True, blank=True, default=None, validators=[MinValueValidator(1)]
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["plan", "date"], name="meal_plan_entry_date")]
+
+
+class MealPlanIngredient(models.Model):
+    """
+    An ingredient of a meal plan's recipes, summed per unit like a shopping list
+    (see services.aggregate_shopping_list). Maintained by meal_plans.py
+    """
+
+    plan = models.ForeignKey(
+        to=MealPlan, on_delete=models.CASCADE, related_name="ingredients"
+    )
+    ingredient = models.ForeignKey(
+        to=Ingredient, on_delete=models.CASCADE, related_name="+"
+    )
+    # A canonical unit, see units.py
+    unit = models.CharField(max_length=16, blank=True)
+    is_optional = models.BooleanField()
+    amount = models.FloatField(null=True)
+    recipe_ids = ArrayField(models.IntegerField())
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["plan", "ingredient", "unit", "is_optional"],
+                name="unique meal plan ingredient",
+            )
+        ]
+
+
+@receiver(models.signals.post_save, sender=MealPlanEntry)
+@receiver(models.signals.post_delete, sender=MealPlanEntry)
+def meal_plan_entry_rollup_updater(instance: MealPlanEntry, **kwargs):
+    meal_plans.plans_changed([instance.plan_id])
+
+
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+def recipe_ingredient_rollup_updater(instance: RecipeIngredient, **kwargs):
+    meal_plans.recipes_changed([instance.recipe_id])
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+def recipe_rollup_updater(instance: Recipe, **kwargs):
+    """Recipes are scaled by their number of servings"""
+    meal_plans.recipes_changed([instance.pk])
+
+
+@receiver(models.signals.post_save, sender=Ingredient)
+def ingredient_rollup_updater(instance: Ingredient, **kwargs):
+    """Ubiquitous ingredients are left out, and densities convert volumes"""
+    meal_plans.ingredients_changed([instance.pk])
+
+
+class Nutrients(models.Model):
+    """Energy in kcal, the rest in g. Unknown values are null"""
+
+    energy_kcal = models.FloatField(null=True, blank=True)
+    fat = models.FloatField(null=True, blank=True)
+    saturated_fat = models.FloatField(null=True, blank=True)
+    carbohydrate = models.FloatField(null=True, blank=True)
+    sugar = models.FloatField(null=True, blank=True)
+    fiber = models.FloatField(null=True, blank=True)
+    protein = models.FloatField(null=True, blank=True)
+    salt = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class IngredientNutrition(Nutrients):
+    """The nutrients in 100 g of an ingredient"""
+
+    ingredient = models.OneToOneField(
+        to=Ingredient,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="nutrition",
+    )
+
+    def __str__(self) -> str:
+        return f"Nutrition of {self.ingredient}"
+
+
+def _per_serving(field: str) -> models.GeneratedField:
+    return models.GeneratedField(
+        expression=models.F(field) / NullIf("servings", models.Value(0)),
+        output_field=models.FloatField(null=True),
+        db_persist=True,
+    )
+
+
+class RecipeNutrition(Nutrients):
+    """
+    The nutrients in a recipe, summed from its (non-optional) ingredients, and
+    per serving. Stored so they're computed on write, see nutrition.py
+    """
+
+    recipe = models.OneToOneField(
+        to=Recipe, on_delete=models.CASCADE, primary_key=True, related_name="nutrition"
+    )
+    # The recipe's yields_number
+    servings = models.IntegerField(null=True)
+    # Grams of ingredients with a known mass and nutrition
+    mass = models.FloatField(null=True)
+    # The share of the ingredients the totals include. Those measured in counts,
+    # volumes without a density, or without nutrition data are left out
+    coverage = models.FloatField()
+
+    energy_kcal_per_serving = _per_serving("energy_kcal")
+    fat_per_serving = _per_serving("fat")
+    saturated_fat_per_serving = _per_serving("saturated_fat")
+    carbohydrate_per_serving = _per_serving("carbohydrate")
+    sugar_per_serving = _per_serving("sugar")
+    fiber_per_serving = _per_serving("fiber")
+    protein_per_serving = _per_serving("protein")
+    salt_per_serving = _per_serving("salt")
+
+
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+def recipe_ingredient_nutrition_updater(instance: RecipeIngredient, **kwargs):
+    nutrition.recipes_changed([instance.recipe_id])
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+def recipe_nutrition_updater(instance: Recipe, **kwargs):
+    """The nutrition per serving depends on the number of servings"""
+    nutrition.recipes_changed([instance.pk])
+
+
+@receiver(models.signals.post_save, sender=Ingredient)
+@receiver(models.signals.post_save, sender=IngredientNutrition)
+@receiver(models.signals.post_delete, sender=IngredientNutrition)
+def ingredient_nutrition_updater(instance: Ingredient | IngredientNutrition, **kwargs):
+    """Ingredients' densities convert volumes to masses"""
+    nutrition.ingredients_changed([instance.pk])
+
+
+class Tag(models.Model):
+    """A course, cuisine, diet, ... recipes can be filtered by"""
+
+    class Kinds(models.TextChoices):
+        COURSE = "course"
+        CUISINE = "cuisine"
+        DIET = "diet"
+        OCCASION = "occasion"
+        OTHER = "other"
+
+    # Identifies the tag in URLs, e.g. ?tag=vegetarian
+    slug = models.SlugField(max_length=64, unique=True)
+    name = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16, choices=Kinds.choices, default=Kinds.OTHER)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class RecipeTag(models.Model):
+    # The composite indexes below cover the foreign keys
+    recipe = models.ForeignKey(
+        to=Recipe, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    tag = models.ForeignKey(
+        to=Tag, on_delete=models.CASCADE, related_name="recipe_tags", db_index=False
+    )
+
+    class Meta:
+        constraints = [
+            # Also indexes the recipes of a tag, for filtering by tags
+            models.UniqueConstraint(fields=["tag", "recipe"], name="unique recipe tag")
+        ]
+        indexes = [
+            # The tags of recipes, for counting the tags of filtered recipes
+            models.Index(fields=["recipe", "tag"], name="recipe_tag_recipe")
+        ]
+
+
+def _recipe_tags_changed(recipe_ids: Iterable[int]):
+    """Tags are cached and synced as part of their recipes"""
+    for recipe_id in recipe_ids:
+        invalidate_recipe_detail(recipe_id)
+        ChangeLogEntry.record(ChangeLogEntry.Kinds.RECIPE, recipe_id)
+
+
+@receiver(models.signals.post_save, sender=RecipeTag)
+@receiver(models.signals.post_delete, sender=RecipeTag)
+def recipe_tag_change_recorder(instance: RecipeTag, **kwargs):
+    _recipe_tags_changed([instance.recipe_id])
+
+
+@receiver(models.signals.m2m_changed, sender=RecipeTag)
+def recipe_tags_change_recorder(
+    instance: Recipe | Tag, action: str, pk_set: set[int] | None, **kwargs
+):
+    """Records the changes made through Recipe.tags and Tag.recipes"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if isinstance(instance, Recipe):
+        _recipe_tags_changed([instance.pk])
+    elif action == "pre_clear":
+        _recipe_tags_changed(instance.recipes.values_list("id", flat=True))
+    else:
+        _recipe_tags_changed(pk_set or [])
@@ -0,0 +1,141 @@
+"""
+Upkeep of the nutrition of recipes (RecipeNutrition), summed from the nutrition
+of their ingredients (IngredientNutrition, per 100 g).
+
+Ingredient amounts are converted to grams by their canonical unit, and volumes
+by the ingredient's density. Amounts that can't be converted, like counts, are
+left out, which the stored coverage accounts for.
+
+Signal handlers in models.py report the recipes and ingredients that change,
+and the nutrition of the recipes affected is computed again once the
+transaction commits. Bulk imports skip the signals, and refresh the recipes
+affected themselves (see the import_nutrition command).
+"""
+
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, When
+
+from core.transactions import OnCommitBatch
+
+NUTRIENTS = [
+    "energy_kcal",
+    "fat",
+    "saturated_fat",
+    "carbohydrate",
+    "sugar",
+    "fiber",
+    "protein",
+    "salt",
+]
+
+
+def _changed(kind: str, ids: Iterable[int | None]):
+    _changes.add({(kind, id): None for id in ids if id is not None})
+
+
+def recipes_changed(recipe_ids: Iterable[int | None]):
+    _changed("recipes", recipe_ids)
+
+
+def ingredients_changed(ingredient_ids: Iterable[int | None]):
+    _changed("ingredients", ingredient_ids)
+
+
+def _refresh_changed(changes: dict[tuple[str, int], None]):
+    from recipes.models import RecipeIngredient
+
+    pending: dict[str, set[int]] = {"recipes": set(), "ingredients": set()}
+    for kind, id in changes:
+        pending[kind].add(id)
+
+    recipe_ids = pending["recipes"]
+    if pending["ingredients"]:
+        recipe_ids.update(
+            RecipeIngredient.objects.filter(
+                base_ingredient_id__in=pending["ingredients"]
+            ).values_list("recipe_id", flat=True)
+        )
+    if recipe_ids:
+        refresh_recipe_nutrition(recipe_ids)
+
+
+_changes = OnCommitBatch(_refresh_changed)
+
+
+def refresh_recipe_nutrition(
+    recipe_ids: Iterable[int] | None = None, batch_size: int = 1000
+) -> int:
+    """
+    Computes the nutrition of the recipes, or of all recipes if None, in one
+    query, and stores it. Returns the number of recipes with ingredients, whose
+    nutrition is stored.
+    """
+    from recipes.models import Recipe, RecipeIngredient, RecipeNutrition
+
+    ingredients = RecipeIngredient.objects.filter(is_optional=False)
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipe_ids = set(recipe_ids)
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+        recipes = recipes.filter(id__in=recipe_ids)
+
+    grams = Case(
+        When(canonical_unit="g", then=F("canonical_amount")),
+        When(
+            canonical_unit="ml",
+            then=F("canonical_amount") * F("base_ingredient__density"),
+        ),
+        default=None,
+    )
+    known = Q(base_ingredient__nutrition__isnull=False) & Q(
+        Q(canonical_unit="g", canonical_amount__isnull=False)
+        | Q(
+            canonical_unit="ml",
+            canonical_amount__isnull=False,
+            base_ingredient__density__isnull=False,
+        )
+    )
+    rows = (
+        ingredients.values("recipe_id")
+        .annotate(
+            servings=Max("recipe__yields_number"),
+            n_ingredients=Count("id"),
+            n_known=Count("id", filter=known),
+            mass=Sum(grams, filter=known),
+            **{
+                nutrient: Sum(
+                    grams * F(f"base_ingredient__nutrition__{nutrient}") / 100.0,
+                    filter=known,
+                )
+                for nutrient in NUTRIENTS
+            },
+        )
+        .order_by()
+    )
+    nutrition = [
+        RecipeNutrition(
+            recipe_id=row["recipe_id"],
+            servings=row["servings"],
+            mass=row["mass"],
+            coverage=row["n_known"] / row["n_ingredients"],
+            **{nutrient: row[nutrient] for nutrient in NUTRIENTS},
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        # Recipes without ingredients have no nutrition to speak of
+        with_ingredients = {row.recipe_id for row in nutrition}
+        RecipeNutrition.objects.filter(recipe__in=recipes).exclude(
+            recipe_id__in=with_ingredients
+        ).delete()
+        RecipeNutrition.objects.bulk_create(
+            nutrition,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["recipe"],
+            update_fields=["servings", "mass", "coverage", *NUTRIENTS],
+        )
+    return len(nutrition)
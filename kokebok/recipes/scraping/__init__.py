@@ -1,3 +1,3 @@
-from recipes.scraping.main import scrape
+from recipes.scraping.main import ascrape, scrape
 
-__all__ = ["scrape"]
+__all__ = ["ascrape", "scrape"]
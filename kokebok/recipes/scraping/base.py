@@ -7,25 +7,66 @@ from recipe_scrapers._abstract import AbstractScraper
 
 from recipes.models import Recipe, RecipeIngredient
 
-# TODO: Make sure all keys in this dict are members of RecipeIngrediet.Units
+# Keys are members of RecipeIngredient.Units, values are how they may be written,
+# lowercased. Phrases are matched with any whitespace between their words. Also
+# in Norwegian, German, French and Italian
 _UNITS = {
     # Weight
-    "g": ("gram", "grams"),
-    "kg": ("kilo", "kilos", "kilogram", "kilograms"),
-    "oz": ("ounce", "ounces"),
-    "lb": ("pound", "pounds"),
+    "g": (
+        "gram", "grams", "gramme", "grammes", "gr", "gramm", "grammo", "grammi",
+    ),
+    "kg": (
+        "kilo", "kilos", "kilogram", "kilograms", "kgs", "kilogramm",
+        "kilogramme", "kilogrammes", "chilo", "chilogrammo", "chilogrammi",
+    ),
+    "oz": ("ounce", "ounces", "oz."),
+    "lb": ("pound", "pounds", "lbs", "lb."),
     # Volume
-    "cup": ("cup", "cups"),
-    "tbsp": ("tablespoon", "tablespoons", "ss"),
-    "tsp": ("teaspoon", "teaspoons", "ts"),
-    "dl": ("decilitre", "decilitres", "desiliter"),
+    "l": ("liter", "liters", "litre", "litres", "litro", "litri"),
+    "dl": (
+        "decilitre", "decilitres", "deciliter", "deciliters", "desiliter",
+        "décilitre", "décilitres",
+    ),
+    "cl": (
+        "centilitre", "centilitres", "centiliter", "centiliters", "centilitro",
+        "centilitri",
+    ),
+    "ml": (
+        "millilitre", "millilitres", "milliliter", "milliliters", "millilitro",
+        "millilitri",
+    ),
+    "cup": ("cup", "cups", "kopp", "kopper", "tasse", "tassen", "tazza", "tazze"),
+    "tbsp": (
+        "tablespoon", "tablespoons", "table spoon", "table spoons", "tbsps", "tbs",
+        "heaped tablespoon", "heaped tablespoons", "heaping tablespoon",
+        "heaping tablespoons", "level tablespoon", "level tablespoons",
+        "ss", "spiseskje", "spiseskjeer", "el", "esslöffel",
+        "cuillère à soupe", "cuillères à soupe", "c. à soupe", "c. à s.",
+        "cucchiaio", "cucchiai",
+    ),
+    "tsp": (
+        "teaspoon", "teaspoons", "tea spoon", "tea spoons", "tsps",
+        "heaped teaspoon", "heaped teaspoons", "heaping teaspoon",
+        "heaping teaspoons", "level teaspoon", "level teaspoons",
+        "ts", "teskje", "teskjeer", "tl", "teelöffel",
+        "cuillère à café", "cuillères à café", "c. à café", "c. à c.",
+        "cucchiaino", "cucchiaini",
+    ),
     # Other
-    "count": ("", "stk", "stk."),
-    "slice": ("slice", "slices"),
-    "inch": ("inches", "″"),
-    "cm": ("centimetre", "centimetres"),
-    # TODO: Fill
-}
+    "count": (
+        "", "stk", "stk.", "piece", "pieces", "stykk", "stykker", "stück",
+        "pièce", "pièces", "pezzo", "pezzi",
+    ),
+    "slice": (
+        "slice", "slices", "skive", "skiver", "scheibe", "scheiben", "tranche",
+        "tranches", "fetta", "fette",
+    ),
+    "inch": ("inch", "inches", "″"),
+    "cm": (
+        "centimetre", "centimetres", "centimeter", "centimeters", "zentimeter",
+        "centimètre", "centimètres", "centimetro", "centimetri",
+    ),
+}  # fmt: skip
 
 UNIT_STRINGS: dict[str, str] = functools.reduce(
     lambda acc, kv: acc | {v: kv[0] for v in kv[1]} | {kv[0]: kv[0]},
@@ -36,10 +77,18 @@ UNIT_STRINGS: dict[str, str] = functools.reduce(
 
 class ScrapedRecipeIngredient(ModelSchema):
     base_ingredient_str: str = ""
+    # Set when the base ingredient has been looked up, see resolve_ingredients
+    base_ingredient_id: int | None = None
 
     class Meta:
         model = RecipeIngredient
-        exclude = ["base_ingredient", "recipe", "id"]
+        exclude = [
+            "base_ingredient",
+            "recipe",
+            "id",
+            "canonical_amount",
+            "canonical_unit",
+        ]
 
     def clean(self):
         ...
@@ -60,6 +109,7 @@ class ScrapedRecipe(ModelSchema):
             "created_at",
             "video_url",
             "other_source",
+            "tags",
         ]
 
     # error if given kwargs not in the schema
@@ -1,45 +1,38 @@
+from contextlib import contextmanager
 from typing import NamedTuple
 
+import httpx
 import recipe_scrapers
+from asgiref.sync import sync_to_async
 from recipe_scrapers import scrape_html, scrape_me
-from recipe_scrapers._abstract import AbstractScraper
+from recipe_scrapers._abstract import HEADERS, AbstractScraper
 from recipe_scrapers._utils import get_host_name
 
-from recipes.scraping.base import (
-    UNIT_STRINGS,
-    MyScraper,
-    ScrapedRecipe,
-    ScrapedRecipeIngredient,
-)
+from core.clients import shared_async_client
+from core.instrumentation import timed
+from core.metrics import SCRAPES
+from recipes.scraping.base import MyScraper, ScrapedRecipe, ScrapedRecipeIngredient
+from recipes.scraping.parsing import parse_ingredient_line
 from recipes.scraping.registry import registry
 from recipes.scraping.utils import RecipeScraperWrapper
 
 
 def parse_ingredient_string(s: str, group: str = "") -> ScrapedRecipeIngredient:
     """
-    Tries matching the ingredient string against:
-    "<amt> <unit> <ingredient_name>"
+    Parses the ingredient string as "<amount> <unit> <ingredient_name>", see
+    parse_ingredient_line. Lines with an amount but no unit count the ingredient
     """
-    for i, c in enumerate(s):
-        if not c.isdigit():
-            break
-
-    amount = float(s[:i] or 0)
-    maybe_measure = s[i:].strip().split()[0]
-    measure = UNIT_STRINGS.get(maybe_measure, "count") if amount else ""
-
-    if measure:
-        ingredient_name = s[s.find(maybe_measure) + len(maybe_measure) :].strip()
-    elif amount:
-        ingredient_name = s[i:].strip()
+    line = parse_ingredient_line(s)
+    if line.amount is None:
+        amount, unit, ingredient_name = 0.0, "", ""
     else:
-        ingredient_name = ""
+        amount, unit, ingredient_name = line.amount, line.unit or "count", line.name
 
     return ScrapedRecipeIngredient(
         name_in_recipe=s,
         base_ingredient_str=ingredient_name,
         base_amount=amount,
-        unit=measure,
+        unit=unit,
         group_name=group,
     )
 
@@ -48,6 +41,54 @@ def scrape(
     url: str | None, html: str | None = None, host: str | None = None
 ) -> ScrapedRecipe:
     """html & host params are for testing against local files"""
+    host = host or (get_host_name(url) if url else "")
+    with _counted_scrape(host):
+        return _scrape(url, html, host)
+
+
+async def ascrape(url: str) -> ScrapedRecipe:
+    """
+    Async version of scrape, for use in async views. Fetches the page without
+    blocking the event loop, then parses it in a worker thread.
+    """
+    host = get_host_name(url)
+    with _counted_scrape(host):
+        html = await _afetch_html(url)
+        return await sync_to_async(_scrape, thread_sensitive=False)(url, html, host)
+
+
+@contextmanager
+def _counted_scrape(host: str):
+    """Counts the scrape made in the block as a success or failure"""
+    if host in registry:
+        source, host_label = "registry", host
+    elif host in recipe_scrapers.SCRAPERS:
+        source, host_label = "recipe_scrapers", host
+    else:
+        # Don't label by arbitrary hosts, to keep the number of labels bounded
+        source, host_label = "wild", "other"
+
+    try:
+        yield
+    except Exception:
+        SCRAPES.labels(host_label, source, "failure").inc()
+        raise
+    SCRAPES.labels(host_label, source, "success").inc()
+
+
+@shared_async_client(close=httpx.AsyncClient.aclose)
+def _http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30)
+
+
+async def _afetch_html(url: str) -> str:
+    with timed("http"):
+        response = await _http_client().get(url)
+    response.raise_for_status()
+    return response.text
+
+
+def _scrape(url: str | None, html: str | None, host: str) -> ScrapedRecipe:
     (in_my_registry, _, scraper) = get_scraper(url, html, host)
     wrapped = RecipeScraperWrapper(scraper)
 
@@ -118,12 +159,18 @@ def get_scraper(url: str | None, html=None, host=None) -> RegistryLookupResult:
         return RegistryLookupResult(
             host_in_my_registry=False,
             host_in_scrapers_registry=True,
-            scraper=scrape_html(html, url) if html else scrape_me(url),
+            scraper=scrape_html(html, url) if html else _fetch_and_scrape(url),
         )
     return RegistryLookupResult(
         host_in_my_registry=False,
         host_in_scrapers_registry=False,
         scraper=scrape_html(html, url, wild_mode=True)
         if html
-        else scrape_me(url, wild_mode=True),
+        else _fetch_and_scrape(url, wild_mode=True),
     )
+
+
+@timed("http")
+def _fetch_and_scrape(url: str | None, wild_mode: bool = False) -> AbstractScraper:
+    """recipe_scrapers does the fetching, so this mostly measures the request time"""
+    return scrape_me(url, wild_mode=wild_mode)
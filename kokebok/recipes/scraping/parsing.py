@@ -0,0 +1,141 @@
+"""
+Parsing of ingredient lines like "1 1/2 cups flour", "½ ts salt", "2,5 dl melk"
+or "10-12 cloves garlic" into an amount, a unit and an ingredient name.
+
+A line is parsed by a single match of one compiled regular expression, built
+from the tables below and UNIT_STRINGS. Amounts are converted from the matched
+groups without eval.
+"""
+
+import re
+import unicodedata
+from typing import NamedTuple
+
+from recipes.scraping.base import UNIT_STRINGS
+
+# ½, ⅓, ¼, ... and their values
+VULGAR_FRACTIONS: dict[str, float] = {
+    char: unicodedata.numeric(char)
+    for char in map(chr, range(0x00BC, 0x2190))
+    if unicodedata.name(char, "").startswith("VULGAR FRACTION")
+    and unicodedata.numeric(char) < 1
+}
+
+# Words and symbols between the two amounts of a range, e.g. "2 to 3"
+RANGE_SEPARATORS = ["-", "–", "—", "to", "til", "bis", "à"]
+
+_VULGAR = f"[{''.join(VULGAR_FRACTIONS)}]"
+# A whole or decimal number and/or a fraction, e.g. "1 1/2", "1½" or "2,5".
+# Fractions may be written with a slash or a fraction slash (⁄). {0} prefixes
+# the group names, as the pattern is used for both amounts of a range
+_NUMBER = rf"""
+    (?P<{{0}}whole>\d+(?:[.,]\d+)?(?!\d|\s*[/⁄]))?
+    \s*
+    (?:
+        (?<!\d)(?P<{{0}}numerator>\d+)\s*[/⁄]\s*(?P<{{0}}denominator>\d+)
+        | (?P<{{0}}vulgar>{_VULGAR})
+    )?
+"""
+
+
+def _alternation(words: list[str]) -> str:
+    # Longest first, so "cups" isn't matched as "cup" followed by "s"
+    words = sorted(words, key=len, reverse=True)
+    return "|".join(r"\s+".join(map(re.escape, word.split())) for word in words)
+
+
+_LINE = re.compile(
+    rf"""
+    \s*
+    (?P<amount>
+        (?=\d|{_VULGAR})
+        {_NUMBER.format("low_")}
+        (?:
+            \s*(?:{_alternation(RANGE_SEPARATORS)})\s*
+            (?=\d|{_VULGAR})
+            {_NUMBER.format("high_")}
+        )?
+    )?
+    \s*
+    # Only lines with an amount have a unit, so "Cup noodles" is just a name
+    (?(amount)
+        (?:
+            (?P<unit>{_alternation([unit for unit in UNIT_STRINGS if unit])})
+            # Not the start of a word, e.g. the "g" in "2 garlic cloves"
+            (?![^\W\d_])\.?
+        )?
+        # "2 cups of water", "2 c. à soupe d'huile", "3 cucchiai di olio"
+        \s*(?:(?:of|de|di)\s+|d['’])?
+    )
+    (?P<name>.*?)
+    \s*
+    """,
+    re.IGNORECASE | re.VERBOSE | re.DOTALL,
+)
+
+
+class ParsedIngredientLine(NamedTuple):
+    # The amount, or the lower amount of a range. None when the line has none
+    amount: float | None
+    # The upper amount of a range, or None
+    amount_max: float | None
+    # One of RecipeIngredient.Units, or "" when the line has no unit
+    unit: str
+    name: str
+
+    @property
+    def is_range(self) -> bool:
+        return self.amount_max is not None
+
+
+def _number(match: re.Match, prefix: str) -> float | None:
+    whole, numerator, denominator, vulgar = match.group(
+        f"{prefix}whole",
+        f"{prefix}numerator",
+        f"{prefix}denominator",
+        f"{prefix}vulgar",
+    )
+    if whole is None and numerator is None and vulgar is None:
+        return None
+
+    amount = float(whole.replace(",", ".")) if whole else 0.0
+    if numerator is not None:
+        if int(denominator) == 0:
+            return None
+        amount += int(numerator) / int(denominator)
+    if vulgar is not None:
+        amount += VULGAR_FRACTIONS[vulgar]
+    return amount
+
+
+def parse_unit(text: str) -> str | None:
+    """The unit written as the text, e.g. "Esslöffel" or "c. à soupe", if known"""
+    text = " ".join(text.lower().split())
+    return UNIT_STRINGS.get(text, UNIT_STRINGS.get(text.removesuffix(".")))
+
+
+def parse_amount(text: str) -> tuple[float, float | None] | None:
+    """
+    The amount, and the upper amount if a range, in the text, e.g. "1 1/2",
+    "2,5" or "10-12". None unless the text is only an amount.
+    """
+    line = parse_ingredient_line(text)
+    if line.amount is None or line.unit or line.name:
+        return None
+    return line.amount, line.amount_max
+
+
+def parse_ingredient_line(line: str) -> ParsedIngredientLine:
+    """Parses a line of the form "[<amount>] [<unit>] <ingredient name>" """
+    match = _LINE.fullmatch(line)
+    # Everything in the pattern is optional, and the name matches anything
+    assert match is not None
+
+    amount = _number(match, "low_")
+    amount_max = _number(match, "high_")
+    if amount is None:
+        # E.g. "1/0". Better to leave the line as it is than guess
+        return ParsedIngredientLine(None, None, "", line.strip())
+
+    unit = (parse_unit(match["unit"]) or "") if match["unit"] else ""
+    return ParsedIngredientLine(amount, amount_max, unit, match["name"])
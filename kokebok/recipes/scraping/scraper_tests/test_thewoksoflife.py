@@ -42,8 +42,9 @@ parameters: dict[str, dict[str, Any]] = {
             ("", 1),  # pork belly
             ("", 11),  # water
         ],
-        "ingredient_amounts": [1.5, 0],
-        "ingredient_units": ["lb", ""],
+        # Ranges are stored as their lower amount, and kept in the full name
+        "ingredient_amounts": [1.5, 2],
+        "ingredient_units": ["lb", "cup"],
         "base_ingredient_names": [
             "boneless skin-on pork belly",
             "water",
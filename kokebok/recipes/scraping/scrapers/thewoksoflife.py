@@ -1,27 +1,29 @@
-import re
 from collections import defaultdict
 from functools import lru_cache
 
 import extruct
-import requests
 from bs4 import BeautifulSoup
 from recipe_scrapers.thewoksoflife import Thewoksoflife
 
+from core.instrumentation import timed
 from recipes.scraping.base import (
     HTML,
-    UNIT_STRINGS,
     IngredientGroupDict,
     MyScraperProtocol,
     ScrapedRecipeIngredient,
 )
-from recipes.scraping.utils import html_to_markdown
+from recipes.scraping.parsing import parse_amount, parse_unit
+from recipes.scraping.utils import html_to_markdown, http_session
 
 
 class TheWoksOfLifeScraper(MyScraperProtocol, Thewoksoflife):
     def __init__(self, url: str | None, html: str | None = None) -> None:
         # We basically parse the page three times because
         # recipe_scrapers doesn't give enough information
-        self.page_raw = html or requests.get(url).content.decode("utf-8")  # type: ignore[arg-type] # noqa
+        if not html:
+            with timed("http"):
+                html = http_session().get(url).content.decode("utf-8")  # type: ignore[arg-type] # noqa
+        self.page_raw = html
         self.page_soup = BeautifulSoup(self.page_raw, "html.parser")
 
         json_ld_extract = extruct.extract(self.page_raw, syntaxes=["json-ld"])
@@ -55,26 +57,27 @@ class TheWoksOfLifeScraper(MyScraperProtocol, Thewoksoflife):
 
                 # Try to get unit and convert it to accepted format
                 unit_li = li.find(attrs={"class": "wprm-recipe-ingredient-unit"})
-                unit = unit_li.text if unit_li else ""
-                if unit_li and unit not in UNIT_STRINGS:
+                unit_text = unit_li.text if unit_li else ""
+                unit = parse_unit(unit_text)
+                if unit is None:
                     # If we don't know the unit, append it to the long name
-                    ingredient_long_name = unit + " " + ingredient_long_name
+                    ingredient_long_name = unit_text + " " + ingredient_long_name
                     unit = ""
-                else:
-                    unit = UNIT_STRINGS[unit]
 
                 # Amount examples: "1", "13.5", "3/4", "1 1/2", "10-12"
                 amount_li = li.find(attrs={"class": "wprm-recipe-ingredient-amount"})
-                if amount_li:
-                    # Make sure we aren't calling eval on anything scary
-                    if re.match(r"[ \d\/\.]*\Z", amount_li.text):
-                        amount = sum(eval(s) for s in amount_li.text.split(" "))
-                    else:
-                        # Unable to parse amount.
-                        # Make amount and unit blank, and put them in the long name
-                        amount = 0
+                amounts = parse_amount(amount_li.text) if amount_li else None
+                if amounts is not None:
+                    amount, amount_max = amounts
+                    if amount_max is not None:
+                        # Keep the range in the long name, as only one amount is stored
                         ingredient_long_name = li.text[2:]
-                        unit = ""
+                elif amount_li:
+                    # Unable to parse amount.
+                    # Make amount and unit blank, and put them in the long name
+                    amount = 0
+                    ingredient_long_name = li.text[2:]
+                    unit = ""
                 else:
                     amount = 0
 
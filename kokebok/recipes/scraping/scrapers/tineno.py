@@ -4,23 +4,26 @@ from collections import defaultdict
 from functools import lru_cache
 
 import extruct
-import requests
 from bs4 import BeautifulSoup
 from recipe_scrapers.tineno import TineNo
 
+from core.instrumentation import timed
 from recipes.scraping.base import (
     HTML,
     IngredientGroupDict,
     MyScraperProtocol,
     ScrapedRecipeIngredient,
 )
-from recipes.scraping.utils import html_to_markdown
+from recipes.scraping.utils import html_to_markdown, http_session
 
 
 class TineNoScraper(MyScraperProtocol, TineNo):
     def __init__(self, url: str | None, html: str | None = None) -> None:
         assert url or html, "Either url or html must be provided"
-        self.page_raw = html or requests.get(url).content.decode("utf-8")  # type: ignore[arg-type] # if not html, url must be string
+        if not html:
+            with timed("http"):
+                html = http_session().get(url).content.decode("utf-8")  # type: ignore[arg-type] # if not html, url must be string
+        self.page_raw = html
         self.page_soup = BeautifulSoup(self.page_raw, "html.parser")
 
         json_ld_extract = extruct.extract(self.page_raw, syntaxes=["json-ld"])
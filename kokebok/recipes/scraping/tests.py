@@ -1,8 +1,15 @@
 from pathlib import Path
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from recipes.scraping import scrape
+from recipes.scraping.base import UNIT_STRINGS
+from recipes.scraping.main import parse_ingredient_string
+from recipes.scraping.parsing import (
+    ParsedIngredientLine,
+    parse_amount,
+    parse_ingredient_line,
+)
 
 DOCS_DIR = Path("recipes/scraping/scraper_tests/html")
 
@@ -21,3 +28,82 @@ class ScrapeTest(TestCase):
                 html = f.read()
 
             scrape(url=None, html=html, host=hosts_map[doc.stem.split(".")[0]])
+
+
+class ParseIngredientLineTest(SimpleTestCase):
+    def test_parse_ingredient_line(self):
+        cases = [
+            # Line, amount, upper amount, unit, name
+            ("2 eggs", 2, None, "", "eggs"),
+            ("1 1/2 cups flour", 1.5, None, "cup", "flour"),
+            ("3/4 cup sugar", 0.75, None, "cup", "sugar"),
+            ("1⁄2 tsp pepper", 0.5, None, "tsp", "pepper"),
+            ("½ ts salt", 0.5, None, "tsp", "salt"),
+            ("1½ EL Zucker", 1.5, None, "tbsp", "Zucker"),
+            ("2,5 dl melk", 2.5, None, "dl", "melk"),
+            ("13.5 ounces coconut milk", 13.5, None, "oz", "coconut milk"),
+            ("200g smør", 200, None, "g", "smør"),
+            ("10-12 cloves garlic", 10, 12, "", "cloves garlic"),
+            ("2 – 3 ts chili", 2, 3, "tsp", "chili"),
+            ("2 to 3 tomatoes", 2, 3, "", "tomatoes"),
+            ("1 til 2 kopper ris", 1, 2, "cup", "ris"),
+            ("2 cups of water", 2, None, "cup", "water"),
+            ("2 c. à soupe d'huile", 2, None, "tbsp", "huile"),
+            ("3 cucchiai di olio", 3, None, "tbsp", "olio"),
+            ("2 heaping  tablespoons cocoa", 2, None, "tbsp", "cocoa"),
+            ("4 stk. egg", 4, None, "count", "egg"),
+            ("1 Scheibe Brot", 1, None, "slice", "Brot"),
+            # "g" and "to" must be whole words
+            ("2 garlic cloves", 2, None, "", "garlic cloves"),
+            ("2 tomatoes", 2, None, "", "tomatoes"),
+            # No amount
+            ("Salt to taste", None, None, "", "Salt to taste"),
+            ("Cup noodles", None, None, "", "Cup noodles"),
+            ("", None, None, "", ""),
+            ("   ", None, None, "", ""),
+            ("1/0 cup", None, None, "", "1/0 cup"),
+        ]
+        for line, amount, amount_max, unit, name in cases:
+            with self.subTest(line=line):
+                self.assertEqual(
+                    parse_ingredient_line(line),
+                    ParsedIngredientLine(amount, amount_max, unit, name),
+                )
+
+    def test_parse_ingredient_line_corpus(self):
+        """Every unit spelling, with every way of writing amounts"""
+        amounts = [
+            ("3", 3),
+            ("0.25", 0.25),
+            ("2,5", 2.5),
+            ("1/3", 1 / 3),
+            ("1 3/4", 1.75),
+            ("1¾", 1.75),
+            ("⅛", 0.125),
+        ]
+        for amount_str, amount in amounts:
+            for unit_str, unit in UNIT_STRINGS.items():
+                if not unit_str:
+                    continue
+                for name in ["salt", "Grated PARMESAN (optional)", "ost, revet"]:
+                    line = f"{amount_str} {unit_str.upper()} {name}"
+                    parsed = parse_ingredient_line(line)
+                    self.assertAlmostEqual(parsed.amount, amount, msg=line)
+                    self.assertEqual((parsed.unit, parsed.name), (unit, name), line)
+
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount("1 1/2"), (1.5, None))
+        self.assertEqual(parse_amount("10-12"), (10, 12))
+        self.assertIsNone(parse_amount("a pinch"))
+        self.assertIsNone(parse_amount("2 cups"))
+
+    def test_parse_ingredient_string(self):
+        parsed = parse_ingredient_string("2 eggs", "Dough")
+        self.assertEqual(parsed.base_amount, 2)
+        self.assertEqual(parsed.unit, "count")
+        self.assertEqual(parsed.base_ingredient_str, "eggs")
+        self.assertEqual(parsed.group_name, "Dough")
+
+        parsed = parse_ingredient_string("")
+        self.assertEqual(parsed.base_amount, 0)
+        self.assertEqual(parsed.unit, "")
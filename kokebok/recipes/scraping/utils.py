@@ -3,10 +3,21 @@ from typing import Any, Iterable
 
 import bs4
 import pypandoc
+import requests
 from recipe_scrapers._abstract import AbstractScraper
 from recipe_scrapers._exceptions import SchemaOrgException
 
+from core.clients import shared_client
+from core.instrumentation import timed
 
+
+@shared_client
+def http_session() -> requests.Session:
+    """Session for plain HTTP requests, reusing connections between requests"""
+    return requests.Session()
+
+
+@timed("pandoc")
 def html_to_markdown(html: str) -> str:
     """
     Convert html to markdown.
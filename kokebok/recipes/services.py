@@ -3,38 +3,143 @@ This file contains business logic related to recipe creation, retrieval and/or u
 that is too complex to have in the api file directly.
 """
 
+import logging
+import re
+from collections import Counter
+from itertools import groupby
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.search import TrigramWordSimilarity
 from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Min,
+    Q,
+    QuerySet,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Greatest, Lower, NullIf
 from django.forms import ValidationError
 from ninja import File, UploadedFile
+from pgvector.django import CosineDistance
 
+from recipes import units
 from recipes.api_schemas import FullRecipeCreationSchema, FullRecipeUpdateSchema
-from recipes.embedding import embed_docs
-from recipes.models import Recipe, RecipeEmbedding, RecipeIngredient
+from recipes.embedding import chunk_texts, embed_docs
+from recipes.ingredient_matching import get_matcher, ingredient_saved
+from recipes.models import (
+    ChangeLogEntry,
+    EmbeddingVersion,
+    Ingredient,
+    Normalised,
+    Recipe,
+    RecipeEmbedding,
+    RecipeIngredient,
+    SimilarRecipe,
+    Tag,
+)
+
+logger = logging.getLogger(__name__)
 
 HttpError = tuple[int, dict[str, str]]
 
+# The recipe fields that are embedded for search, with their weight in the
+# recipe's pooled embedding. Titles are short, but say the most about a recipe
+EMBEDDED_FIELDS = ("title", "preamble", "instructions", "rest_text")
+FIELD_WEIGHTS = {"title": 2.0, "preamble": 1.0, "instructions": 1.0, "rest_text": 0.5}
+# Number of similar recipes kept per recipe
+SIMILAR_RECIPES = 10
+# Minimum score of a fuzzy ingredient match for it to be used instead of creating
+# an ingredient. Scraped names are often the ingredient's name plus a
+# description ("fresh blueberries"), but a name plus another word is often
+# another ingredient ("chicken stock"), which scores just below
+MATCH_THRESHOLD = 0.8
 
-def get_recipe_embeddings(recipe: Recipe):
-    # Create embeddings
-    raw_embeddings = embed_docs(
-        recipe.title,
-        recipe.preamble,
-        recipe.instructions,
-        recipe.rest_text,
-    )
-    embeddings = [
-        RecipeEmbedding(recipe=recipe, embedding=raw_embed)
-        for raw_embed in raw_embeddings
+
+def recipe_chunks(texts: dict[str, str | None]) -> list[tuple[str, str]]:
+    """Splits the texts of the embedded fields into chunks, paired with their field"""
+    return [
+        (field, chunk)
+        for field in EMBEDDED_FIELDS
+        if (text := texts.get(field))
+        for chunk in chunk_texts([text])
     ]
 
+
+def build_recipe_embeddings(
+    recipe: Recipe,
+    version: EmbeddingVersion,
+    chunks: list[tuple[str, str]],
+    vectors: list[list[float]],
+) -> list[RecipeEmbedding]:
+    """
+    Returns the embeddings of the recipe's chunks, followed by its pooled
+    embedding. Each field's chunks share the field's weight, so that long texts
+    don't drown out the title.
+    """
+    if not chunks:
+        return []
+
+    field_counts = Counter(field for field, _ in chunks)
+    weights = [FIELD_WEIGHTS[field] / field_counts[field] for field, _ in chunks]
+    pooled = np.average(np.array(vectors), axis=0, weights=weights)
+    pooled /= np.linalg.norm(pooled) or 1
+
+    return [
+        RecipeEmbedding(
+            recipe=recipe, version=version, field=field, text=text, embedding=vector
+        )
+        for (field, text), vector in zip(chunks, vectors)
+    ] + [
+        RecipeEmbedding(
+            recipe=recipe,
+            version=version,
+            kind=RecipeEmbedding.Kinds.RECIPE,
+            language=recipe.language,
+            total_time=recipe.total_time,
+            embedding=pooled,
+        )
+    ]
+
+
+def embed_recipe_texts(
+    recipe: Recipe, texts: dict[str, str | None]
+) -> list[RecipeEmbedding]:
+    """
+    Embeds the texts of the embedded fields with every live embedding version,
+    so that a version being filled doesn't miss recipes created or changed
+    while it is filled
+    """
+    chunks = recipe_chunks(texts)
+    embeddings: list[RecipeEmbedding] = []
+    for version in EmbeddingVersion.live():
+        vectors = embed_docs(
+            *(chunk for _, chunk in chunks), backend=version.get_backend()
+        )
+        embeddings += build_recipe_embeddings(recipe, version, chunks, vectors)
     return embeddings
 
 
+def get_recipe_embeddings(recipe: Recipe):
+    return embed_recipe_texts(recipe, {f: getattr(recipe, f) for f in EMBEDDED_FIELDS})
+
+
 def create_recipe(
     data: FullRecipeCreationSchema, hero_image: File[UploadedFile] | None
 ):
     recipe_data = data.dict()
     ingredients = recipe_data.pop("ingredients")
+    tag_ids = recipe_data.pop("tags")
 
     # Create model instances
     recipe = Recipe(**recipe_data, hero_image=hero_image)
@@ -48,6 +153,7 @@ def create_recipe(
     for ri in ris:
         # Exclude recipe because it technically doesn't exist yet (before saving)
         ri.full_clean(exclude=["recipe"])
+    check_tags(tag_ids)
 
     embeddings = get_recipe_embeddings(recipe)
     # Save
@@ -55,12 +161,25 @@ def create_recipe(
         recipe.save()
         for ri in ris:
             ri.save()
+        if tag_ids:
+            recipe.tags.set(tag_ids)
         for emb in embeddings:
             emb.save()
+    refresh_similar_recipes(recipe)
 
     return recipe
 
 
+def check_tags(tag_ids: Iterable[int]):
+    """Raises a ValidationError unless all the tags exist"""
+    tag_ids = set(tag_ids)
+    unknown = tag_ids - set(
+        Tag.objects.filter(id__in=tag_ids).values_list("id", flat=True)
+    )
+    if unknown:
+        raise ValidationError({"tags": f"Unknown tags: {sorted(unknown)}"})
+
+
 def update_recipe(
     recipe: Recipe, data: FullRecipeUpdateSchema, hero_image: File[UploadedFile] | None
 ) -> Recipe | HttpError:
@@ -72,38 +191,31 @@ def update_recipe(
         * argument ingredients without ids are created fresh and given ids
         * Existing recipe ingredients whose id are not included in the request data
             are deleted.
+    Tags are replaced by those in the request, unless they're left out (None).
     """
     recipe_data = data.dict()
     recipe_ingredients = recipe_data.pop("ingredients")
+    tag_ids = recipe_data.pop("tags")
 
     # Retrieve existing data
     existing_recipe_ingredients = RecipeIngredient.objects.filter(recipe_id=recipe.id)
 
     # If any text field has changed, recalculate the embeddings
+    texts_changed = any(recipe_data[f] != getattr(recipe, f) for f in EMBEDDED_FIELDS)
+    filters_changed = (
+        recipe.language != recipe_data["language"]
+        or recipe.total_time != recipe_data["total_time"]
+    )
+    for k, v in recipe_data.items():
+        setattr(recipe, k, v)
     new_embeddings: list[RecipeEmbedding] = []
-    if (
-        recipe.title != recipe_data["title"]
-        or recipe.preamble != recipe_data["preamble"]
-        or recipe.instructions != recipe_data["instructions"]
-        or recipe.rest_text != recipe_data["rest_text"]
-    ):
-        raw_embeddings = embed_docs(
-            recipe_data["title"],
-            recipe_data["preamble"],
-            recipe_data["instructions"],
-            recipe_data["rest_text"],
-        )
-        new_embeddings = [
-            RecipeEmbedding(recipe=recipe, embedding=raw_embed)
-            for raw_embed in raw_embeddings
-        ]
+    if texts_changed:
+        new_embeddings = get_recipe_embeddings(recipe)
 
     # Perform updates
     # If this is slow, try deleting all ris and then creating all in the request instead
     try:
         with transaction.atomic(durable=True):
-            for k, v in recipe_data.items():
-                setattr(recipe, k, v)
             recipe.hero_image = hero_image
             recipe.save()
 
@@ -118,15 +230,519 @@ def update_recipe(
                 ri.full_clean()
                 ri.save()
 
+            if tag_ids is not None:
+                check_tags(tag_ids)
+                recipe.tags.set(tag_ids)
+
             if new_embeddings:
                 RecipeEmbedding.objects.filter(recipe__id=recipe.id).delete()
                 for emb in new_embeddings:
                     emb.save()
+            elif filters_changed:
+                RecipeEmbedding.objects.filter(
+                    recipe=recipe, kind=RecipeEmbedding.Kinds.RECIPE
+                ).update(language=recipe.language, total_time=recipe.total_time)
 
     except ValidationError as e:
         # TODO: change str(val) to something better
         return 403, {str(key): str(val) for key, val in e.error_dict.items()}
 
+    if new_embeddings:
+        refresh_similar_recipes(recipe)
     recipe.refresh_from_db()
 
     return recipe
+
+
+def scale_recipe_detail(
+    data: dict, servings: int | None, system: units.System | None
+) -> dict:
+    """
+    Scales the ingredients of a serialized recipe detail to the number of
+    servings, and converts their amounts to the system's units if given.
+    Scaling requires the recipe's yields_number
+    """
+    factor = 1.0
+    if servings is not None:
+        if not data["yields_number"]:
+            raise ValueError("The recipe has no number of servings to scale from")
+        factor = servings / data["yields_number"]
+        data["yields_number"] = servings
+
+    ingredients = data["ingredients"]
+    amounts, new_units = units.scale(
+        [ingredient["base_amount"] for ingredient in ingredients],
+        [ingredient["unit"] for ingredient in ingredients],
+        factor,
+        system,
+    )
+    for ingredient, amount, unit in zip(ingredients, amounts, new_units):
+        ingredient["base_amount"] = amount
+        ingredient["unit"] = unit
+        if ingredient["canonical_amount"] is not None:
+            ingredient["canonical_amount"] *= factor
+    return data
+
+
+def localised_name(language: str, prefix: str = "") -> Coalesce:
+    """An ingredient's name in the language, falling back on any other name"""
+    codes = sorted(Recipe.Languages.codes(), key=lambda code: code != language)
+    return Coalesce(*(f"{prefix}name_{code}" for code in codes))
+
+
+def aggregate_shopping_list(
+    recipe_servings: Iterable[tuple[int, int | None]], language: str
+) -> list[dict]:
+    """
+    Sums the ingredients of the recipes, scaled to the servings (or their own
+    servings if None), per ingredient, canonical unit and whether optional, in a
+    single query. Volumes of ingredients with a density are summed as masses.
+    Ubiquitous ingredients are left out, as are recipes that don't exist.
+
+    Returns dicts of ingredient_id, name, amount, unit, is_optional and
+    recipe_ids, ordered by name.
+    """
+    # A recipe listed several times is scaled by the sum of its factors
+    servings_sum: Counter[int] = Counter()
+    scaled: Counter[int] = Counter()
+    unscaled: Counter[int] = Counter()
+    for recipe_id, servings in recipe_servings:
+        if servings is None:
+            unscaled[recipe_id] += 1
+        else:
+            servings_sum[recipe_id] += servings
+            scaled[recipe_id] += 1
+    recipe_ids = servings_sum.keys() | unscaled.keys()
+    if not recipe_ids:
+        return []
+
+    yields = NullIf(Cast("recipe__yields_number", FloatField()), Value(0.0))
+    factor = Case(
+        *(
+            When(
+                recipe_id=recipe_id,
+                # Recipes without a number of servings can't be scaled
+                then=Coalesce(
+                    Value(float(servings_sum[recipe_id])) / yields,
+                    Value(float(scaled[recipe_id])),
+                )
+                + Value(float(unscaled[recipe_id])),
+            )
+            for recipe_id in recipe_ids
+        ),
+        output_field=FloatField(),
+    )
+    as_mass = Q(canonical_unit=units.CANONICAL_UNITS[units.Dimension.VOLUME]) & Q(
+        base_ingredient__density__isnull=False
+    )
+    rows = (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .exclude(base_ingredient__is_ubiquitous=True)
+        .annotate(
+            unit_=Case(
+                When(as_mass, then=Value(units.CANONICAL_UNITS[units.Dimension.MASS])),
+                default=F("canonical_unit"),
+            ),
+            # Amounts without a unit are summed as they are, e.g. "2 eggs"
+            scaled=Coalesce("canonical_amount", "base_amount")
+            * factor
+            * Case(When(as_mass, then=F("base_ingredient__density")), default=1.0),
+        )
+        .values("base_ingredient_id", "unit_", "is_optional")
+        .annotate(
+            name=localised_name(language, "base_ingredient__"),
+            amount=Sum("scaled"),
+            recipe_ids=ArrayAgg("recipe_id", distinct=True, ordering="recipe_id"),
+        )
+        .order_by("name", "unit_")
+    )
+    return [
+        {
+            "ingredient_id": row["base_ingredient_id"],
+            "name": row["name"],
+            "amount": row["amount"],
+            "unit": row["unit_"],
+            "is_optional": row["is_optional"],
+            "recipe_ids": row["recipe_ids"],
+        }
+        for row in rows
+    ]
+
+
+def tag_facets(recipes: QuerySet[Recipe] | None = None) -> QuerySet[Tag]:
+    """
+    Every tag, with the number of the recipes (or of all recipes if None) that
+    have it as count, in one grouped query, ordered by kind and count
+    """
+    # Filtering the count, rather than the rows, keeps the tags none of the
+    # recipes have, with a count of 0
+    matching = None if recipes is None else Q(recipe_tags__recipe__in=recipes)
+    return Tag.objects.annotate(count=Count("recipe_tags", filter=matching)).order_by(
+        "kind", "-count", "name"
+    )
+
+
+def search_ingredients(
+    query: str, language: str | None = None, limit: int = 10
+) -> QuerySet[Ingredient]:
+    """
+    Returns the (up to limit) ingredients with a name in the language, or any
+    language, starting with the query or containing a word similar to it, ignoring
+    case and accents. Names starting with the query come first, then the most
+    similar.
+
+    Both are found using the trigram indexes of the normalised names, though
+    prefixes shorter than a trigram match too many names to narrow down much.
+    """
+    codes = [language] if language else Recipe.Languages.codes()
+    normalised_query = Normalised(Value(query))
+    names = {f"normalised_{code}": Normalised(f"name_{code}") for code in codes}
+
+    prefix = matches = Q()
+    similarities = []
+    for name in names:
+        prefix |= Q(**{f"{name}__startswith": normalised_query})
+        matches |= Q(**{f"{name}__trigram_word_similar": normalised_query})
+        similarities.append(TrigramWordSimilarity(normalised_query, name))
+
+    return (
+        Ingredient.objects.alias(**names)
+        .filter(prefix | matches)
+        .annotate(
+            is_prefix=ExpressionWrapper(prefix, output_field=BooleanField()),
+            similarity=Greatest(*similarities) if len(codes) > 1 else similarities[0],
+        )
+        # Missing names make is_prefix null rather than false
+        .order_by(F("is_prefix").desc(nulls_last=True), "-similarity", "id")[:limit]
+    )
+
+
+def resolve_ingredients(
+    names: Iterable[str], language: str, create: bool = True
+) -> dict[str, Ingredient]:
+    """
+    Returns the ingredients named by the names in the language, keyed by the
+    names, creating the ones that don't exist. Names are matched ignoring case
+    and extra whitespace, and blank names are left out. Names without an exact
+    match resolve to the best fuzzy match in any language, if it is close enough
+    (see ingredient_matching), rather than creating a near duplicate.
+
+    Unless create is set, ingredients are only looked up, and names matching
+    none are left out, e.g. for previews of recipes that may not be saved.
+
+    Takes one query when all ingredients exist, and three otherwise.
+    """
+    field = f"name_{language}"
+    # Ingredients are created with the first spelling of each normalised name
+    spellings: dict[str, str] = {}
+    normalised_names: dict[str, str] = {}
+    for name in names:
+        spelling = " ".join(name.split())
+        if spelling:
+            normalised_names[name] = spelling.lower()
+            spellings.setdefault(spelling.lower(), spelling)
+    if not spellings:
+        return {}
+
+    # Fetched along with the exact matches, as the matcher may be out of date
+    matcher = get_matcher()
+    fuzzy_matches: dict[str, int] = {}
+    for normalised, spelling in spellings.items():
+        matches = matcher.match(
+            spelling, limit=1, threshold=MATCH_THRESHOLD, language=language
+        )
+        if matches:
+            fuzzy_matches[normalised] = matches[0].ingredient_id
+
+    def fetch() -> dict[str, Ingredient]:
+        # Ordered so that the oldest ingredient wins if names differ only by case
+        ingredients = (
+            Ingredient.objects.annotate(normalised=Lower(field))
+            .filter(Q(normalised__in=spellings) | Q(id__in=fuzzy_matches.values()))
+            .order_by("-id")
+        )
+        exact = {ingredient.normalised: ingredient for ingredient in ingredients}
+        by_id = {ingredient.id: ingredient for ingredient in ingredients}
+        return {
+            normalised: ingredient
+            for normalised in spellings
+            if (
+                ingredient := exact.get(normalised)
+                or by_id.get(fuzzy_matches.get(normalised))
+            )
+        }
+
+    ingredients = fetch()
+    if create and (missing := spellings.keys() - ingredients.keys()):
+        # The ingredients may be created concurrently, so conflicts are ignored
+        # and the ingredients fetched again, as their ids aren't returned then
+        Ingredient.objects.bulk_create(
+            [Ingredient(**{field: spellings[name]}) for name in missing],
+            ignore_conflicts=True,
+        )
+        ingredients = fetch()
+        # bulk_create doesn't send the signals keeping the matcher and the change
+        # log up to date
+        for name in missing:
+            ingredient_saved(
+                ingredients[name].id, ingredients[name].get_names_by_language()
+            )
+            ChangeLogEntry.record(ChangeLogEntry.Kinds.INGREDIENT, ingredients[name].id)
+
+    return {
+        name: ingredients[normalised]
+        for name, normalised in normalised_names.items()
+        if normalised in ingredients
+    }
+
+
+def get_changes_since(token: int) -> dict:
+    """
+    Returns the recipes and ingredients created, updated or deleted after the
+    given change token, along with a new token to use for the next sync.
+
+    Entries become visible in the order of their ids (see _write_changes in
+    models.py), so no entry can later appear with an id at or below the token.
+    Changes are logged once their transaction has committed, so a sync racing
+    a write may miss it, and get it on the next sync.
+    """
+    entries = ChangeLogEntry.objects.filter(id__gt=token).values_list(
+        "id", "kind", "object_id", "deleted"
+    )
+
+    new_token = token
+    changed: dict[str, list[int]] = {k: [] for k in ChangeLogEntry.Kinds.values}
+    deleted: dict[str, list[int]] = {k: [] for k in ChangeLogEntry.Kinds.values}
+    for entry_id, kind, object_id, is_deleted in entries:
+        new_token = max(new_token, entry_id)
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    recipes = Recipe.objects.filter(
+        id__in=changed[ChangeLogEntry.Kinds.RECIPE]
+    ).prefetch_related("recipe_ingredients", "tags")
+    ingredients = Ingredient.objects.filter(
+        id__in=changed[ChangeLogEntry.Kinds.INGREDIENT]
+    )
+
+    return {
+        "token": new_token,
+        "recipes": recipes,
+        "ingredients": ingredients,
+        "deleted_recipes": deleted[ChangeLogEntry.Kinds.RECIPE],
+        "deleted_ingredients": deleted[ChangeLogEntry.Kinds.INGREDIENT],
+    }
+
+
+def search_recipes(
+    query: str,
+    query_embedding: list[float],
+    version: EmbeddingVersion,
+    filters: Q = Q(),
+) -> list[RecipeEmbedding]:
+    """
+    Returns the closest chunk of each of the (up to) 10 recipes closest to the
+    query embedding, which must have been embedded by the version's backend.
+    The chunks come with their recipe, their distance and the spans of their text
+    matching the query's words (see highlight_spans).
+
+    Candidates are found by their pooled embeddings, one per recipe, then ranked
+    by their closest chunk. The filters apply to the pooled embeddings (see
+    nearest_recipe_embeddings).
+    """
+    chunks = Q(
+        embeddings__version=version, embeddings__kind=RecipeEmbedding.Kinds.CHUNK
+    )
+    chunk_distance = CosineDistance(
+        version.typed_embedding("embeddings__embedding"), query_embedding
+    )
+
+    # Sanity checking. Scores every recipe, so only done when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        similarities = (
+            Recipe.objects.annotate(distance=Min(chunk_distance, filter=chunks))
+            .order_by("distance")
+            .values_list("title", "distance")
+        )
+        logger.debug(
+            "Search distances for %r:\n%s",
+            query,
+            "\n".join(f"{title}: {distance:.4f}" for title, distance in similarities),
+        )
+
+    candidates = nearest_recipe_embeddings(version, query_embedding, filters=filters)
+    distance = CosineDistance(version.typed_embedding(), query_embedding)
+    closest_chunks = (
+        RecipeEmbedding.objects.filter(
+            version=version,
+            kind=RecipeEmbedding.Kinds.CHUNK,
+            recipe_id__in=candidates.values("recipe_id"),
+        )
+        .order_by("recipe_id", distance)
+        .distinct("recipe_id")
+    )
+    results = list(
+        RecipeEmbedding.objects.filter(id__in=closest_chunks.values("id"))
+        .select_related("recipe")
+        .annotate(distance=distance)
+        .order_by("distance")[:10]
+    )
+    for result in results:
+        result.highlights = highlight_spans(result.text, query)
+    return results
+
+
+def highlight_spans(text: str, query: str) -> list[tuple[int, int]]:
+    """
+    Returns the (start, end) character spans of the words in the text starting
+    with one of the query's words, ignoring case. Words shorter than 3 characters
+    are ignored, as they mostly match noise.
+    """
+    terms = {term for term in re.findall(r"\w+", query.lower()) if len(term) >= 3}
+    if not terms:
+        return []
+    # Longest first, so the longest matching term wins
+    alternatives = "|".join(map(re.escape, sorted(terms, key=len, reverse=True)))
+    pattern = re.compile(rf"\b(?:{alternatives})\w*", re.IGNORECASE)
+    return [match.span() for match in pattern.finditer(text)]
+
+
+def nearest_recipe_embeddings(
+    version: EmbeddingVersion,
+    query_embedding: list[float],
+    precision: str = "",
+    filters: Q = Q(),
+) -> QuerySet[RecipeEmbedding]:
+    """
+    Returns the SEARCH_CANDIDATES pooled recipe embeddings of the version closest
+    to the query, closest first.
+
+    They are found using the version's vector index, which is only used by
+    limited queries ordered by its distance. Lower precision indexes only
+    approximate the distance, so their candidates are re-ranked by the exact one
+    in a second stage. The precision can be overridden for benchmarking.
+
+    The filters are applied to the pooled embeddings while scanning the index,
+    which keeps scanning until it has found enough matching rows (see the
+    hnsw.iterative_scan setting), so filtered searches don't lose results.
+    Filters on the recipe should use the copies of its fields on the pooled
+    embeddings, or subqueries on recipe_id, rather than joins.
+    """
+    precision = precision or version.precision
+    candidates = RecipeEmbedding.objects.filter(
+        filters, version=version, kind=RecipeEmbedding.Kinds.RECIPE
+    ).order_by(version.index_distance(query_embedding, precision))[
+        : settings.SEARCH_CANDIDATES
+    ]
+    if precision == EmbeddingVersion.Precisions.FULL:
+        return candidates
+
+    distance = CosineDistance(version.typed_embedding(), query_embedding)
+    return RecipeEmbedding.objects.filter(id__in=candidates.values("id")).order_by(
+        distance
+    )
+
+
+def refresh_similar_recipes(recipe: Recipe) -> None:
+    """
+    Finds the recipe's similar recipes after its embeddings changed, and adds it
+    to the similar recipes of its neighbours where it is among the closest.
+    Recipes it no longer resembles lose it until the next rebuild (see
+    rebuild_similar_recipes), as finding their replacements takes a search each.
+    """
+    SimilarRecipe.objects.filter(Q(recipe=recipe) | Q(similar=recipe)).delete()
+    embedding = (
+        RecipeEmbedding.objects.select_related("version")
+        .filter(
+            recipe=recipe,
+            version__state=EmbeddingVersion.States.ACTIVE,
+            kind=RecipeEmbedding.Kinds.RECIPE,
+        )
+        .first()
+    )
+    if embedding is None:
+        return
+    version, pooled = embedding.version, embedding.embedding
+
+    # Pooled embeddings are normalised, so their dot product is their similarity
+    candidates = nearest_recipe_embeddings(version, pooled).values_list(
+        "recipe_id", "embedding"
+    )
+    neighbours = {
+        recipe_id: float(np.dot(pooled, vector))
+        for recipe_id, vector in candidates
+        if recipe_id != recipe.id
+    }
+    neighbours = dict(list(neighbours.items())[:SIMILAR_RECIPES])
+
+    # Replace the least similar recipe of neighbours that already have enough
+    new = [
+        SimilarRecipe(recipe=recipe, similar_id=neighbour, similarity=similarity)
+        for neighbour, similarity in neighbours.items()
+    ]
+    replaced: list[int] = []
+    their_similar = SimilarRecipe.objects.filter(recipe_id__in=neighbours).order_by(
+        "recipe_id", "similarity"
+    )
+    for neighbour, group in groupby(their_similar, key=lambda s: s.recipe_id):
+        similar = list(group)
+        if len(similar) < SIMILAR_RECIPES:
+            continue
+        if similar[0].similarity < neighbours[neighbour]:
+            replaced.append(similar[0].id)
+        else:
+            del neighbours[neighbour]
+
+    new += [
+        SimilarRecipe(recipe_id=neighbour, similar=recipe, similarity=similarity)
+        for neighbour, similarity in neighbours.items()
+    ]
+    if replaced:
+        SimilarRecipe.objects.filter(id__in=replaced).delete()
+    # Concurrent refreshes of neighbouring recipes may have added some already
+    SimilarRecipe.objects.bulk_create(new, ignore_conflicts=True)
+
+
+def rebuild_similar_recipes(version: EmbeddingVersion, block_size: int = 512) -> int:
+    """
+    Recomputes the similar recipes of every recipe from the version's pooled
+    embeddings, comparing blocks of recipes with all recipes at once. Returns
+    the number of recipes compared.
+    """
+    rows = version.embeddings.filter(kind=RecipeEmbedding.Kinds.RECIPE).values_list(
+        "recipe_id", "embedding"
+    )
+    recipe_ids = np.array([recipe_id for recipe_id, _ in rows])
+    vectors = np.array([vector for _, vector in rows], dtype=np.float32).reshape(
+        len(recipe_ids), version.dimensions
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Recipes whose texts embed to nothing have zero vectors, similar to none
+    vectors /= np.where(norms == 0, 1, norms)
+    k = min(SIMILAR_RECIPES, len(recipe_ids) - 1)
+
+    similar_recipes: list[SimilarRecipe] = []
+    for start in range(0, len(recipe_ids) if k > 0 else 0, block_size):
+        similarities = vectors[start : start + block_size] @ vectors.T
+        # Recipes aren't similar to themselves
+        rows_in_block = np.arange(len(similarities))
+        similarities[rows_in_block, rows_in_block + start] = -np.inf
+
+        # The k most similar, unordered, which is all that's needed
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(similarities, top, axis=1)
+        for i, (neighbours, scores) in enumerate(zip(top, top_similarities)):
+            similar_recipes += [
+                SimilarRecipe(
+                    recipe_id=int(recipe_ids[start + i]),
+                    similar_id=int(recipe_ids[neighbour]),
+                    similarity=float(score),
+                )
+                for neighbour, score in zip(neighbours, scores)
+            ]
+
+    # Readers see the old similar recipes until the new ones are committed
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(similar_recipes, batch_size=5000)
+
+    return len(recipe_ids)
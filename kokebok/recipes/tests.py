@@ -1,16 +1,24 @@
 import base64
+import io
 import json
-from unittest.mock import patch
+import tempfile
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
 
 import numpy as np
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
 from django.db.models import Q
 from django.forms import ValidationError
 from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from ninja.responses import NinjaJSONEncoder
 
 from kokebok import settings
+from recipes import units
 from recipes.api import recipe_update
 from recipes.api_schemas import (
     FullRecipeDetailSchema,
@@ -18,11 +26,47 @@ from recipes.api_schemas import (
     FullRecipeUpdateSchema,
     IngredientDetailSchema,
     RecipeIngredientCreationSchema,
+    SearchFilterSchema,
+)
+from recipes.checks import embedding_backend_check, pgvector_version_check
+from recipes.embedding import embed_docs, embed_query
+from recipes.image_parsing import _to_scraped_recipe
+from recipes.ingredient_matching import (
+    IngredientMatcher,
+    Match,
+    normalise,
+    refresh_matcher,
+)
+from recipes.management.commands.reembed_recipes import Command as ReembedCommand
+from recipes.models import (
+    ChangeLogEntry,
+    EmbeddingVersion,
+    Ingredient,
+    IngredientNutrition,
+    MealPlan,
+    MealPlanEntry,
+    Recipe,
+    RecipeEmbedding,
+    RecipeIngredient,
+    RecipeNutrition,
+    SimilarRecipe,
+    Tag,
+)
+from recipes.scraping.base import ScrapedRecipe, ScrapedRecipeIngredient
+from recipes.services import (
+    SIMILAR_RECIPES,
+    build_recipe_embeddings,
+    get_changes_since,
+    get_recipe_embeddings,
+    highlight_spans,
+    rebuild_similar_recipes,
+    refresh_similar_recipes,
+    resolve_ingredients,
+    search_recipes,
 )
-from recipes.models import Ingredient, Recipe, RecipeIngredient
 
 
-def mock_embed(*op_texts: str | None) -> list[list[float]]:
+def mock_embed(*op_texts: str | None, **kwargs) -> list[list[float]]:
     return [np.random.rand((1024)) for ot in op_texts if ot is not None]
 
 
@@ -96,6 +140,8 @@ class APITests(TestCase):
         self.embed_patcher = patch("recipes.services.embed_docs", mock_embed)
         self.embed_patcher.start()
         self.addCleanup(self.embed_patcher.stop)
+        # Make sure cached responses don't leak between tests
+        cache.clear()
 
     def _as_api_response_data(self, schema):
         # Transforms the given ninja schema instance in the same
@@ -155,6 +201,7 @@ class APITests(TestCase):
             "hero_image": "",  # fix blank imagefield being turned into None
             "thumbnail": "",  # ditto
             "recipe_ingredients": list(rec.recipe_ingredients.all()),
+            "tags": [],
         }
         recipe_as_schema = FullRecipeDetailSchema(**rec.__dict__ | _recipe_override)
         # TODO: Figure out why ninja is being so difficult the images
@@ -163,6 +210,30 @@ class APITests(TestCase):
         expected_ingredient = self._as_api_response_data(recipe_as_schema)
         self.assertEqual(returned_recipe, expected_ingredient)
 
+    def test_recipe_detail_cache_invalidated(self):
+        rec = Recipe.objects.create(title="old title", id=123)
+        ingr = Ingredient.objects.create(name_en="i", id=321)
+
+        url = reverse("api-1.0.0:recipe_detail", args=[rec.id])
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)["title"], "old title")
+
+        # Repeat requests are served from the cache
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.content, response.content)
+
+        # Changes to the recipe or its recipe ingredients invalidate the cache
+        rec.title = "new title"
+        rec.save()
+        self.assertEqual(json.loads(self.client.get(url).content)["title"], "new title")
+
+        RecipeIngredient.objects.create(
+            name_in_recipe="ri", recipe=rec, base_ingredient=ingr
+        )
+        returned_recipe = json.loads(self.client.get(url).content)
+        self.assertEqual(len(returned_recipe["ingredients"]), 1)
+
     def test_recipe_add(self):
         # Create base ingredient for RecipeIngredient to refer to
         Ingredient.objects.create(id=123, name_en="ingredient")
@@ -407,8 +478,285 @@ class APITests(TestCase):
         expected_ingredient = self._as_api_response_data(ingredient_as_schema)
         self.assertEqual(json.loads(response.content), expected_ingredient)
 
+    def test_recipe_changes(self):
+        # Changes are logged once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            rec = Recipe.objects.create(title="r", id=111)
+            ingr = Ingredient.objects.create(name_en="iii", id=222)
+            RecipeIngredient.objects.create(
+                id=333, name_in_recipe="ri", recipe=rec, base_ingredient=ingr
+            )
+
+        # Initial sync returns everything
+        url = reverse("api-1.0.0:recipe_changes")
+        response = self.client.get(url, {"since": 0})
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        resp_data = json.loads(response.content)
+        self.assertEqual([r["id"] for r in resp_data["recipes"]], [rec.id])
+        self.assertEqual(len(resp_data["recipes"][0]["ingredients"]), 1)
+        self.assertEqual([i["id"] for i in resp_data["ingredients"]], [ingr.id])
+        token = resp_data["token"]
+
+        # Nothing has changed since the last sync
+        resp_data = json.loads(self.client.get(url, {"since": token}).content)
+        self.assertEqual(resp_data["recipes"], [])
+        self.assertEqual(resp_data["ingredients"], [])
+        self.assertEqual(resp_data["token"], token)
+
+        # Deleting the recipe leaves a tombstone, while the ingredient is updated
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("api-1.0.0:recipe_delete", args=[rec.id]))
+            self.client.put(
+                reverse("api-1.0.0:ingredient_update", args=[ingr.id]),
+                {"name_en": "new name"},
+                content_type="application/json",
+            )
+        resp_data = json.loads(self.client.get(url, {"since": token}).content)
+        self.assertEqual(resp_data["recipes"], [])
+        self.assertEqual(resp_data["deleted_recipes"], [rec.id])
+        self.assertEqual(resp_data["ingredients"][0]["name_en"], "new name")
+        self.assertEqual(resp_data["deleted_ingredients"], [])
+        self.assertGreater(resp_data["token"], token)
+
+    def test_change_log_batched(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rec = Recipe.objects.create(title="r")
+            rec.title = "new title"
+            rec.save()
+            other_id = Recipe.objects.create(title="other").id
+            Recipe.objects.filter(id=other_id).delete()
+            self.assertFalse(ChangeLogEntry.objects.exists())
+        entries = ChangeLogEntry.objects.filter(kind="recipe")
+        self.assertEqual(
+            {(e.object_id, e.deleted) for e in entries},
+            {(rec.id, False), (other_id, True)},
+        )
+
+        # Changes recorded many times in a transaction are written by one
+        # upsert, in a savepoint holding the change log's lock
+        old_id = entries.get(object_id=rec.id).id
+        with self.assertNumQueries(4), self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                ChangeLogEntry.record(ChangeLogEntry.Kinds.RECIPE, rec.id)
+        # The entry is given a larger id
+        self.assertGreater(entries.get(object_id=rec.id).id, old_id)
+
+    def test_scrape_recipe(self):
+        with open(
+            "recipes/scraping/scraper_tests/html/tineno.tikka_masala.html",
+            encoding="utf-8",
+        ) as f:
+            html = f.read()
+
+        url = reverse("api-1.0.0:scrape_recipe")
+        recipe_url = "https://www.tine.no/oppskrifter/tikka-masala"
+        with patch(
+            "recipes.scraping.main._afetch_html", AsyncMock(return_value=html)
+        ) as fetch:
+            response = self.client.get(url, {"url": recipe_url})
+        fetch.assert_awaited_once_with(recipe_url)
+        self.assertEqual(response.status_code, 200)
+        resp_data = json.loads(response.content)
+        self.assertEqual(resp_data["origin_url"], recipe_url)
+        self.assertTrue(resp_data["title"])
+        self.assertTrue(resp_data["ingredients"])
+
+        # Recipes can't be scraped twice
+        Recipe.objects.create(title="r", origin_url=recipe_url)
+        response = self.client.get(url, {"url": recipe_url})
+        self.assertEqual(response.status_code, 403)
+
+
+class QueryCountTests(TestCase):
+    """
+    Guards against N+1 queries. The read endpoints are run against a catalogue
+    with several recipes and ingredients, so their query counts would grow
+    with it if any related object were loaded lazily.
+    The write endpoints necessarily validate and write each recipe ingredient,
+    so they are run with one and with several ingredients instead, and may
+    grow by no more than that. They include the queries run on commit.
+    """
+
+    n_recipes = 5
+    n_ingredients = 5
+
+    def setUp(self):
+        self.embed_patcher = patch("recipes.services.embed_docs", mock_embed)
+        self.embed_patcher.start()
+        self.addCleanup(self.embed_patcher.stop)
+        self.query_patcher = patch(
+            "recipes.api.aembed_query", AsyncMock(return_value=np.random.rand(1024))
+        )
+        self.query_patcher.start()
+        self.addCleanup(self.query_patcher.stop)
+        cache.clear()
+        # Logs the changes, for the changes endpoint
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients = [
+                Ingredient.objects.create(name_en=f"ingredient {i}")
+                for i in range(self.n_ingredients)
+            ]
+            self.recipes = [
+                Recipe.objects.create(title=f"recipe {i}")
+                for i in range(self.n_recipes)
+            ]
+            version = EmbeddingVersion.get_active()
+            for recipe in self.recipes:
+                for ingredient in self.ingredients:
+                    RecipeIngredient.objects.create(
+                        recipe=recipe,
+                        base_ingredient=ingredient,
+                        name_in_recipe=f"some {ingredient.name_en}",
+                    )
+                for kind in RecipeEmbedding.Kinds.values:
+                    RecipeEmbedding.objects.create(
+                        recipe=recipe,
+                        version=version,
+                        kind=kind,
+                        embedding=np.random.rand(1024),
+                    )
+
+    def _count_queries(self, method: str, url: str, data=None, **kwargs) -> int:
+        """The number of queries of the request, and of its commit"""
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(url, data, **kwargs)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        return len(queries)
+
+    def _recipe_form(self, title: str, n_ingredients: int = 1) -> dict[str, str]:
+        recipe_data = {
+            "title": title,
+            "ingredients": [
+                {"name_in_recipe": f"ingr {i}", "base_ingredient_id": ingredient.id}
+                for i, ingredient in enumerate(self.ingredients[:n_ingredients])
+            ],
+        }
+        return {"hero_image": "", "full_recipe": json.dumps(recipe_data)}
+
+    def test_recipe_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("api-1.0.0:recipe_list"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_detail(self):
+        url = reverse("api-1.0.0:recipe_detail", args=[self.recipes[0].id])
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Cached
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_recipe_changes(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("api-1.0.0:recipe_changes"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingredient_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("api-1.0.0:ingredient_list"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("api-1.0.0:search"), {"query": "q"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.n_recipes)
+        self.assertEqual(
+            set(response.json()[0]),
+            {"id", "title", "thumbnail", "score", "field", "snippet", "highlights"},
+        )
+
+    def test_recipe_similar(self):
+        rebuild_similar_recipes(EmbeddingVersion.get_active())
+        url = reverse("api-1.0.0:recipe_similar", args=[self.recipes[0].id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), self.n_recipes - 1)
+
+    def test_recipe_add(self):
+        url = reverse("api-1.0.0:recipe_add")
+        one = self._count_queries("post", url, self._recipe_form("one"))
+        many = self._count_queries(
+            "post", url, self._recipe_form("many", self.n_ingredients)
+        )
+        # Checking that the ingredient exists, and the insert
+        self.assertLessEqual(many - one, 2 * (self.n_ingredients - 1))
+
+    def test_recipe_update(self):
+        one = self._count_queries(
+            "post",
+            reverse("api-1.0.0:recipe_update", args=[self.recipes[0].id]),
+            self._recipe_form("one"),
+        )
+        many = self._count_queries(
+            "post",
+            reverse("api-1.0.0:recipe_update", args=[self.recipes[1].id]),
+            self._recipe_form("many", self.n_ingredients),
+        )
+        # Checking that the recipe and the ingredient exist, and the insert
+        self.assertLessEqual(many - one, 3 * (self.n_ingredients - 1))
+
+    def test_recipe_delete(self):
+        RecipeIngredient.objects.filter(recipe=self.recipes[0]).exclude(
+            base_ingredient=self.ingredients[0]
+        ).delete()
+        one = self._count_queries(
+            "delete", reverse("api-1.0.0:recipe_delete", args=[self.recipes[0].id])
+        )
+        many = self._count_queries(
+            "delete", reverse("api-1.0.0:recipe_delete", args=[self.recipes[1].id])
+        )
+        self.assertEqual(many, one)
+
+    def test_ingredient_search(self):
+        url = reverse("api-1.0.0:ingredient_search")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"q": "ingredient"})
+        self.assertEqual(len(response.json()), self.n_ingredients)
+
+    def test_ingredient_add(self):
+        url = reverse("api-1.0.0:ingredient_add")
+        with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {"name_en": "new"}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def _ingredient_in(self, n_recipes: int) -> Ingredient:
+        ingredient = Ingredient.objects.create(name_en=f"in {n_recipes} recipes")
+        for recipe in self.recipes[:n_recipes]:
+            RecipeIngredient.objects.create(
+                recipe=recipe, base_ingredient=ingredient, name_in_recipe="some"
+            )
+        return ingredient
+
+    def test_ingredient_update(self):
+        def update(ingredient: Ingredient) -> int:
+            url = reverse("api-1.0.0:ingredient_update", args=[ingredient.id])
+            data = json.dumps({"name_en": f"updated {ingredient.id}"})
+            return self._count_queries(
+                "put", url, data, content_type="application/json"
+            )
+
+        # The recipes using the ingredient are refreshed in bulk
+        one, many = self._ingredient_in(1), self._ingredient_in(self.n_recipes)
+        self.assertEqual(update(many), update(one))
+
+    def test_ingredient_delete(self):
+        # Ingredients used by recipes can't be deleted
+        ingredient = Ingredient.objects.create(name_en="unused")
+        url = reverse("api-1.0.0:ingredient_delete", args=[ingredient.id])
+        with self.assertNumQueries(9), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 200)
+
 
 class IngredientTests(TestCase):
+    def setUp(self):
+        refresh_matcher()
+
     def test_get_names(self):
         """
         Encodes current assumptions about ingredient names'
@@ -427,3 +775,1198 @@ class IngredientTests(TestCase):
         with self.assertRaises(ValidationError):
             ingredient = Ingredient()
             ingredient.clean()
+
+    def test_ingredient_search(self):
+        creme = Ingredient.objects.create(name_en="Crème fraîche", name_no="Rømme")
+        cream = Ingredient.objects.create(name_en="Cream", name_no="Fløte")
+        sour = Ingredient.objects.create(name_en="Sour cream")
+        Ingredient.objects.create(name_en="Tomato")
+
+        def search(**params):
+            response = self.client.get(reverse("api-1.0.0:ingredient_search"), params)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            return [ingredient["id"] for ingredient in response.json()]
+
+        # Case and accents are ignored
+        self.assertEqual(search(q="CREME"), [creme.id])
+        self.assertEqual(search(q="romme", lang="no"), [creme.id])
+        self.assertEqual(search(q="romme", lang="en"), [])
+        # Prefixes rank above similar words
+        self.assertEqual(search(q="crea"), [cream.id, sour.id, creme.id])
+        self.assertEqual(search(q="crea", limit=1), [cream.id])
+
+        url = reverse("api-1.0.0:ingredient_search")
+        self.assertEqual(
+            self.client.get(url, {"q": "a", "lang": "xx"}).status_code, 400
+        )
+
+    def test_resolve_ingredients(self):
+        cream = Ingredient.objects.create(name_en="Cream")
+        names = ["cream", " Sour  cream", "sour cream", "", "CREAM"]
+        with self.assertNumQueries(3):
+            resolved = resolve_ingredients(names, "en")
+        self.assertEqual(
+            set(resolved), {"cream", " Sour  cream", "sour cream", "CREAM"}
+        )
+        self.assertEqual(resolved["CREAM"], cream)
+        self.assertEqual(resolved["sour cream"].name_en, "Sour cream")
+        self.assertEqual(resolved["sour cream"], resolved[" Sour  cream"])
+
+        # Existing ingredients are found in a single query
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_ingredients(names, "en"), resolved)
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_resolved_ingredients_logged(self):
+        # Clients syncing the recipes using created ingredients must get them
+        token = get_changes_since(0)["token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            cream = resolve_ingredients(["cream"], "en")["cream"]
+        changes = get_changes_since(token)
+        self.assertEqual(list(changes["ingredients"]), [cream])
+        self.assertGreater(changes["token"], token)
+
+    def test_resolve_ingredients_fuzzy(self):
+        blueberry = Ingredient.objects.create(name_en="blueberry", name_no="blåbær")
+        chicken = Ingredient.objects.create(name_en="chicken")
+        refresh_matcher()
+
+        resolved = resolve_ingredients(["Fresh blueberries", "chicken stock"], "no")
+        self.assertEqual(resolved["Fresh blueberries"], blueberry)
+        # Too different to be the same ingredient
+        self.assertNotEqual(resolved["chicken stock"], chicken)
+        self.assertEqual(resolved["chicken stock"].name_no, "chicken stock")
+
+    def test_scraped_ingredients_resolved(self):
+        egg = Ingredient.objects.create(name_no="egg")
+        scraped = ScrapedRecipe(
+            title="Omelett",
+            language="no",
+            origin_url="https://example.com/omelett",
+            ingredients={
+                "": [
+                    ScrapedRecipeIngredient(
+                        name_in_recipe="3 egg", base_ingredient_str="Egg"
+                    ),
+                    ScrapedRecipeIngredient(name_in_recipe="salt"),
+                ]
+            },
+        )
+        with (
+            patch("recipes.api.scrape", return_value=scraped),
+            patch("recipes.services.embed_docs", mock_embed),
+        ):
+            response = self.client.get(
+                reverse("api-1.0.0:scrape_recipe_bad"), {"url": scraped.origin_url}
+            )
+        self.assertEqual(response.status_code, 200, msg=response.content)
+
+        recipe = Recipe.objects.get(origin_url=scraped.origin_url)
+        self.assertEqual(
+            [ri.base_ingredient.name_no for ri in recipe.recipe_ingredients.all()],
+            [egg.name_no, "salt"],
+        )
+
+    def test_ingredient_match(self):
+        eggs = Ingredient.objects.create(name_en="egg", name_no="egg")
+        tomato = Ingredient.objects.create(name_en="tomato", name_no="tomat")
+        Ingredient.objects.create(name_en="tomato paste")
+        refresh_matcher()
+
+        url = reverse("api-1.0.0:ingredient_match")
+        response = self.client.get(url, {"q": "Tomatoes", "limit": 1})
+        self.assertEqual(response.status_code, 200)
+        [match] = response.json()
+        self.assertEqual(match["ingredient"]["id"], tomato.id)
+        self.assertEqual((match["matched_name"], match["score"]), ("tomato", 1.0))
+
+        # The matcher is updated once changes are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            eggs.name_en = "hen's egg"
+            eggs.save()
+        response = self.client.get(url, {"q": "large hen eggs"})
+        self.assertEqual(response.json()[0]["matched_name"], "hen s egg")
+        with self.captureOnCommitCallbacks(execute=True):
+            tomato.delete()
+        response = self.client.get(url, {"q": "tomater"})
+        self.assertNotIn(tomato.id, [m["ingredient"]["id"] for m in response.json()])
+
+    def test_ingredient_matcher(self):
+        matcher = IngredientMatcher(
+            [
+                (1, {"en": "Blueberry", "no": None}),
+                (2, {"en": "berry"}),
+                (3, {"fr": "Crème fraîche"}),
+            ]
+        )
+        matches = matcher.match("fresh blueberries")
+        self.assertEqual([m.ingredient_id for m in matches], [1, 2])
+        self.assertGreater(matches[0].score, matches[1].score)
+        self.assertEqual(matcher.match("CREME FRAICHE"), [Match(3, "creme fraiche", 1)])
+
+        matcher.add(1, {"en": "bilberry"})
+        matches = matcher.match("blueberry")
+        self.assertEqual([m.name for m in matches], ["berry", "bilberry"])
+        matcher.remove(2)
+        self.assertEqual([m.ingredient_id for m in matcher.match("blueberry")], [1])
+        self.assertEqual(len(matcher), 2)
+
+    def test_plurals_by_language(self):
+        # English names that end like Norwegian plurals are left alone
+        for word in ["butter", "pepper", "ginger", "cucumber"]:
+            self.assertEqual(normalise(word, "en"), word)
+        self.assertEqual(normalise("tomater", "no"), "tomat")
+        self.assertEqual(normalise("tomatene", "no"), "tomat")
+
+        matcher = IngredientMatcher(
+            [
+                (1, {"en": "Butter", "no": "smør"}),
+                (2, {"en": "Peppers", "no": "paprika"}),
+                (3, {"en": "tomato", "no": "tomater"}),
+            ]
+        )
+        self.assertEqual(
+            matcher.match("butter", language="en"), [Match(1, "butter", 1)]
+        )
+        self.assertEqual(
+            matcher.match("pepper", language="en"), [Match(2, "pepper", 1)]
+        )
+        # Without a language, the text is read as any of them
+        self.assertEqual(matcher.match("butter"), [Match(1, "butter", 1)])
+        self.assertEqual(matcher.match("tomatene"), [Match(3, "tomat", 1)])
+        matches = matcher.match("tomatene", language="en")
+        self.assertTrue(all(match.score < 1 for match in matches))
+
+    def test_image_ingredient_names(self):
+        recipe_json = json.dumps(
+            {
+                "title": "Pancakes",
+                "ingredients": [
+                    {
+                        "name_in_recipe": "fresh blueberries",
+                        "base_ingredient_name": "blueberry",
+                    }
+                ],
+            }
+        )
+        recipe = _to_scraped_recipe(recipe_json)
+        self.assertEqual(recipe.ingredients[""][0].base_ingredient_str, "blueberry")
+
+    # The api module reads the settings module itself
+    @patch("kokebok.settings.OCR_ENABLED", True)
+    def test_recipe_from_image_creates_nothing(self):
+        egg = Ingredient.objects.create(name_en="egg")
+        recipe = _to_scraped_recipe(
+            json.dumps(
+                {
+                    "title": "Omelette",
+                    "language": "en",
+                    "ingredients": [
+                        {"name_in_recipe": "2 eggs", "base_ingredient_name": "Egg"},
+                        {"name_in_recipe": "a smudge", "base_ingredient_name": "xq"},
+                    ],
+                }
+            )
+        )
+        url = reverse("api-1.0.0:recipe_from_image")
+        img = SimpleUploadedFile("recipe.jpg", b"not really an image")
+        with patch("recipes.api.aparse_img", AsyncMock(return_value=recipe)):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {"img": img})
+        self.assertEqual(response.status_code, 200, msg=response.content)
+
+        # Only existing ingredients are linked, as the recipe isn't saved
+        ingredients = response.json()["ingredients"][""]
+        self.assertEqual([i["base_ingredient_id"] for i in ingredients], [egg.id, None])
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+
+class UnitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_convert(self):
+        self.assertAlmostEqual(units.convert(1, "lb", "kg"), 0.45359237)
+        self.assertAlmostEqual(units.convert(3, "tsp", "tbsp"), 1)
+        self.assertAlmostEqual(units.convert(2, "dl", "g", density=0.5), 100)
+        self.assertAlmostEqual(units.convert(100, "g", "dl", density=0.5), 2)
+        self.assertEqual(units.convert(2, "", ""), 2)
+        with self.assertRaises(units.IncompatibleUnits):
+            units.convert(1, "dl", "g")  # Needs a density
+        with self.assertRaises(units.IncompatibleUnits):
+            units.convert(1, "count", "g", density=1)
+
+    def test_scale(self):
+        amounts, new_units = units.scale(
+            [1, 3, None, 500, 2, 1, 2], ["tbsp", "tsp", "tsp", "g", "", "cup", "cm"], 2
+        )
+        self.assertEqual(amounts, [2, 6, None, 1000, 4, 2, 4])
+        self.assertEqual(new_units, ["tbsp", "tsp", "tsp", "g", "", "cup", "cm"])
+
+        amounts, new_units = units.scale(
+            [1, 3, None, 500, 2, 1, 2],
+            ["tbsp", "tsp", "tsp", "g", "", "cup", "count"],
+            2,
+            units.System.METRIC,
+        )
+        self.assertEqual(new_units, ["tbsp", "tbsp", "tsp", "kg", "", "dl", "count"])
+        np.testing.assert_allclose(
+            amounts[:2] + amounts[3:], [2, 2, 1, 4, 4.73, 4], 1e-3
+        )
+        self.assertIsNone(amounts[2])
+
+        amounts, new_units = units.scale(
+            [1, 100, 2], ["tbsp", "ml", "kg"], 1, units.System.US
+        )
+        self.assertEqual(new_units, ["tbsp", "cup", "lb"])
+        np.testing.assert_allclose(amounts, [1, 0.4227, 4.4092], 1e-3)
+
+    def test_canonical_amounts(self):
+        recipe = Recipe.objects.create(title="r")
+        ingredient = Ingredient.objects.create(name_en="i")
+        ri = RecipeIngredient.objects.create(
+            recipe=recipe,
+            base_ingredient=ingredient,
+            name_in_recipe="ri",
+            base_amount=2,
+            unit="dl",
+        )
+        self.assertEqual((ri.canonical_amount, ri.canonical_unit), (200, "ml"))
+
+        RecipeIngredient.objects.filter(id=ri.id).update(base_amount=1.5, unit="kg")
+        ri.refresh_from_db()
+        self.assertEqual((ri.canonical_amount, ri.canonical_unit), (1500, "g"))
+
+        RecipeIngredient.objects.filter(id=ri.id).update(unit="")
+        ri.refresh_from_db()
+        self.assertEqual((ri.canonical_amount, ri.canonical_unit), (None, ""))
+
+    def test_recipe_detail_scaled(self):
+        recipe = Recipe.objects.create(title="r", yields_number=4)
+        ingredient = Ingredient.objects.create(name_en="i")
+        for amount, unit in [(2, "dl"), (3, "count"), (None, "")]:
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                base_ingredient=ingredient,
+                name_in_recipe="ri",
+                base_amount=amount,
+                unit=unit,
+            )
+        url = reverse("api-1.0.0:recipe_detail", args=[recipe.id])
+
+        data = json.loads(self.client.get(url, {"servings": 2}).content)
+        self.assertEqual(data["yields_number"], 2)
+        ingredients = [
+            (ri["base_amount"], ri["unit"], ri["canonical_amount"])
+            for ri in data["ingredients"]
+        ]
+        self.assertEqual(
+            ingredients, [(1, "dl", 100), (1.5, "count", 1.5), (None, "", None)]
+        )
+
+        data = json.loads(self.client.get(url, {"servings": 8, "system": "us"}).content)
+        self.assertEqual(data["ingredients"][0]["unit"], "cup")
+        self.assertAlmostEqual(data["ingredients"][0]["base_amount"], 1.6907, 3)
+
+        # The unscaled recipe is served as before
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual(data["ingredients"][0]["base_amount"], 2)
+
+        recipe.yields_number = None
+        recipe.save()
+        response = self.client.get(url, {"servings": 2})
+        self.assertEqual(response.status_code, 400)
+        # Converting doesn't need the number of servings
+        response = self.client.get(url, {"system": "metric"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ShoppingListTests(TestCase):
+    def setUp(self):
+        self.url = reverse("api-1.0.0:shopping_list")
+        self.flour = Ingredient.objects.create(name_en="flour", density=0.5)
+        self.milk = Ingredient.objects.create(name_en="milk", name_no="melk")
+        self.egg = Ingredient.objects.create(name_en="egg")
+        self.salt = Ingredient.objects.create(name_en="salt", is_ubiquitous=True)
+        self.pancakes = Recipe.objects.create(title="pancakes", yields_number=4)
+        self.bread = Recipe.objects.create(title="bread", yields_number=None)
+        for recipe, ingredient, amount, unit, is_optional in [
+            (self.pancakes, self.flour, 2, "dl", False),
+            (self.pancakes, self.milk, 5, "dl", False),
+            (self.pancakes, self.egg, 3, "", False),
+            (self.pancakes, self.salt, 1, "tsp", False),
+            (self.pancakes, self.milk, 1, "tbsp", True),
+            (self.bread, self.flour, 500, "g", False),
+            (self.bread, self.milk, 1, "count", False),
+            (self.bread, self.egg, None, "", False),
+        ]:
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                base_ingredient=ingredient,
+                name_in_recipe=ingredient.name_en,
+                base_amount=amount,
+                unit=unit,
+                is_optional=is_optional,
+            )
+
+    def _post(self, data: dict) -> dict:
+        response = self.client.post(self.url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def _items(self, rows: list[dict]) -> list[tuple]:
+        return [
+            (row["name"], row["amount"] and round(row["amount"], 3), row["unit"])
+            for row in rows
+        ]
+
+    def test_shopping_list(self):
+        with self.assertNumQueries(1):
+            data = self._post(
+                {
+                    "recipes": [
+                        {"id": self.pancakes.id, "servings": 2},
+                        {"id": self.pancakes.id, "servings": 6},
+                        {"id": self.bread.id},
+                    ]
+                }
+            )
+        # The pancakes are scaled by 2/4 + 6/4 = 2. Flour with a density is
+        # summed by mass, and salt is ubiquitous
+        self.assertEqual(
+            self._items(data["items"]),
+            [
+                ("egg", 6, ""),
+                ("flour", 700, "g"),
+                ("milk", 1, "count"),
+                ("milk", 1000, "ml"),
+            ],
+        )
+        self.assertEqual(
+            data["items"][1]["recipe_ids"], sorted([self.pancakes.id, self.bread.id])
+        )
+        self.assertEqual(self._items(data["optional"]), [("milk", 29.574, "ml")])
+
+        # The bread can't be scaled, as it has no number of servings
+        data = self._post({"recipes": [{"id": self.bread.id, "servings": 8}]})
+        self.assertEqual(self._items(data["items"])[1], ("flour", 500, "g"))
+
+    def test_shopping_list_language_and_system(self):
+        data = self._post(
+            {
+                "recipes": [{"id": self.pancakes.id}],
+                "language": "no",
+                "system": "metric",
+            }
+        )
+        self.assertEqual(
+            self._items(data["items"]),
+            [("egg", 3, ""), ("flour", 100, "g"), ("melk", 5, "dl")],
+        )
+
+        response = self.client.post(
+            self.url,
+            {"recipes": [], "language": "xx"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._post({"recipes": []}), {"items": [], "optional": []})
+
+
+class MealPlanTests(TestCase):
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name_en="flour", name_no="mel")
+        self.milk = Ingredient.objects.create(name_en="milk")
+        self.pancakes = Recipe.objects.create(title="pancakes", yields_number=4)
+        self.bread = Recipe.objects.create(title="bread", yields_number=1)
+        self.flour_ri = RecipeIngredient.objects.create(
+            recipe=self.pancakes,
+            base_ingredient=self.flour,
+            name_in_recipe="flour",
+            base_amount=2,
+            unit="dl",
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.bread,
+            base_ingredient=self.flour,
+            name_in_recipe="flour",
+            base_amount=1,
+            unit="l",
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.bread,
+            base_ingredient=self.milk,
+            name_in_recipe="milk",
+            base_amount=1,
+            unit="cup",
+            is_optional=True,
+        )
+
+    def _detail(self, plan_id: int, **params) -> dict:
+        url = reverse("api-1.0.0:meal_plan_detail", args=[plan_id])
+        return json.loads(self.client.get(url, params).content)
+
+    def _items(self, data: dict, key: str = "items") -> list[tuple]:
+        return [(row["name"], row["amount"], row["unit"]) for row in data[key]]
+
+    def test_meal_plan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("api-1.0.0:meal_plan_add"),
+                {
+                    "name": "week 1",
+                    "entries": [
+                        {"date": "2024-01-01", "recipe_id": self.pancakes.id},
+                        {"date": "2024-01-02", "recipe_id": self.bread.id},
+                    ],
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        plan_id = json.loads(response.content)["id"]
+
+        # The sums are read, not computed
+        with self.assertNumQueries(3):
+            data = self._detail(plan_id, lang="no")
+        self.assertEqual(
+            [entry["date"] for entry in data["entries"]], ["2024-01-01", "2024-01-02"]
+        )
+        self.assertEqual(self._items(data), [("mel", 1200, "ml")])
+        self.assertEqual(
+            data["items"][0]["recipe_ids"], [self.pancakes.id, self.bread.id]
+        )
+        self.assertEqual(self._items(data, "optional"), [("milk", 236.5882365, "ml")])
+
+        # Adding and removing entries
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("api-1.0.0:meal_plan_entry_add", args=[plan_id]),
+                {"date": "2024-01-03", "recipe_id": self.pancakes.id, "servings": 8},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self._items(self._detail(plan_id)), [("flour", 1600, "ml")])
+
+        entry_id = data["entries"][1]["id"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse("api-1.0.0:meal_plan_entry_delete", args=[plan_id, entry_id])
+            )
+        data = self._detail(plan_id)
+        self.assertEqual(self._items(data), [("flour", 600, "ml")])
+        self.assertEqual(data["optional"], [])
+
+        response = self.client.post(
+            reverse("api-1.0.0:meal_plan_entry_add", args=[plan_id]),
+            {"date": "2024-01-03", "recipe_id": 0},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_rollup_follows_recipes(self):
+        plan = MealPlan.objects.create(name="plan")
+        with self.captureOnCommitCallbacks(execute=True):
+            MealPlanEntry.objects.create(
+                plan=plan, date="2024-01-01", recipe=self.pancakes
+            )
+        self.assertEqual(self._items(self._detail(plan.id)), [("flour", 200, "ml")])
+
+        # Changes to the recipe's ingredients
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour_ri.base_amount = 3
+            self.flour_ri.save()
+        self.assertEqual(self._items(self._detail(plan.id)), [("flour", 300, "ml")])
+
+        # To the recipe's number of servings, which the entry is scaled from
+        with self.captureOnCommitCallbacks(execute=True):
+            plan.entries.update(servings=4)
+            self.pancakes.yields_number = 2
+            self.pancakes.save()
+        self.assertEqual(self._items(self._detail(plan.id)), [("flour", 600, "ml")])
+
+        # And to its ingredients
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.density = 0.5
+            self.flour.save()
+        self.assertEqual(self._items(self._detail(plan.id)), [("flour", 300, "g")])
+
+        # Plans without the recipe are left alone
+        other_plan = MealPlan.objects.create(name="other")
+        with self.captureOnCommitCallbacks(execute=True):
+            MealPlanEntry.objects.create(
+                plan=other_plan, date="2024-01-01", recipe=self.bread
+            )
+        with patch("recipes.meal_plans.refresh_meal_plans") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.flour_ri.save()
+        refresh.assert_called_once_with({plan.id})
+
+        # Deleting the recipe deletes its entries
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pancakes.delete()
+        self.assertEqual(self._detail(plan.id)["items"], [])
+
+        call_command("refresh_meal_plans", stdout=io.StringIO())
+        self.assertEqual(
+            self._items(self._detail(other_plan.id)), [("flour", 500, "g")]
+        )
+
+    def test_rolled_back_changes_dropped(self):
+        plan = MealPlan.objects.create(name="plan")
+        other_plan = MealPlan.objects.create(name="other")
+        with patch("recipes.meal_plans.refresh_meal_plans") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ValueError), transaction.atomic():
+                    MealPlanEntry.objects.create(
+                        plan=plan, date="2024-01-01", recipe=self.pancakes
+                    )
+                    raise ValueError
+                MealPlanEntry.objects.create(
+                    plan=other_plan, date="2024-01-01", recipe=self.bread
+                )
+        refresh.assert_called_once_with({other_plan.id})
+
+
+class NutritionTests(TestCase):
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name_en="flour", density=0.5)
+        self.milk = Ingredient.objects.create(name_en="milk", name_no="melk")
+        self.egg = Ingredient.objects.create(name_en="egg")
+        self.recipe = Recipe.objects.create(title="pancakes", yields_number=4)
+        self.flour_ri = RecipeIngredient.objects.create(
+            recipe=self.recipe,
+            base_ingredient=self.flour,
+            name_in_recipe="flour",
+            base_amount=4,
+            unit="dl",
+        )
+        for ingredient, amount, unit in [(self.milk, 500, "g"), (self.egg, 3, "")]:
+            RecipeIngredient.objects.create(
+                recipe=self.recipe,
+                base_ingredient=ingredient,
+                name_in_recipe=ingredient.name_en,
+                base_amount=amount,
+                unit=unit,
+            )
+
+    def _import(self, csv: str, *args) -> str:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(csv)
+        self.addCleanup(Path(f.name).unlink)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_nutrition", f.name, *args, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_rolled_back_changes_dropped(self):
+        other = Recipe.objects.create(title="omelette")
+        with patch("recipes.nutrition.refresh_recipe_nutrition") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ValueError), transaction.atomic():
+                    self.flour_ri.save()
+                    raise ValueError
+                RecipeIngredient.objects.create(
+                    recipe=other, base_ingredient=self.egg, name_in_recipe="egg"
+                )
+        refresh.assert_called_once_with({other.id})
+
+    def test_import_and_totals(self):
+        refresh_matcher()
+        errors = self._import(
+            "name,energy_kcal,protein,fat\n"
+            "Flour,350,10,\n"
+            'MELK,"64,5",3.4,3.5\n'
+            "unobtainium,1,1,1\n",
+            "--language",
+            "no",
+        )
+        self.assertIn("unobtainium", errors)
+        # Flour has no Norwegian name, so it's matched fuzzily
+        self.assertEqual(self.flour.nutrition.energy_kcal, 350)
+        self.assertEqual(self.milk.nutrition.energy_kcal, 64.5)
+
+        url = reverse("api-1.0.0:recipe_nutrition", args=[self.recipe.id])
+        with self.assertNumQueries(1):
+            data = json.loads(self.client.get(url).content)
+        # 4 dl of flour weigh 200 g. The eggs are counted, so have no mass
+        self.assertEqual(data["mass"], 700)
+        self.assertAlmostEqual(data["coverage"], 2 / 3)
+        self.assertAlmostEqual(data["energy_kcal"], 700 + 322.5)
+        self.assertAlmostEqual(data["energy_kcal_per_serving"], (700 + 322.5) / 4)
+        self.assertAlmostEqual(data["protein"], 20 + 17)
+        # Fat is only known for milk
+        self.assertAlmostEqual(data["fat"], 17.5)
+        self.assertIsNone(data["sugar"])
+
+        self._import("ingredient_id,energy_kcal\n%d,300\n" % self.flour.id)
+        data = json.loads(self.client.get(url).content)
+        self.assertAlmostEqual(data["energy_kcal"], 600 + 322.5)
+
+    def test_updated_on_write(self):
+        IngredientNutrition.objects.create(ingredient=self.flour, energy_kcal=350)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour_ri.base_amount = 2
+            self.flour_ri.save()
+        nutrition = RecipeNutrition.objects.get(recipe=self.recipe)
+        self.assertAlmostEqual(nutrition.energy_kcal, 350)
+        self.assertAlmostEqual(nutrition.energy_kcal_per_serving, 350 / 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.density = 1
+            self.flour.save()
+            self.recipe.yields_number = 2
+            self.recipe.save()
+        nutrition.refresh_from_db()
+        self.assertAlmostEqual(nutrition.energy_kcal, 700)
+        self.assertAlmostEqual(nutrition.energy_kcal_per_serving, 350)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.nutrition.delete()
+        nutrition.refresh_from_db()
+        self.assertIsNone(nutrition.energy_kcal)
+        self.assertEqual(nutrition.coverage, 0)
+
+        # Without ingredients, there's no nutrition
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.recipe_ingredients.all().delete()
+        self.assertFalse(RecipeNutrition.objects.exists())
+        call_command("refresh_nutrition", stdout=io.StringIO())
+        self.assertFalse(RecipeNutrition.objects.exists())
+
+
+class TagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ingredient = Ingredient.objects.create(name_en="sugar")
+        self.vegetarian = Tag.objects.create(
+            slug="vegetarian", name="Vegetarian", kind=Tag.Kinds.DIET
+        )
+        self.dessert = Tag.objects.create(
+            slug="dessert", name="Dessert", kind=Tag.Kinds.COURSE
+        )
+        self.italian = Tag.objects.create(
+            slug="italian", name="Italian", kind=Tag.Kinds.CUISINE
+        )
+        self.recipes = {}
+        for title, total_time, tags in [
+            ("cake", 30, [self.vegetarian, self.dessert]),
+            ("pudding", 60, [self.dessert]),
+            ("salad", 10, [self.vegetarian]),
+        ]:
+            recipe = Recipe.objects.create(title=title, total_time=total_time)
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.create(
+                recipe=recipe, base_ingredient=ingredient, name_in_recipe="sugar"
+            )
+            self.recipes[title] = recipe
+
+    def _list(self, **filters) -> list[str]:
+        url = reverse("api-1.0.0:recipe_list")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, filters)
+        return sorted(recipe["title"] for recipe in response.json())
+
+    def _facets(self, **filters) -> dict[str, int]:
+        url = reverse("api-1.0.0:recipe_facets")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, filters)
+        return {tag["slug"]: tag["count"] for tag in response.json()}
+
+    def test_filter(self):
+        self.assertEqual(self._list(), ["cake", "pudding", "salad"])
+        self.assertEqual(self._list(tag=["vegetarian", "dessert"]), ["cake"])
+        self.assertEqual(self._list(max_time=30), ["cake", "salad"])
+        self.assertEqual(self._list(tag="dessert", max_time=45), ["cake"])
+        self.assertEqual(self._list(tag="italian"), [])
+        self.assertEqual(self._list(tag="unknown"), [])
+
+    def test_facets(self):
+        self.assertEqual(self._facets(), {"vegetarian": 2, "dessert": 2, "italian": 0})
+        self.assertEqual(
+            self._facets(tag="vegetarian"),
+            {"vegetarian": 2, "dessert": 1, "italian": 0},
+        )
+        self.assertEqual(
+            self._facets(max_time=20), {"vegetarian": 1, "dessert": 0, "italian": 0}
+        )
+        # Ordered by kind, then count
+        response = self.client.get(reverse("api-1.0.0:recipe_facets"))
+        self.assertEqual(
+            [tag["kind"] for tag in response.json()], ["course", "cuisine", "diet"]
+        )
+
+    def test_recipe_tags(self):
+        cake = self.recipes["cake"]
+        url = reverse("api-1.0.0:recipe_detail", args=[cake.id])
+        # Saving registers a flush of the changes pending since the setup
+        with self.captureOnCommitCallbacks(execute=True):
+            cake.save()
+        self.assertCountEqual(
+            self.client.get(url).json()["tags"], [self.vegetarian.id, self.dessert.id]
+        )
+
+        # Tag changes, from either side, invalidate the cached recipe and are
+        # synced with it
+        token = self.client.get(reverse("api-1.0.0:recipe_changes")).json()["token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            cake.tags.remove(self.dessert)
+            self.assertEqual(self.client.get(url).json()["tags"], [self.vegetarian.id])
+            self.italian.recipes.add(cake)
+            self.assertCountEqual(
+                self.client.get(url).json()["tags"],
+                [self.vegetarian.id, self.italian.id],
+            )
+            self.vegetarian.recipes.clear()
+            self.assertEqual(self.client.get(url).json()["tags"], [self.italian.id])
+        changes = self.client.get(
+            reverse("api-1.0.0:recipe_changes"), {"since": token}
+        ).json()
+        self.assertCountEqual(
+            [recipe["title"] for recipe in changes["recipes"]], ["cake", "salad"]
+        )
+
+        self.italian.delete()
+        self.assertEqual(self.client.get(url).json()["tags"], [])
+
+    @patch("recipes.services.embed_docs", mock_embed)
+    def test_set_tags(self):
+        recipe_data = {
+            "title": "tart",
+            "ingredients": [],
+            "tags": [self.dessert.id, self.italian.id],
+        }
+        response = self.client.post(
+            reverse("api-1.0.0:recipe_add"),
+            {"hero_image": "", "full_recipe": json.dumps(recipe_data)},
+        )
+        tart = Recipe.objects.get(id=response.json()["id"])
+        self.assertCountEqual(tart.tags.all(), [self.dessert, self.italian])
+
+        url = reverse("api-1.0.0:recipe_update", args=[tart.id])
+        # Tags left out are kept
+        del recipe_data["tags"]
+        data = {"hero_image": "", "full_recipe": json.dumps(recipe_data)}
+        self.assertEqual(self.client.post(url, data).status_code, 200)
+        self.assertCountEqual(tart.tags.all(), [self.dessert, self.italian])
+
+        recipe_data["tags"] = [self.vegetarian.id, 0]
+        data = {"hero_image": "", "full_recipe": json.dumps(recipe_data)}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("tags", response.json())
+        self.assertCountEqual(tart.tags.all(), [self.dessert, self.italian])
+
+        recipe_data["tags"] = [self.vegetarian.id]
+        data = {"hero_image": "", "full_recipe": json.dumps(recipe_data)}
+        response = self.client.post(url, data)
+        self.assertEqual(response.json()["tags"], [self.vegetarian.id])
+
+
+@override_settings(EMBEDDING_BACKEND="hashing", EMBEDDING_DIMENSIONS=None)
+class EmbeddingTests(TestCase):
+    def test_hashing_backend(self):
+        docs = embed_docs("Chicken tikka masala", None, "", "Blueberry pancakes")
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(len(docs[0]), 1024)
+        self.assertAlmostEqual(float(np.linalg.norm(docs[0])), 1, places=5)
+
+        # Deterministic, and similar texts have similar embeddings
+        query = embed_query("chicken masala")
+        self.assertEqual(query, embed_query("chicken masala"))
+        self.assertGreater(np.dot(query, docs[0]), np.dot(query, docs[1]))
+
+    def test_long_texts_are_chunked(self):
+        text = "\n".join(f"Step {i}: stir the pot for a while" for i in range(60))
+        self.assertEqual(len(embed_docs(text)), 60)
+
+    @override_settings(EMBEDDING_BACKEND="unknown")
+    def test_backend_check(self):
+        errors = embedding_backend_check(None)
+        self.assertEqual([e.id for e in errors], ["recipes.E001"])
+
+    def test_pgvector_version_check(self):
+        self.assertEqual(pgvector_version_check(None, databases=["default"]), [])
+        with patch("recipes.checks.MIN_PGVECTOR_VERSION", (99, 0, 0)):
+            errors = pgvector_version_check(None, databases=["default"])
+        self.assertEqual([e.id for e in errors], ["recipes.E003"])
+
+
+@override_settings(EMBEDDING_BACKEND="hashing", EMBEDDING_DIMENSIONS=None)
+class EmbeddingVersionTests(TestCase):
+    def setUp(self):
+        self.old = EmbeddingVersion.get_active()
+        self.new = EmbeddingVersion.objects.create(
+            backend="hashing", model="hashing", dimensions=8
+        )
+        self.recipe = Recipe.objects.create(title="Chicken tikka masala")
+
+    def _call(self, *args):
+        out = io.StringIO()
+        call_command("embedding_versions", *args, stdout=out)
+        return out.getvalue()
+
+    def _embed(self, recipe: Recipe, version: EmbeddingVersion, vector):
+        """Embeds the recipe as a single chunk, which its pooled embedding equals"""
+        for kind in RecipeEmbedding.Kinds.values:
+            RecipeEmbedding.objects.create(
+                recipe=recipe, version=version, kind=kind, embedding=vector
+            )
+
+    def test_live_versions_are_embedded(self):
+        with patch("recipes.services.embed_docs", mock_embed):
+            embeddings = get_recipe_embeddings(self.recipe)
+        self.assertEqual({e.version for e in embeddings}, {self.old, self.new})
+
+        self.new.state = EmbeddingVersion.States.RETIRED
+        self.new.save()
+        with patch("recipes.services.embed_docs", mock_embed):
+            embeddings = get_recipe_embeddings(self.recipe)
+        self.assertEqual({e.version for e in embeddings}, {self.old})
+
+    def test_pooled_embedding(self):
+        chunks = [("title", "Pancakes")] + [("instructions", "Stir")] * 3
+        vectors = [np.array([1.0, 0.0])] + [np.array([0.0, 1.0])] * 3
+        embeddings = build_recipe_embeddings(self.recipe, self.new, chunks, vectors)
+
+        self.assertEqual(
+            [e.kind for e in embeddings],
+            [RecipeEmbedding.Kinds.CHUNK] * 4 + [RecipeEmbedding.Kinds.RECIPE],
+        )
+        # The title outweighs the instructions, however many chunks they have
+        pooled = embeddings[-1].embedding
+        self.assertAlmostEqual(float(np.linalg.norm(pooled)), 1)
+        self.assertGreater(pooled[0], pooled[1])
+
+    def test_search_uses_version(self):
+        other = Recipe.objects.create(title="Blueberry pancakes")
+        self._embed(self.recipe, self.old, np.ones(1024))
+        self._embed(other, self.new, np.ones(8))
+        self.new.create_index()
+
+        # Vectors of other versions are never compared with the query
+        results = search_recipes("q", np.ones(8), self.new)
+        self.assertEqual([r.recipe for r in results], [other])
+        results = search_recipes("q", np.ones(1024), self.old)
+        self.assertEqual([r.recipe for r in results], [self.recipe])
+
+    def test_search_snippets(self):
+        chunks = [
+            ("title", "Chicken tikka masala"),
+            ("instructions", "Marinate the chicken overnight"),
+            ("instructions", "Simmer the sauce"),
+        ]
+        vectors = [np.eye(8)[i] for i in range(3)]
+        for embedding in build_recipe_embeddings(
+            self.recipe, self.new, chunks, vectors
+        ):
+            embedding.save()
+
+        query = np.eye(8)[1] + np.eye(8)[0] * 0.1
+        [result] = search_recipes("marinated CHICKEN", query, self.new)
+        self.assertEqual(result.recipe, self.recipe)
+        self.assertEqual(result.field, "instructions")
+        self.assertEqual(result.text, "Marinate the chicken overnight")
+        self.assertEqual(result.highlights, [(13, 20)])
+        self.assertAlmostEqual(1 - result.distance, 1 / np.sqrt(1.01), places=5)
+
+    @override_settings(SEARCH_CANDIDATES=3)
+    def test_filtered_search(self):
+        rice = Ingredient.objects.create(name_en="rice")
+        # More unfiltered recipes closer to the query than there are candidates
+        for i in range(5):
+            recipe = Recipe.objects.create(title=f"close {i}", language="en")
+            self._embed(recipe, self.new, np.ones(8) + np.eye(8)[i] * 0.1)
+        far = Recipe.objects.create(title="far", language="no", total_time=20)
+        RecipeIngredient.objects.create(recipe=far, base_ingredient=rice)
+        self._embed(far, self.new, np.ones(8) - np.eye(8)[0])
+        RecipeEmbedding.objects.filter(recipe=far).update(language="no", total_time=20)
+        self.new.create_index()
+
+        def search(**filters):
+            q = SearchFilterSchema(**filters).get_filter_expression()
+            return [r.recipe for r in search_recipes("q", np.ones(8), self.new, q)]
+
+        self.assertEqual(len(search()), 3)
+        self.assertEqual(search(language="no"), [far])
+        self.assertEqual(search(max_total_time=30), [far])
+        self.assertEqual(search(max_total_time=10), [])
+        self.assertEqual(search(ingredients=[rice.id]), [far])
+        self.assertEqual(search(ingredients=[rice.id], language="en"), [])
+
+    def test_filter_fields_copied(self):
+        self.new.delete()
+        with patch("recipes.services.embed_docs", mock_embed):
+            get_recipe_embeddings(self.recipe)[-1].save()
+        url = reverse("api-1.0.0:recipe_update", args=[self.recipe.id])
+        form = {
+            "hero_image": "",
+            "full_recipe": json.dumps(
+                {
+                    "title": self.recipe.title,
+                    "language": "it",
+                    "total_time": 45,
+                    "ingredients": [],
+                }
+            ),
+        }
+        self.assertEqual(self.client.post(url, data=form).status_code, 200)
+
+        pooled = RecipeEmbedding.objects.get(
+            recipe=self.recipe, kind=RecipeEmbedding.Kinds.RECIPE
+        )
+        self.assertEqual((pooled.language, pooled.total_time), ("it", 45))
+
+    def test_search_without_active_version(self):
+        EmbeddingVersion.objects.filter(id=self.old.id).update(
+            state=EmbeddingVersion.States.RETIRED
+        )
+        response = self.client.get(reverse("api-1.0.0:search"), {"query": "q"})
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_similar_recipes", stdout=io.StringIO())
+
+    def test_highlight_spans(self):
+        text = "Stir-fried noodles, or a noodle soup"
+        self.assertEqual(
+            highlight_spans(text, "Noodle stir fry"), [(0, 4), (11, 18), (25, 31)]
+        )
+        # Short words are ignored
+        self.assertEqual(highlight_spans(text, "a or"), [])
+
+    def test_activate(self):
+        with self.assertRaises(CommandError):
+            self._call("--activate", str(self.new.id))
+
+        RecipeEmbedding.objects.create(
+            recipe=self.recipe, version=self.new, embedding=np.ones(8)
+        )
+        self._call("--activate", str(self.new.id))
+        self.assertEqual(EmbeddingVersion.get_active(), self.new)
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.state, EmbeddingVersion.States.RETIRED)
+
+        output = self._call()
+        self.assertIn(f"{self.new.id}\tactive\thashing/hashing", output)
+        self.assertIn("1/1 recipes", output)
+
+    def test_prune(self):
+        RecipeEmbedding.objects.create(
+            recipe=self.recipe, version=self.new, embedding=np.ones(8)
+        )
+        self._call("--retire", str(self.new.id))
+        self._call("--prune", "--batch-size=1")
+        self.assertFalse(EmbeddingVersion.objects.filter(id=self.new.id).exists())
+        self.assertFalse(RecipeEmbedding.objects.exists())
+        # Active versions can only be retired by activating another
+        with self.assertRaises(CommandError):
+            self._call("--retire", str(self.old.id))
+
+    def test_quantized_search(self):
+        recipes = [Recipe.objects.create(title=f"recipe {i}") for i in range(4)]
+        vectors = np.eye(8)[:4] * 2 - 0.5
+        for recipe, vector in zip(recipes, vectors):
+            self._embed(recipe, self.new, vector)
+
+        self.new.create_index()
+        for precision in ["half", "binary", "full"]:
+            self._call("--reindex", str(self.new.id), f"--precision={precision}")
+            self.new.refresh_from_db()
+            results = search_recipes("q", vectors[2] + 0.1, self.new)
+            self.assertEqual(results[0].recipe, recipes[2], msg=precision)
+        self.assertIn("full precision", self._call())
+
+    def test_benchmark(self):
+        for i in range(12):
+            recipe = Recipe.objects.create(title=f"recipe {i}")
+            self._embed(recipe, self.new, np.random.rand(8) - 0.5)
+
+        out = io.StringIO()
+        call_command(
+            "benchmark_search", f"--version-id={self.new.id}", "--queries=5", stdout=out
+        )
+        output = out.getvalue()
+        for precision in EmbeddingVersion.Precisions.values:
+            self.assertIn(f"\n{precision} ", output)
+        # Indexes built for the benchmark are dropped
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, RecipeEmbedding._meta.db_table
+            )
+        self.assertNotIn(self.new.vector_index().name, indexes)
+
+
+class SimilarRecipeTests(TestCase):
+    def setUp(self):
+        self.version = EmbeddingVersion.get_active()
+        # Recipes along a quarter circle, so each is most similar to its neighbours
+        self.recipes = []
+        for i, angle in enumerate(np.linspace(0, np.pi / 2, SIMILAR_RECIPES + 3)):
+            recipe = Recipe.objects.create(title=f"recipe {i}")
+            self._embed(recipe, angle)
+            self.recipes.append(recipe)
+
+    def _embed(self, recipe: Recipe, angle: float):
+        vector = np.zeros(1024)
+        vector[:2] = np.cos(angle), np.sin(angle)
+        RecipeEmbedding.objects.filter(recipe=recipe).delete()
+        RecipeEmbedding.objects.create(
+            recipe=recipe,
+            version=self.version,
+            kind=RecipeEmbedding.Kinds.RECIPE,
+            embedding=vector,
+        )
+
+    def _similar(self, recipe: Recipe) -> list[int]:
+        url = reverse("api-1.0.0:recipe_similar", args=[recipe.id])
+        return [r["id"] for r in self.client.get(url).json()]
+
+    def test_rebuild(self):
+        rebuild_similar_recipes(self.version, block_size=4)
+        first, *others = self.recipes
+        self.assertEqual(self._similar(first), [r.id for r in others[:SIMILAR_RECIPES]])
+        self.assertEqual(
+            SimilarRecipe.objects.count(), len(self.recipes) * SIMILAR_RECIPES
+        )
+
+    def test_rebuild_zero_vector(self):
+        empty = Recipe.objects.create(title="empty")
+        self._embed(empty, 0)
+        RecipeEmbedding.objects.filter(recipe=empty).update(embedding=np.zeros(1024))
+        with np.errstate(all="raise"):
+            rebuild_similar_recipes(self.version)
+        similarities = SimilarRecipe.objects.values_list("similarity", flat=True)
+        self.assertFalse(any(np.isnan(similarities)))
+        self.assertEqual(
+            set(
+                SimilarRecipe.objects.filter(recipe=empty).values_list(
+                    "similarity", flat=True
+                )
+            ),
+            {0},
+        )
+
+    def test_refresh(self):
+        rebuild_similar_recipes(self.version)
+        first, last = self.recipes[0], self.recipes[-1]
+
+        # Moving the last recipe next to the first makes them similar
+        self._embed(last, 0.01)
+        refresh_similar_recipes(last)
+        self.assertEqual(self._similar(last)[0], first.id)
+        self.assertEqual(self._similar(first)[0], last.id)
+        self.assertEqual(len(self._similar(first)), SIMILAR_RECIPES)
+
+        # Recipes without embeddings have no similar recipes
+        RecipeEmbedding.objects.filter(recipe=last).delete()
+        refresh_similar_recipes(last)
+        self.assertEqual(self._similar(last), [])
+        self.assertNotIn(last.id, self._similar(first))
+
+
+@override_settings(EMBEDDING_BACKEND="hashing", EMBEDDING_DIMENSIONS=None)
+class ReembedCommandTests(TestCase):
+    def setUp(self):
+        self.recipes = [
+            Recipe.objects.create(title=f"recipe {i}", preamble="Tasty")
+            for i in range(5)
+        ]
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.checkpoint = Path(tmp_dir.name) / "checkpoint.json"
+
+    def _reembed(self, *args):
+        out = io.StringIO()
+        call_command(
+            "reembed_recipes",
+            "--batch-size=2",
+            f"--checkpoint={self.checkpoint}",
+            *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_reembed(self):
+        active = EmbeddingVersion.get_active()
+        kept = RecipeEmbedding.objects.create(
+            recipe=self.recipes[0], version=active, embedding=np.ones(1024)
+        )
+
+        self._reembed()
+        version = EmbeddingVersion.objects.get(state=EmbeddingVersion.States.FILLING)
+        self.assertEqual((version.backend, version.dimensions), ("hashing", 1024))
+        # Title and preamble of each recipe, and their pooled embedding
+        self.assertEqual(version.embeddings.count(), 15)
+        self.assertFalse(self.checkpoint.exists())
+        # Search keeps using the active version until the new one is activated
+        self.assertTrue(RecipeEmbedding.objects.filter(id=kept.id).exists())
+        self.assertEqual(EmbeddingVersion.get_active(), active)
+
+        self._reembed("--activate")
+        self.assertEqual(EmbeddingVersion.get_active().embeddings.count(), 15)
+
+    def test_recipes_changed_while_embedding(self):
+        embed = ReembedCommand._embed
+        first, second = self.recipes[:2]
+        fresh: list[RecipeEmbedding] = []
+
+        def embed_and_change(command, recipes, version, *args):
+            embeddings = embed(command, recipes, version, *args)
+            if first in recipes:
+                # Saving new texts embeds them with the filling version too
+                Recipe.objects.filter(id=first.id).update(title="changed")
+                fresh.append(
+                    RecipeEmbedding.objects.create(
+                        recipe=first, version=version, embedding=np.ones(1024)
+                    )
+                )
+                Recipe.objects.filter(id=second.id).update(language="no")
+            return embeddings
+
+        with patch.object(ReembedCommand, "_embed", embed_and_change):
+            self._reembed()
+        version = EmbeddingVersion.objects.get(state=EmbeddingVersion.States.FILLING)
+        # The embeddings of the new texts are kept
+        self.assertEqual(list(version.embeddings.filter(recipe=first)), fresh)
+        self.assertEqual(version.embeddings.count(), 1 + 4 * 3)
+        pooled = version.embeddings.get(
+            recipe=second, kind=RecipeEmbedding.Kinds.RECIPE
+        )
+        self.assertEqual(pooled.language, "no")
+
+    def test_resume(self):
+        version = EmbeddingVersion.objects.create(
+            backend="hashing", model="hashing", dimensions=1024
+        )
+        self.checkpoint.write_text(
+            json.dumps({"version_id": version.id, "last_id": self.recipes[2].id})
+        )
+        output = self._reembed()
+        self.assertIn(f"after recipe {self.recipes[2].id}", output)
+        self.assertEqual(
+            set(version.embeddings.values_list("recipe_id", flat=True)),
+            {self.recipes[3].id, self.recipes[4].id},
+        )
+
+        # Versions no longer being filled can't be resumed
+        version.activate()
+        self.checkpoint.write_text(json.dumps({"version_id": version.id, "last_id": 1}))
+        with self.assertRaises(CommandError):
+            self._reembed()
+        self._reembed("--restart")
+        self.assertEqual(
+            EmbeddingVersion.objects.filter(
+                state=EmbeddingVersion.States.FILLING
+            ).count(),
+            1,
+        )
+
+    def test_dry_run(self):
+        output = self._reembed("--dry-run")
+        self.assertIn("5 recipes, 10 texts", output)
+        self.assertIn("Estimated tokens", output)
+        self.assertFalse(RecipeEmbedding.objects.exists())
+        self.assertFalse(
+            EmbeddingVersion.objects.filter(
+                state=EmbeddingVersion.States.FILLING
+            ).exists()
+        )
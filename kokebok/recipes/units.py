@@ -0,0 +1,154 @@
+"""
+Conversion between the units of RecipeIngredient.Units, and scaling of recipes.
+
+Every unit belongs to a dimension (mass, volume, count, ...) and converts to the
+dimension's canonical unit by a factor. Volumes convert to masses, and back,
+using an ingredient's density. Spoons and cups are the US customary ones.
+"""
+
+import numpy as np
+from django.db import models
+
+
+class Dimension(models.TextChoices):
+    MASS = "mass"
+    VOLUME = "volume"
+    COUNT = "count"
+    SLICE = "slice"
+    LENGTH = "length"
+
+
+class System(models.TextChoices):
+    """Systems of units amounts can be converted to"""
+
+    METRIC = "metric"
+    US = "us"
+
+
+# Canonical unit of each dimension. Keyed by str, which Choices members are, and
+# compare and hash like
+CANONICAL_UNITS: dict[str, str] = {
+    Dimension.MASS: "g",
+    Dimension.VOLUME: "ml",
+    Dimension.COUNT: "count",
+    Dimension.SLICE: "slice",
+    Dimension.LENGTH: "cm",
+}
+
+# The dimension of each unit, and how many of the canonical unit it is
+UNITS: dict[str, tuple[str, float]] = {
+    "g": (Dimension.MASS, 1),
+    "kg": (Dimension.MASS, 1000),
+    "oz": (Dimension.MASS, 28.349523125),
+    "lb": (Dimension.MASS, 453.59237),
+    "ml": (Dimension.VOLUME, 1),
+    "cl": (Dimension.VOLUME, 10),
+    "dl": (Dimension.VOLUME, 100),
+    "l": (Dimension.VOLUME, 1000),
+    "tsp": (Dimension.VOLUME, 4.92892159375),
+    "tbsp": (Dimension.VOLUME, 14.78676478125),
+    "cup": (Dimension.VOLUME, 236.5882365),
+    "count": (Dimension.COUNT, 1),
+    "slice": (Dimension.SLICE, 1),
+    "cm": (Dimension.LENGTH, 1),
+    "inch": (Dimension.LENGTH, 2.54),
+}
+
+# The units amounts are shown in, in each system, smallest first, with the
+# least amount of each unit shown. Amounts are shown in the largest unit they
+# make at least the least amount of, e.g. "1/4 cup" rather than "4 tbsp"
+SYSTEM_UNITS: dict[str, dict[str, list[tuple[str, float]]]] = {
+    System.METRIC: {
+        Dimension.MASS: [("g", 0), ("kg", 1)],
+        Dimension.VOLUME: [("tsp", 0), ("tbsp", 1), ("dl", 0.5), ("l", 1)],
+        Dimension.LENGTH: [("cm", 0)],
+    },
+    System.US: {
+        Dimension.MASS: [("oz", 0), ("lb", 1)],
+        Dimension.VOLUME: [("tsp", 0), ("tbsp", 1), ("cup", 0.25)],
+        Dimension.LENGTH: [("inch", 0)],
+    },
+}
+
+# Allows for rounding errors, so that 3 tsp make a tbsp
+_TOLERANCE = 1e-6
+
+
+class IncompatibleUnits(ValueError):
+    pass
+
+
+def canonical_unit(unit: str) -> str:
+    """The canonical unit of the unit's dimension, or "" if the unit has none"""
+    return CANONICAL_UNITS[UNITS[unit][0]] if unit in UNITS else ""
+
+
+def convert(
+    amount: float, from_unit: str, to_unit: str, density: float | None = None
+) -> float:
+    """
+    Converts the amount between the units. Converting between mass and volume
+    requires the ingredient's density, in g/ml
+    """
+    if from_unit == to_unit:
+        return amount
+    if from_unit not in UNITS or to_unit not in UNITS:
+        raise IncompatibleUnits(f"Can't convert {from_unit!r} to {to_unit!r}")
+
+    from_dimension, from_factor = UNITS[from_unit]
+    to_dimension, to_factor = UNITS[to_unit]
+    canonical = amount * from_factor
+    if from_dimension != to_dimension:
+        dimensions = {from_dimension, to_dimension}
+        if dimensions != {Dimension.MASS, Dimension.VOLUME} or not density:
+            raise IncompatibleUnits(f"Can't convert {from_unit!r} to {to_unit!r}")
+        if to_dimension == Dimension.MASS:
+            canonical *= density
+        else:
+            canonical /= density
+    return canonical / to_factor
+
+
+def scale(
+    amounts: list[float | None],
+    units: list[str],
+    factor: float,
+    system: System | None = None,
+) -> tuple[list[float | None], list[str]]:
+    """
+    Scales the amounts of a recipe's ingredients by the factor, and converts
+    them to the system's units if given. Missing amounts stay missing, and
+    amounts in units outside the system (e.g. counts) keep their unit.
+
+    All ingredients are scaled and converted at once, as arrays.
+    """
+    scaled = np.array(amounts, dtype=float) * factor
+    units = list(units)
+    if system is None or not units:
+        return _amounts_list(scaled), units
+
+    unit_array = np.array(units, dtype=object)
+    to_canonical = np.array([UNITS.get(unit, (None, 1.0))[1] for unit in units])
+    canonical = scaled * to_canonical
+    dimensions = np.array([UNITS.get(unit, (None,))[0] for unit in units])
+    for dimension, ladder in SYSTEM_UNITS[system].items():
+        rows = (dimensions == dimension) & ~np.isnan(scaled)
+        if not rows.any():
+            continue
+        system_units, least = zip(*ladder)
+        # Amounts in each of the system's units, as columns
+        sizes = np.array([UNITS[unit][1] for unit in system_units])
+        in_units = canonical[rows, None] / sizes
+        # The largest unit making at least its least amount. The smallest unit's
+        # least amount is 0, so there always is one
+        fits = in_units >= np.array(least) - _TOLERANCE
+        chosen = len(system_units) - 1 - fits[:, ::-1].argmax(axis=1)
+        scaled[rows] = in_units[np.arange(len(chosen)), chosen]
+        unit_array[rows] = np.array(system_units, dtype=object)[chosen]
+
+    return _amounts_list(scaled), list(unit_array)
+
+
+def _amounts_list(amounts: np.ndarray) -> list[float | None]:
+    # Round away floating point noise, e.g. 0.30000000000000004
+    return [None if np.isnan(a) else float(a) for a in amounts.round(6)]
@@ -0,0 +1,50 @@
+"""
+Database expressions for the quantized vector types of pgvector (0.7+), which
+pgvector's Django integration doesn't support yet. They are only used in index
+and search expressions, embeddings are always stored at full precision.
+"""
+
+from django.db.models import Field, Func, Value
+from django.db.models.functions import Cast
+from pgvector.django import DistanceBase, VectorField
+from pgvector.utils import to_db
+
+
+class HalfVectorField(VectorField):
+    """Half-precision vector, taking 2 bytes per dimension"""
+
+    def db_type(self, connection):
+        if self.dimensions is None:
+            return "halfvec"
+        return f"halfvec({self.dimensions})"
+
+
+class BitField(Field):
+    """Bit string, as produced by binary quantization"""
+
+    def __init__(self, *args, length: int, **kwargs):
+        self.length = length
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        return f"bit({self.length})"
+
+
+class BinaryQuantize(Func):
+    """Quantizes a vector to a bit per dimension: set if positive"""
+
+    function = "binary_quantize"
+
+
+class HammingDistance(DistanceBase):
+    """The number of bits that differ between two bit strings"""
+
+    function = ""
+    arg_joiner = " <~> "
+
+
+def quantized_query(vector: list[float], dimensions: int) -> Cast:
+    """A query vector binary quantized the same way as indexed embeddings"""
+    # The literal must be typed, as binary_quantize accepts several vector types
+    query = Cast(Value(to_db(vector)), VectorField())
+    return Cast(BinaryQuantize(query), BitField(length=dimensions))